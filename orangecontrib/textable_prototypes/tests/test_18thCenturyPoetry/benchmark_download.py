@@ -0,0 +1,89 @@
+"""
+Benchmark of the poem download of the 18th Century Poetry (ECP) widget
+against a local fixture server that serves XML-TEI files after a fixed
+latency (same fixture as the Theatre Classique download benchmark, for
+comparison: ECP still downloads the selected poems one at a time).
+Run with:
+
+    python benchmark_download.py [number of poems] [latency in ms]
+"""
+
+import contextlib
+import importlib
+import io
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from AnyQt.QtWidgets import QApplication
+
+ecp = importlib.import_module(
+    "orangecontrib.textable_prototypes.widgets.18thCenturyPoetry"
+)
+
+POEM = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n<TEI><teiHeader><title>%s'
+    '</title></teiHeader><text><body>%s</body></text></TEI>'
+)
+VERSE = "<l>Line %i of the poem, in heroic couplets.</l>\n"
+
+
+def make_server(latency):
+    """Start a local server that answers every request with an XML-TEI file
+    after latency seconds and return it"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            body = (POEM % (
+                self.path, "".join(VERSE % idx for idx in range(2500))
+            )).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(numPoems=300, latency=50):
+    app = QApplication.instance() or QApplication(sys.argv)
+    server = make_server(latency / 1000)
+
+    widget = ecp.ECP()
+    widget.document_base_url = "http://127.0.0.1:%i" % server.server_port
+    widget.catalogue = widget.buildCatalogue([
+        {
+            "title": "Poem %04i" % idx,
+            "author": "Author %i" % (idx % 50),
+            "genre": "ode",
+            "url": "/works/o%04i-w0010.shtml" % idx,
+        }
+        for idx in range(numPoems)
+    ])
+    widget.updateFilterValueList()
+    widget.selectedTitles = list(range(numPoems))
+
+    # sendData prints every url it downloads...
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        widget.sendData()
+    duration = time.perf_counter() - start
+    assert len(widget.segmentation) == numPoems
+    print("%i poems, serial download: %.2f s" % (numPoems, duration))
+
+    widget.onDeleteWidget()
+    widget.deleteLater()
+    server.shutdown()
+    app.processEvents()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,142 @@
+"""
+A collection of tests for the 18th Century Poetry (ECP) widget.
+
+The streaming genre list parser is checked against the original LTTL
+Segmenter pipeline, which is kept here as a correctness oracle.
+Refreshing the title list is run with stand-ins for the website.
+"""
+
+import importlib
+import re
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from AnyQt.QtTest import QTest
+from Orange.widgets.tests.base import GuiTest
+
+import LTTL.Segmenter as Segmenter
+from LTTL.Input import Input
+
+ecp = importlib.import_module(
+    "orangecontrib.textable_prototypes.widgets.18thCenturyPoetry"
+)
+
+ASSETS_DIR = Path(__file__).parent / 'assets'
+
+
+def segmenter_title_records(base_html):
+    """Extract title records with the original Segmenter pipeline"""
+    recoded_seg, _ = Segmenter.recode(Input(base_html), remove_accents=True)
+    genres_list_seg = Segmenter.import_xml(
+        segmentation=recoded_seg,
+        element="ul",
+        conditions={"id": re.compile(r"^genres-list")},
+    )
+    genre_seg = Segmenter.tokenize(
+        segmentation=genres_list_seg,
+        regexes=[(re.compile(r'(?s)<a id[^>]+>(.+?)</a.+?(?=<a id|$)'),
+                  "tokenize", {"genre": "&1"})],
+        import_annotations=False,
+    )
+    title_seg = Segmenter.tokenize(
+        segmentation=genre_seg,
+        regexes=[(re.compile(r'(?s)<li class="bibl".+?</span>'),
+                  "tokenize")],
+    )
+    title_seg = Segmenter.tokenize(
+        segmentation=title_seg,
+        regexes=[
+            (re.compile(r"(?s)^.*>\n(.+?)</span>.*$"),
+             "tokenize", {"author": "&1"}),
+            (re.compile(r'(?s)^.*href="(/works/.+?\.shtml)">.*$'),
+             "tokenize", {"url": "&1"}),
+            (re.compile(r'(?s)^.*shtml">(.*)</a>.*$'),
+             "tokenize", {"title": "&1"}),
+        ],
+        merge_duplicates=True,
+    )
+    return [segment.annotations for segment in title_seg]
+
+
+class ECPTests(unittest.TestCase):
+
+    def setUp(self):
+        """ Prepare some values to make tests"""
+        self.page = Path(ASSETS_DIR, 'ecp_works.html').read_bytes()
+        self.expected = segmenter_title_records(self.page.decode('utf-8'))
+
+    def chunks(self, size):
+        return (
+            self.page[i:i+size] for i in range(0, len(self.page), size)
+        )
+
+    def test_parse_genres_list(self):
+        """ Test the parser against the Segmenter pipeline"""
+        records = ecp.parse_genres_list(self.chunks(len(self.page)))
+        self.assertTrue(records)
+        self.assertEqual(records, self.expected)
+
+    def test_parse_genres_list_chunked(self):
+        """ Test that chunk boundaries don't change the records"""
+        for size in (1, 7, 1024):
+            self.assertEqual(
+                ecp.parse_genres_list(self.chunks(size)), self.expected
+            )
+
+    def test_parse_genres_list_ignores_other_lists(self):
+        """ Test that works outside the genre lists are left out"""
+        records = ecp.parse_genres_list(self.chunks(len(self.page)))
+        urls = {record["url"] for record in records}
+        self.assertNotIn("/works/zz/decoy.shtml", urls)
+        self.assertNotIn("/works/zz/after.shtml", urls)
+
+
+class ECPRefreshTests(GuiTest):
+
+    def setUp(self):
+        self.widget = ecp.ECP()
+
+    def tearDown(self):
+        self.widget.onDeleteWidget()
+        self.widget.deleteLater()
+
+    def refresh(self, getTitleList):
+        with patch.object(ecp.ECP, "getTitleListFromECP", getTitleList):
+            self.widget.refreshTitleSeg()
+            self.assertFalse(self.widget.titleListbox.isEnabled())
+            self.assertTrue(QTest.qWaitFor(lambda: self.widget._task is None))
+        self.assertTrue(self.widget.titleListbox.isEnabled())
+        return self.widget.infoBox.stateLabel.text()
+
+    def test_refresh_failure(self):
+        """ Test the message shown when the website can't be accessed"""
+        message = self.refresh(lambda widget: None)
+        self.assertIn("Couldn't access ECP website.", message)
+
+    def test_refresh_cancelled(self):
+        """ Test the message shown when the refresh stops on cancel"""
+        def getTitleList(widget):
+            widget.cancel_operation = True
+            return None
+        message = self.refresh(getTitleList)
+        self.assertIn("Operation cancelled.", message)
+
+    def test_cancel_refresh(self):
+        """ Test that the GUI is restored when a refresh is cancelled"""
+        release = threading.Event()
+        with patch.object(
+            ecp.ECP, "getTitleListFromECP", lambda widget: release.wait(5)
+        ):
+            self.widget.refreshTitleSeg()
+            self.assertTrue(self.widget.sendButton.cancelButton.isEnabled())
+            # Cancelling waits for the worker thread to return...
+            release.set()
+            self.widget.cancel_manually()
+        self.assertTrue(QTest.qWaitFor(self.widget.titleListbox.isEnabled))
+        self.assertTrue(self.widget.controlArea.isEnabled())
+
+
+if __name__ == '__main__':
+    unittest.main()
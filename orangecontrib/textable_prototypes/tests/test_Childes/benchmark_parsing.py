@@ -0,0 +1,170 @@
+"""
+Benchmark of the Childes word segmentation on a synthetic CHILDES XML corpus.
+
+Parses the corpus with parseChatFile (a single streaming pass that also
+aligns words with their mw tags) and builds one segment per morpheme, as
+Childes.sendData does. The former alignment (get_contained_segments on the
+whole mw segmentation for every word, then a reparse of each mw tag) is
+quadratic in corpus size, so it is only timed on a smaller sample. Run with:
+
+    python benchmark_parsing.py [number of words] [number of words (former)]
+"""
+
+import random
+import sys
+import time
+import types
+import xml.etree.ElementTree as ET
+
+from LTTL.Input import Input
+from LTTL.Segment import Segment
+from LTTL.Segmentation import Segmentation
+
+from orangecontrib.textable_prototypes.widgets.Childes import (
+    Childes, parseChatFile,
+)
+
+WORDS_PER_FILE = 10000
+WORDS_PER_UTTERANCE = 8
+
+HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<CHAT Corpus="Bench" Lang="eng" PID="11312/c-0001">'
+    '\n<Participants>\n'
+    '<participant id="CHI" role="Target_Child" age="P2Y3M12D" sex="male"/>\n'
+    '<participant id="MOT" role="Mother"/>\n'
+    '</Participants>\n'
+)
+
+STEMS = ["dog", "cat", "ball", "eat", "go", "see", "big", "red", "mommy"]
+CATEGORIES = ["n", "v", "adj", "pro"]
+
+
+def make_word(index):
+    stem = random.choice(STEMS)
+    suffix = '<mk type="sfx">PL</mk>' if random.random() < .3 else ''
+    return (
+        '<w>%s<mor type="mor"><mw><pos><c>%s</c></pos><stem>%s</stem>%s'
+        '</mw><gra type="gra" index="%i" head="%i" relation="SUBJ"/>'
+        '</mor></w>' % (
+            stem, random.choice(CATEGORIES), stem, suffix, index, index + 1,
+        )
+    )
+
+
+def make_file(numWords):
+    """Build the content of a CHILDES XML file with numWords words (one
+    word per line, as in the CHILDES corpora)
+    """
+    utterances = list()
+    for uttIdx in range(0, numWords, WORDS_PER_UTTERANCE):
+        words = "\n".join(
+            make_word(index + 1)
+            for index in range(min(WORDS_PER_UTTERANCE, numWords - uttIdx))
+        )
+        utterances.append(
+            '<u who="%s" uID="u%i">\n%s\n<t type="p"/>\n</u>' % (
+                random.choice(["CHI", "MOT"]), uttIdx, words,
+            )
+        )
+    return HEADER + "\n".join(utterances) + "\n</CHAT>"
+
+
+def make_corpus(numWords):
+    return [
+        ("file%i.xml" % idx, make_file(min(WORDS_PER_FILE, numWords - start)))
+        for idx, start in enumerate(range(0, numWords, WORDS_PER_FILE))
+    ]
+
+
+def build_words(widget, records):
+    """Build word segments from parsed records as Childes.sendData does"""
+    inputs = [Input(record["content"]) for record in records]
+    wordSegments = list()
+    for input_seg, record in zip(inputs, records):
+        fileSegment = input_seg[0]
+        for start, end, attributes, utterance, morphemes in record["words"]:
+            wordAnnotations = fileSegment.annotations.copy()
+            wordAnnotations.update(record["utterances"][utterance][2])
+            wordAnnotations.update(attributes)
+            for morpheme in morphemes:
+                morphemeAnnotations = wordAnnotations.copy()
+                morphemeAnnotations.update(
+                    widget.extractWordAnnotations(morpheme)
+                )
+                wordSegments.append(
+                    Segment(
+                        fileSegment.str_index, start, end,
+                        morphemeAnnotations,
+                    )
+                )
+    return Segmentation(wordSegments)
+
+
+def build_words_former(records):
+    """Align words with their mw tags as the former Childes.sendData did"""
+    inputs = [Input(record["content"]) for record in records]
+    wordSegments = list()
+    mwSegments = list()
+    for input_seg, record in zip(inputs, records):
+        fileSegment = input_seg[0]
+        for start, end, attributes, utterance, morphemes in record["words"]:
+            wordSegments.append(
+                Segment(fileSegment.str_index, start, end, attributes)
+            )
+        content = record["content"]
+        start = content.find("<mw>")
+        while start != -1:
+            end = content.index("</mw>", start) + len("</mw>")
+            mwSegments.append(Segment(fileSegment.str_index, start, end))
+            start = content.find("<mw>", end)
+    mwSegmentation = Segmentation(mwSegments)
+    segments = list()
+    for word in Segmentation(wordSegments):
+        for mw in word.get_contained_segments(mwSegmentation):
+            wordSegment = word.deepcopy()
+            mwElement = ET.fromstring(mw.get_content())
+            wordSegment.annotations["stem"] = mwElement.findtext("stem")
+            segments.append(wordSegment)
+    return Segmentation(segments)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(numWords=1000000, numWordsFormer=20000):
+    random.seed(1)
+    widget = types.SimpleNamespace(includePrefixes=False, includePOSTag=True)
+    widget.extractWordAnnotations = types.MethodType(
+        Childes.extractWordAnnotations, widget
+    )
+    for size in sorted({numWordsFormer, numWords}):
+        corpus = make_corpus(size)
+        records, parseDuration = timed(
+            lambda: [
+                parseChatFile(filename, content, True)
+                for filename, content in corpus
+            ]
+        )
+        words, buildDuration = timed(build_words, widget, records)
+        print(
+            "%i words in %i files: parseChatFile %.1f s, word segments "
+            "%.1f s (%i segments)" % (
+                size, len(corpus), parseDuration, buildDuration, len(words),
+            )
+        )
+        if size <= numWordsFormer:
+            formerWords, formerDuration = timed(build_words_former, records)
+            print(
+                "%i words in %i files: former alignment %.1f s "
+                "(%i segments)" % (
+                    size, len(corpus), formerDuration, len(formerWords),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,141 @@
+"""
+Benchmark of the lyrics download of the Lyrics Genius widget against a
+local fixture server that serves Genius-like song pages (about 130 kB)
+after a fixed latency.
+
+Compares the former download (serial requests and BeautifulSoup
+extraction) with sendData on a cold disk cache and on a full disk cache.
+Run with:
+
+    python benchmark_download.py [number of songs] [latency in ms]
+"""
+
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import requests
+from AnyQt.QtWidgets import QApplication
+from bs4 import BeautifulSoup
+
+from orangecontrib.textable_prototypes.widgets.LyricsGenius import (
+    LyricsGenius,
+)
+
+WEBSITE = "http://genius.com"
+
+PAGE = (
+    '<!DOCTYPE html><html><head><title>%s</title><script>'
+    'window.__PRELOADED_STATE__ = JSON.parse(\'%s\');</script></head><body>'
+    '<div class="Header__Container">Genius</div>%s'
+    '<div class="LyricsFooter__Container">How to Format Lyrics</div>'
+    '</body></html>'
+)
+CONTAINER = (
+    '<div data-lyrics-container="true" class="Lyrics__Container-sc-1 Dzx">'
+    '[Verse %i]<br/>%s</div><div class="RightSidebar__Container">%s</div>'
+)
+LINE = '<a href="/%i"><span>Line %i of %s, sing it loud</span></a><br/>'
+
+
+def make_page(path):
+    containers = "".join(
+        CONTAINER % (
+            verse,
+            "".join(LINE % (line, line, path) for line in range(8)),
+            "Ad " * 200,
+        )
+        for verse in range(6)
+    )
+    return (PAGE % (path, "x" * 120000, containers)).encode("utf-8")
+
+
+def make_server(latency):
+    """Start a local server that answers every request with a song page
+    after latency seconds and return it"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            body = make_page(self.path)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def former_html_to_text(page_url):
+    """Extract lyrics as the former LyricsGenius.html_to_text did"""
+    page = requests.get(page_url)
+    html = BeautifulSoup(page.text, "html.parser")
+    [h.extract() for h in html('script')]
+    lyrics = ""
+    for element in html.find_all(
+        "div", class_=re.compile(r"^Lyrics__Container")
+    ):
+        lyrics = lyrics + element.get_text()
+    return re.sub(r"(?<=\S)(\[|\(|[A-Z])", r" \1", lyrics)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main(numSongs=200, latency=50):
+    app = QApplication.instance() or QApplication(sys.argv)
+    server = make_server(latency / 1000)
+    base = "http://127.0.0.1:%i" % server.server_port
+    basket = [
+        {
+            "artist": "Artist %i" % (idx % 20),
+            "artist_id": idx % 20,
+            "path": "/artist-%i-song-%i-lyrics" % (idx % 20, idx),
+            "title": "Song %i" % idx,
+        }
+        for idx in range(numSongs)
+    ]
+
+    formerLyrics = list()
+    duration = timed(lambda: [
+        formerLyrics.append(former_html_to_text(base + song["path"]))
+        for song in basket
+    ])
+    print("%i songs, former serial download: %.2f s" % (numSongs, duration))
+
+    with tempfile.TemporaryDirectory() as folder, patch.object(
+        LyricsGenius, "cachedFoldername", os.path.join(folder, "lyrics"),
+    ):
+        widget = LyricsGenius()
+        widget.html_to_text = lambda page_url: LyricsGenius.html_to_text(
+            widget, page_url.replace(WEBSITE, base)
+        )
+        widget.myBasket = basket
+        for label in ("cold disk cache", "disk cache"):
+            duration = timed(widget.sendData)
+            assert [
+                segment.get_content() for segment in widget.segmentation
+            ] == formerLyrics
+            print("%i songs, %s: %.2f s" % (numSongs, label, duration))
+        widget.onDeleteWidget()
+        widget.deleteLater()
+    server.shutdown()
+    app.processEvents()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
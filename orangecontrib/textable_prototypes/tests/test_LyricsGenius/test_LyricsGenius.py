@@ -0,0 +1,196 @@
+"""
+A collection of tests for the Lyrics Genius widget.
+
+The streaming lyrics extractor is checked against the original
+BeautifulSoup extraction, which is kept here as a correctness oracle.
+Song pages are fetched through a local stand-in for html_to_text.
+"""
+
+import os
+import pickle
+import re
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import requests
+from bs4 import BeautifulSoup
+from Orange.widgets.tests.base import GuiTest
+
+from orangecontrib.textable_prototypes.widgets.LyricsGenius import (
+    LyricsGenius, extract_lyrics,
+)
+
+ASSETS_DIR = Path(__file__).parent / 'assets'
+
+
+def soup_lyrics(page):
+    """Extract lyrics with the original BeautifulSoup pipeline"""
+    html = BeautifulSoup(page, "html.parser")
+    [h.extract() for h in html('script')]
+    lyrics = ""
+    for element in html.find_all(
+        "div", class_=re.compile(r"^Lyrics__Container")
+    ):
+        lyrics = lyrics + element.get_text()
+    return lyrics
+
+
+class LyricsExtractorTests(unittest.TestCase):
+
+    def setUp(self):
+        """ Prepare some values to make tests"""
+        self.page = Path(ASSETS_DIR, 'genius_song.html').read_bytes()
+        self.expected = soup_lyrics(self.page.decode('utf-8'))
+
+    def chunks(self, size):
+        return (
+            self.page[i:i+size] for i in range(0, len(self.page), size)
+        )
+
+    def test_extract_lyrics(self):
+        """ Test the extractor against the BeautifulSoup pipeline"""
+        lyrics = extract_lyrics(self.chunks(len(self.page)))
+        self.assertIn("Café au lait & croissants", lyrics)
+        self.assertNotIn("ga(", lyrics)
+        self.assertNotIn("Ad space", lyrics)
+        self.assertEqual(lyrics, self.expected)
+
+    def test_extract_lyrics_chunked(self):
+        """ Test that chunk boundaries (even within a character) don't
+        change the lyrics"""
+        for size in (1, 7, 1024):
+            self.assertEqual(
+                extract_lyrics(self.chunks(size)), self.expected
+            )
+
+
+class LyricsGeniusTests(GuiTest):
+
+    def setUp(self):
+        """ Prepare some values to make tests"""
+        self.folder = tempfile.TemporaryDirectory()
+        self.cachePatch = patch.object(
+            LyricsGenius,
+            "cachedFoldername",
+            os.path.join(self.folder.name, "lyrics"),
+        )
+        self.cachePatch.start()
+        self.pages = {
+            "/song-%i-lyrics" % idx: "Lyrics of song %i" % idx
+            for idx in range(3)
+        }
+        self.failing = set()
+        self.requests = list()
+        self.lock = threading.Lock()
+        self.widget = LyricsGenius()
+        self.widget.html_to_text = self.html_to_text
+
+    def tearDown(self):
+        self.widget.onDeleteWidget()
+        self.widget.deleteLater()
+        self.cachePatch.stop()
+        self.folder.cleanup()
+
+    def html_to_text(self, page_url):
+        """Stand-in for LyricsGenius.html_to_text"""
+        path = page_url[len("http://genius.com"):]
+        with self.lock:
+            self.requests.append(path)
+        if path in self.failing:
+            raise requests.exceptions.ConnectionError("Connection refused")
+        return self.pages[path]
+
+    def song(self, path):
+        return {
+            "artist": "Artist", "artist_id": 1, "path": path,
+            "title": path.split("-")[1],
+        }
+
+    def test_cache(self):
+        """ Test that lyrics are only extracted once"""
+        self.assertEqual(
+            self.widget.getLyrics("/song-0-lyrics"), "Lyrics of song 0"
+        )
+        self.assertEqual(
+            self.widget.getLyrics("/song-0-lyrics"), "Lyrics of song 0"
+        )
+        self.assertEqual(self.requests, ["/song-0-lyrics"])
+
+    def test_empty_lyrics_are_not_cached(self):
+        """ Test that empty lyrics are extracted again next time"""
+        self.pages["/song-0-lyrics"] = "\n"
+        self.widget.getLyrics("/song-0-lyrics")
+        self.pages["/song-0-lyrics"] = "Lyrics of song 0"
+        self.assertEqual(
+            self.widget.getLyrics("/song-0-lyrics"), "Lyrics of song 0"
+        )
+        self.assertEqual(self.requests, ["/song-0-lyrics"] * 2)
+
+    def test_outdated_or_broken_cache(self):
+        """ Test that outdated or unreadable cache files are ignored"""
+        self.widget.getLyrics("/song-0-lyrics")
+        self.widget.getLyrics("/song-1-lyrics")
+        path = self.widget.cachedLyricsPath("/song-0-lyrics")
+        with open(path, "wb") as file:
+            pickle.dump({"version": 0, "lyrics": "Old lyrics"}, file)
+        with open(self.widget.cachedLyricsPath("/song-1-lyrics"), "wb"):
+            pass
+        self.assertIsNone(self.widget.loadCachedLyrics("/song-0-lyrics"))
+        self.assertIsNone(self.widget.loadCachedLyrics("/song-1-lyrics"))
+        self.assertEqual(
+            self.widget.getLyrics("/song-0-lyrics"), "Lyrics of song 0"
+        )
+
+    def test_concurrent_fetch(self):
+        """ Test that songs are fetched concurrently, once per path, and
+        sent in basket order"""
+        barrier = threading.Barrier(len(self.pages), timeout=5)
+
+        def html_to_text(page_url):
+            # Every distinct song must be requested before any returns...
+            barrier.wait()
+            return self.html_to_text(page_url)
+
+        self.widget.html_to_text = html_to_text
+        paths = ["/song-2-lyrics", "/song-0-lyrics", "/song-1-lyrics"]
+        self.widget.myBasket = [self.song(path) for path in paths]
+        self.widget.myBasket.append(self.song("/song-2-lyrics"))
+        self.widget.sendData()
+        self.assertEqual(sorted(self.requests), sorted(self.pages))
+        self.assertEqual(
+            [segment.get_content() for segment in self.widget.segmentation],
+            [self.pages[path] for path in paths + ["/song-2-lyrics"]],
+        )
+        self.assertEqual(
+            [s.annotations["path"] for s in self.widget.segmentation],
+            paths + ["/song-2-lyrics"],
+        )
+
+    def test_failed_song(self):
+        """ Test that a failing song is skipped and reported"""
+        self.failing.add("/song-1-lyrics")
+        self.widget.myBasket = [self.song(path) for path in self.pages]
+        self.widget.sendData()
+        self.assertEqual(len(self.widget.segmentation), 2)
+        self.assertIn(
+            "Couldn't download: 1.", self.widget.infoBox.stateLabel.text()
+        )
+        self.assertTrue(self.widget.controlArea.isEnabled())
+
+    def test_all_songs_failed(self):
+        """ Test the error shown when no song can be downloaded"""
+        self.failing.update(self.pages)
+        self.widget.myBasket = [self.song(path) for path in self.pages]
+        self.widget.sendData()
+        self.assertIn(
+            "Couldn't download data from Genius website.",
+            self.widget.infoBox.stateLabel.text(),
+        )
+        self.assertTrue(self.widget.controlArea.isEnabled())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+A collection of tests for the Movie Reviews widget.
+
+IMDb responses are replayed from assets/imdb_responses.json through a local
+stand-in for the imdb.IMDb access object.
+"""
+
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from orangecontrib.textable_prototypes.widgets.MovieReviews import (
+    MovieMetadataCache, fetch_movies,
+)
+
+ASSETS_DIR = Path(__file__).parent / 'assets'
+
+
+class ReplayMovie(dict):
+    """Stand-in for imdb.Movie.Movie (str() is the title)"""
+
+    def __str__(self):
+        return self.get('title', '')
+
+
+class ReplayIMDb:
+    """Stand-in for imdb.IMDb replaying recorded responses"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = list()
+        self.lock = threading.Lock()
+
+    def record(self, method, movieID):
+        with self.lock:
+            self.calls.append((method, movieID))
+
+    def get_movie(self, movieID):
+        self.record('get_movie', movieID)
+        return ReplayMovie(self.responses['movies'][movieID])
+
+    def get_movie_reviews(self, movieID):
+        self.record('get_movie_reviews', movieID)
+        return {'data': {'reviews': [
+            {'content': content}
+            for content in self.responses['reviews'][movieID]
+        ]}}
+
+
+class MovieReviewsTests(unittest.TestCase):
+
+    def setUp(self):
+        """ Prepare some values to make tests"""
+        with open(Path(ASSETS_DIR, 'imdb_responses.json'),
+                  encoding='utf-8') as file:
+            self.responses = json.load(file)
+        self.ia = ReplayIMDb(self.responses)
+        self.folder = tempfile.TemporaryDirectory()
+        self.cache = MovieMetadataCache(self.folder.name, size=2)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_metadata_cache_memory(self):
+        """ Test that cached metadata is not fetched again"""
+        metadata = self.cache.get('0133093', self.ia)
+        self.assertEqual(metadata, {'title': 'The Matrix', 'year': 1999})
+        self.cache.get('0133093', self.ia)
+        self.assertEqual(self.ia.calls, [('get_movie', '0133093')])
+
+    def test_metadata_cache_lru(self):
+        """ Test that least recently used metadata is evicted"""
+        for movieID in ('0133093', '0062622', '0133093', '0083658'):
+            self.cache.get(movieID, self.ia)
+        self.assertEqual(list(self.cache.movies), ['0133093', '0083658'])
+
+    def test_metadata_cache_disk(self):
+        """ Test that metadata is reloaded from disk by a new cache"""
+        self.cache.get('0118799', self.ia)
+        cache = MovieMetadataCache(self.folder.name)
+        ia = ReplayIMDb(self.responses)
+        self.assertEqual(
+            cache.get('0118799', ia),
+            {'title': 'La vita è bella', 'year': 1997},
+        )
+        self.assertEqual(ia.calls, list())
+
+    def test_fetch_movies(self):
+        """ Test concurrent retrieval of reviews and metadata"""
+        def fetch(movieID):
+            movie = self.ia.get_movie_reviews(movieID)
+            reviews = [r['content'] for r in movie['data']['reviews']]
+            return reviews, self.cache.get(movieID, self.ia)
+
+        movieIDs = list(self.responses['movies'])
+        ticks = list()
+        movies, failed = fetch_movies(
+            movieIDs, fetch, 4, lambda: ticks.append(1)
+        )
+        self.assertEqual(failed, set())
+        self.assertEqual(len(ticks), len(movieIDs))
+        for movieID in movieIDs:
+            self.assertEqual(
+                movies[movieID][0], self.responses['reviews'][movieID]
+            )
+            self.assertEqual(
+                movies[movieID][1]['title'],
+                self.responses['movies'][movieID]['title'],
+            )
+
+    def test_fetch_movies_failure(self):
+        """ Test that a failing movie doesn't abort the others"""
+        def fetch(movieID):
+            return self.cache.get(movieID, self.ia)
+
+        movies, failed = fetch_movies(['0133093', 'unknown'], fetch, 2)
+        self.assertEqual(failed, {'unknown'})
+        self.assertEqual(movies['0133093']['title'], 'The Matrix')
+
+
+if __name__ == '__main__':
+    unittest.main()
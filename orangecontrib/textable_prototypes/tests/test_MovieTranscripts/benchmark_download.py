@@ -0,0 +1,106 @@
+"""
+Benchmark of the script download of the Movie Transcripts widget against a
+local fixture server that serves springfieldspringfield-like script pages
+with a fixed latency.
+
+Times MovieTranscripts.processData on a basket of movies with an empty
+script store for several numbers of worker threads, then with a full script
+store. Run with:
+
+    python benchmark_download.py [number of movies] [latency in ms]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from AnyQt.QtWidgets import QApplication
+
+from orangecontrib.textable_prototypes.widgets.MovieTranscripts import (
+    MovieTranscripts,
+)
+
+WEBSITE = "https://www.springfieldspringfield.co.uk/"
+WORKERS = [1, 2, 4, 8]
+
+PAGE = (
+    "<html><body><h1>%s</h1><div class='movie_script'>"
+    "<div class='scrolling-script-container'>%s</div></div></body></html>"
+)
+
+
+def make_server(latency):
+    """Start a local server that answers every request with a script page
+    after latency seconds and return it"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            movie = self.path.rsplit("=", 1)[-1]
+            body = (PAGE % (movie, ("Line of %s. " % movie) * 2000)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def timed_download(widget, basket):
+    start = time.perf_counter()
+    result = widget.processData(basket)
+    duration = time.perf_counter() - start
+    assert not result["failed"]
+    return duration
+
+
+def main(numMovies=100, latency=100):
+    app = QApplication.instance() or QApplication(sys.argv)
+    server = make_server(latency / 1000)
+    base = "http://127.0.0.1:%i/" % server.server_port
+    basket = ["Movie %i (2000)" % idx for idx in range(numMovies)]
+
+    for workers in WORKERS + [None]:
+        with tempfile.TemporaryDirectory() as folder, patch.object(
+            MovieTranscripts,
+            "scriptsFoldername",
+            os.path.join(folder, "scripts"),
+        ), patch.object(MovieTranscripts, "maxWorkers", workers or 4):
+            widget = MovieTranscripts()
+            widget.title_to_href = {
+                movie: "movie%i" % idx for idx, movie in enumerate(basket)
+            }
+            widget.path_storage = dict()
+            widget.fetchPage = lambda session, page_url: (
+                MovieTranscripts.fetchPage(
+                    widget, session, page_url.replace(WEBSITE, base)
+                )
+            )
+            duration = timed_download(widget, basket)
+            if workers is None:
+                widget.clearCreatedInputs()
+                duration = timed_download(widget, basket)
+                label = "script store"
+            else:
+                label = "%i worker%s" % (workers, "s" if workers > 1 else "")
+            print("%i movies, %s: %.2f s (%.1f movies/s)" % (
+                numMovies, label, duration, numMovies / duration
+            ))
+            widget.onDeleteWidget()
+            widget.deleteLater()
+    server.shutdown()
+    app.processEvents()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
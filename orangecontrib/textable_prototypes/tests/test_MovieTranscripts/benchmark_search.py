@@ -0,0 +1,56 @@
+"""
+Benchmark of the movie title search on the title database shipped with
+the Movie Transcripts widget. Run with:
+
+    python benchmark_search.py [number of random queries]
+"""
+
+import os
+import pickle
+import random
+import sys
+import time
+
+from orangecontrib.textable_prototypes.widgets import MovieTranscripts
+
+QUERIES = [
+    "alien", "star wars", "the godfather", "Harry potter", "x",
+    "lord of the rings", "matrix", "die hard 2",
+]
+
+
+def main(numQueries=100):
+    path = os.path.join(
+        os.path.dirname(MovieTranscripts.__file__),
+        MovieTranscripts.MovieTranscripts.cacheFilename,
+    )
+    with open(path, "rb") as file:
+        title_to_href = pickle.load(file)
+
+    start = time.perf_counter()
+    index = MovieTranscripts.TitleIndex(title_to_href)
+    print("%i titles, index built in %.0f ms" % (
+        len(title_to_href), (time.perf_counter() - start) * 1000
+    ))
+
+    random.seed(0)
+    queries = QUERIES + [
+        random.choice(list(title_to_href)).rsplit("(", 1)[0]
+        for _ in range(numQueries)
+    ]
+    durations = list()
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query)
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    print("%i queries: mean %.1f ms, median %.1f ms, max %.1f ms" % (
+        len(queries),
+        sum(durations) / len(durations),
+        durations[len(durations) // 2],
+        durations[-1],
+    ))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,231 @@
+"""
+A collection of tests for the Movie Transcripts widget.
+
+Pages of the springfieldspringfield website are replayed from
+assets/springfield_pages.json through a local stand-in for fetchPage.
+"""
+
+import json
+import os
+import pickle
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import requests
+from AnyQt.QtTest import QTest
+from AnyQt.QtWidgets import QMessageBox
+from Orange.widgets.tests.base import GuiTest
+
+from orangecontrib.textable_prototypes.widgets.MovieTranscripts import (
+    MovieTranscripts, TitleIndex,
+)
+
+ASSETS_DIR = Path(__file__).parent / 'assets'
+
+LIST_URL = MovieTranscripts.http_query_string + "%s&page=%i"
+
+
+class MovieTranscriptsTests(GuiTest):
+
+    def setUp(self):
+        """ Prepare some values to make tests"""
+        with open(Path(ASSETS_DIR, 'springfield_pages.json'),
+                  encoding='utf-8') as file:
+            self.pages = json.load(file)["pages"]
+        self.requests = list()
+        self.failing = set()
+        self.lock = threading.Lock()
+        self.folder = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.folder.name, "cache"), "wb") as file:
+            pickle.dump({"Alien (1979)": "alien"}, file)
+        self.patches = [
+            patch.object(MovieTranscripts, attribute, value)
+            for attribute, value in (
+                ("cacheFilename", os.path.join(self.folder.name, "cache")),
+                (
+                    "checkpointFilename",
+                    os.path.join(self.folder.name, "checkpoint"),
+                ),
+                (
+                    "scriptsFoldername",
+                    os.path.join(self.folder.name, "scripts"),
+                ),
+                ("alphabet", ["A", "B"]),
+            )
+        ]
+        for p in self.patches:
+            p.start()
+        self.widget = MovieTranscripts()
+        self.widget.fetchPage = self.fetchPage
+
+    def tearDown(self):
+        self.widget.onDeleteWidget()
+        self.widget.deleteLater()
+        for p in self.patches:
+            p.stop()
+        self.folder.cleanup()
+
+    def fetchPage(self, session, page_url):
+        """Stand-in for MovieTranscripts.fetchPage"""
+        with self.lock:
+            self.requests.append(page_url)
+        if page_url in self.failing or page_url not in self.pages:
+            raise requests.exceptions.HTTPError("404 Not Found")
+        return self.pages[page_url].encode("utf-8")
+
+    def test_crawl(self):
+        """ Test that all pages of all letters are crawled"""
+        result = self.widget.get_all_titles()
+        self.assertEqual(result["failed"], [])
+        self.assertEqual(result["titles"], {
+            "Alien (1979)": "alien",
+            "Amadeus (1984)": "amadeus",
+            "Annie Hall (1977)": "annie-hall",
+            "Brazil (1985)": "brazil",
+            "Bullitt (1968)": "bullitt",
+        })
+        self.assertEqual(len(self.requests), 6)
+
+    def test_crawl_resume(self):
+        """ Test that an interrupted crawl resumes from its checkpoint"""
+        self.failing.add(LIST_URL % ("B", 2))
+        result = self.widget.get_all_titles()
+        self.assertEqual(result["failed"], ["B"])
+        self.assertNotIn("Bullitt (1968)", result["titles"])
+        self.widget.titlesRefreshed(result)
+        self.assertTrue(os.path.exists(self.widget.checkpointPath()))
+
+        self.failing.clear()
+        del self.requests[:]
+        result = self.widget.get_all_titles()
+        self.assertEqual(result["failed"], [])
+        self.assertEqual(
+            sorted(self.requests), [LIST_URL % ("B", 2), LIST_URL % ("B", 3)]
+        )
+        self.assertEqual(len(result["titles"]), 5)
+
+        # A complete crawl saves the database and forgets the checkpoint...
+        self.widget.titlesRefreshed(result)
+        self.assertFalse(os.path.exists(self.widget.checkpointPath()))
+        with open(MovieTranscripts.cacheFilename, "rb") as file:
+            self.assertEqual(pickle.load(file), result["titles"])
+
+    def test_cancel_refresh(self):
+        """ Test that the GUI is restored when a refresh is cancelled"""
+        release = threading.Event()
+
+        def fetchPage(session, page_url):
+            release.wait(5)
+            return self.fetchPage(session, page_url)
+
+        self.widget.fetchPage = fetchPage
+        with patch.object(
+            QMessageBox, "question", return_value=QMessageBox.Yes
+        ):
+            self.widget.refreshTitles()
+        self.assertFalse(self.widget.refreshButton.isEnabled())
+        # Cancelling waits for the worker thread to return...
+        release.set()
+        self.widget.cancel_manually()
+        self.assertTrue(QTest.qWaitFor(self.widget.refreshButton.isEnabled))
+        self.assertTrue(self.widget.controlArea.isEnabled())
+
+    def test_script_store(self):
+        """ Test that scripts are downloaded once and then read from store"""
+        self.widget.title_to_href["Brazil (1985)"] = "brazil"
+        basket = ["Alien (1979)", "Brazil (1985)"]
+        result = self.widget.processData(basket)
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(result["failed"], [])
+        self.assertEqual(
+            [segment.get_content() for segment in result["segmentation"]],
+            [
+                "In space no one can hear you scream.",
+                "Suspicion breeds confidence.",
+            ],
+        )
+        self.assertEqual(
+            sorted(os.listdir(MovieTranscripts.scriptsFoldername)),
+            ["alien.txt", "brazil.txt"],
+        )
+
+        self.widget.clearCreatedInputs()
+        result = self.widget.processData(basket)
+        self.assertEqual(len(self.requests), 2)
+        segment = result["segmentation"][1]
+        self.assertEqual(segment.get_content(), "Suspicion breeds confidence.")
+        self.assertEqual(segment.annotations["Movie Title"], "Brazil ")
+        self.assertEqual(segment.annotations["Year of release"], "1985")
+
+    def test_script_failures(self):
+        """ Test that movies without a script are reported"""
+        self.widget.title_to_href["Amadeus (1984)"] = "amadeus"
+        result = self.widget.processData(
+            ["Alien (1979)", "Amadeus (1984)", "Unknown (2000)"]
+        )
+        self.assertEqual(
+            result["failed"], ["Amadeus (1984)", "Unknown (2000)"]
+        )
+        self.assertEqual(len(result["segmentation"]), 1)
+        self.assertFalse(os.path.exists(os.path.join(
+            MovieTranscripts.scriptsFoldername, "amadeus.txt"
+        )))
+
+    def test_cancel_send(self):
+        """ Test that the GUI is restored when a download is cancelled"""
+        release = threading.Event()
+
+        def fetchPage(session, page_url):
+            release.wait(5)
+            return self.fetchPage(session, page_url)
+
+        self.widget.fetchPage = fetchPage
+        self.widget.myBasket = ["Alien (1979)"]
+        self.widget.sendData()
+        self.assertFalse(self.widget.refreshButton.isEnabled())
+        self.assertTrue(self.widget.sendButton.cancelButton.isEnabled())
+        # Cancelling waits for the worker thread to return...
+        release.set()
+        self.widget.cancel_manually()
+        self.assertTrue(QTest.qWaitFor(self.widget.refreshButton.isEnabled))
+        self.assertTrue(self.widget.controlArea.isEnabled())
+
+
+class TitleIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        """ Index a few titles (see benchmark_search.py for a benchmark on
+        the whole title database)"""
+        self.index = TitleIndex({
+            "Alien (1979)": "alien",
+            "Aliens (1986)": "aliens",
+            "Alien: Resurrection (1997)": "alien-resurrection",
+            "Amadeus (1984)": "amadeus",
+            "Die Hard 2 (1990)": "die-hard-2",
+        })
+
+    def titles(self, query):
+        return [title for _, _, title in self.index.search(query)]
+
+    def test_search(self):
+        """ Test that titles are matched fuzzily, best matches first"""
+        self.assertEqual(
+            self.titles("ALIEN"),
+            ["Alien (1979)", "Aliens (1986)", "Alien: Resurrection (1997)"],
+        )
+        self.assertEqual(self.titles("die hard II"), ["Die Hard 2 (1990)"])
+        self.assertEqual(self.titles("godfather"), [])
+
+    def test_search_results(self):
+        """ Test the link parts and scores of the results"""
+        [(href, score, title)] = self.index.search("amadeus!")
+        self.assertEqual(
+            (href, score, title), ("amadeus", 100, "Amadeus (1984)")
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
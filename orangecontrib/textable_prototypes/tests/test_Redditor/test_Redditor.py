@@ -0,0 +1,191 @@
+"""
+A collection of tests for the Redditor widget.
+
+Reddit API responses are replayed from assets/reddit_responses.json through
+a local stand-in for the PRAW Reddit instances.
+"""
+
+import copy
+import json
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from Orange.widgets.tests.base import GuiTest
+
+from orangecontrib.textable_prototypes.widgets.Redditor import Redditor
+
+ASSETS_DIR = Path(__file__).parent / 'assets'
+
+
+class ReplayComments:
+    """Stand-in for a PRAW CommentForest"""
+
+    def __init__(self, reddit, comments):
+        self.reddit = reddit
+        self.comments = comments
+
+    def replace_more(self, limit=None):
+        with self.reddit.lock:
+            self.reddit.commentFetches += 1
+
+    def list(self):
+        return [ReplayItem(self.reddit, c) for c in self.comments]
+
+
+class ReplayItem:
+    """Stand-in for a PRAW Submission or Comment"""
+
+    def __init__(self, reddit, data):
+        self.reddit = reddit
+        for key, value in data.items():
+            if key != "comments":
+                setattr(self, key, value)
+        if "comments" in data:
+            self.comments = ReplayComments(reddit, data["comments"])
+
+
+class ReplaySubreddit:
+    """Stand-in for a PRAW Subreddit (all listings replay the same posts)"""
+
+    def __init__(self, reddit, posts):
+        self.reddit = reddit
+        self.posts = posts
+
+    def listing(self, limit=None, time_filter=None):
+        for data in self.posts[:limit]:
+            yield ReplayItem(self.reddit, data)
+
+    hot = new = rising = controversial = top = listing
+
+
+class ReplayReddit:
+    """Stand-in for praw.Reddit replaying recorded responses"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.commentFetches = 0
+        self.lock = threading.Lock()
+
+    def subreddit(self, name):
+        return ReplaySubreddit(self, self.responses["subreddits"][name])
+
+    def submission(self, id=None, url=None):
+        for posts in self.responses["subreddits"].values():
+            for data in posts:
+                if data["id"] == id:
+                    return ReplayItem(self, data)
+        raise KeyError(id)
+
+
+class RedditorTests(GuiTest):
+
+    def setUp(self):
+        """ Prepare some values to make tests"""
+        with open(Path(ASSETS_DIR, 'reddit_responses.json'),
+                  encoding='utf-8') as file:
+            self.responses = json.load(file)
+        self.folder = tempfile.TemporaryDirectory()
+        self.storePatch = patch.object(
+            Redditor,
+            "storeFilename",
+            os.path.join(self.folder.name, "store.sqlite"),
+        )
+        self.storePatch.start()
+        self.widget = Redditor()
+        self.replay(self.responses)
+        self.query = dict(
+            m="Subreddit", pA="All", sI="linguistics", uI="", ftI="",
+            sTF="Hot", ftTF="Relevance", iI=False, iC=True, a=10,
+        )
+
+    def tearDown(self):
+        self.widget.onDeleteWidget()
+        self.widget.deleteLater()
+        self.storePatch.stop()
+        self.folder.cleanup()
+
+    def replay(self, responses):
+        self.reddit = ReplayReddit(responses)
+        self.widget.reddit = self.reddit
+        self.widget.thread_reddit = lambda: self.reddit
+
+    def segments(self, postIds, query=None):
+        store = self.widget.open_store()
+        try:
+            return self.widget.load_segments(
+                store, query or self.query, postIds
+            )
+        finally:
+            store.close()
+
+    def test_process_query(self):
+        """ Test that posts and comments are fetched and stored"""
+        result = self.widget.process_queries([self.query], False)
+        [(postIds, numSegments)] = result["results"]
+        self.assertEqual(postIds, ["p1", "p2", "p3"])
+        self.assertEqual(self.reddit.commentFetches, 3)
+        segments = self.segments(postIds)
+        self.assertEqual(numSegments, len(segments))
+        self.assertEqual(
+            [annotations["Id"] for _, annotations in segments],
+            ["p1", "c1", "c2", "c3", "p3"],
+        )
+        content, annotations = segments[1]
+        self.assertEqual(content, "It comes from 'hallo', an older form.")
+        self.assertEqual(annotations["Author"], "etymologist")
+        self.assertEqual(annotations["Parent"], "p1")
+        self.assertEqual(annotations["Parent_type"], "3")
+
+    def test_process_query_images(self):
+        """ Test that image-only posts are kept if requested"""
+        query = dict(self.query, iI=True, iC=False)
+        result = self.widget.process_queries([query], False)
+        [(postIds, _)] = result["results"]
+        self.assertEqual(
+            [content for content, _ in self.segments(postIds, query)],
+            [
+                "I have always wondered where it comes from.",
+                "[image]",
+                "Any good books or websites?",
+            ],
+        )
+        self.assertEqual(self.reddit.commentFetches, 0)
+
+    def test_store_round_trip(self):
+        """ Test that a refresh only fetches the comments that changed"""
+        self.widget.process_queries([self.query], False)
+        responses = copy.deepcopy(self.responses)
+        post = responses["subreddits"]["linguistics"][1]
+        post["num_comments"] = 2
+        post["score"] = 150
+        post["comments"].append({
+            "id": "c4",
+            "body": "Where can I find a bigger version?",
+            "author": "reader",
+            "score": 1,
+            "created_utc": 1600001200,
+            "parent_id": "t1_c3",
+        })
+        self.replay(responses)
+        result = self.widget.process_queries([self.query], True)
+        [(postIds, numSegments)] = result["results"]
+        self.assertEqual(self.reddit.commentFetches, 1)
+        segments = self.segments(postIds)
+        self.assertEqual(numSegments, 6)
+        self.assertEqual(
+            [annotations["Id"] for _, annotations in segments],
+            ["p1", "c1", "c2", "c3", "c4", "p3"],
+        )
+
+    def test_process_query_cancelled(self):
+        """ Test that a cancelled fetch returns None"""
+        self.widget.cancel_operation = True
+        self.assertIsNone(self.widget.process_queries([self.query], False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+"""
+Benchmark of the download and text extraction of the Sci-Hubator widget
+against a local fixture server that serves generated PDFs (3 pages of 60
+lines) after a fixed latency, and a 404 for one of the DOIs.
+
+Compares the former processing (serial downloads, then serial extraction)
+with downloadAndExtract, which overlaps downloads (in threads) with
+extraction (in worker processes). Run with:
+
+    python benchmark_pipeline.py [number of DOIs] [latency in ms]
+"""
+
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pdfplumber
+import requests
+from AnyQt.QtWidgets import QApplication
+
+sh = importlib.import_module(
+    "orangecontrib.textable_prototypes.widgets.SciHubator"
+)
+
+LINE = "BT /F1 10 Tf 40 %i Td (Article %i page %i line %i lorem ipsum) Tj ET\n"
+
+
+def make_pdf(numPages, seed):
+    """Build a minimal PDF whose pages contain 60 lines of text"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pages = list()
+    for page in range(numPages):
+        content = "".join(
+            LINE % (800 - 12 * line, seed, page, line) for line in range(60)
+        ).encode("latin-1")
+        objects.append(
+            b"<< /Length %i >>\nstream\n%sendstream" % (len(content), content)
+        )
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Contents %i 0 R /Resources << /Font << /F1 3 0 R >> >> >>"
+            % len(objects)
+        )
+        pages.append(b"%i 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %i >>" % (
+        b" ".join(pages), numPages
+    )
+    pdf = b"%PDF-1.4\n"
+    offsets = list()
+    for idx, obj in enumerate(objects):
+        offsets.append(len(pdf))
+        pdf += b"%i 0 obj\n%s\nendobj\n" % (idx + 1, obj)
+    xref = len(pdf)
+    pdf += b"xref\n0 %i\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010i 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %i /Root 1 0 R >>\nstartxref\n%i\n%%%%EOF\n" % (
+        len(objects) + 1, xref
+    )
+    return pdf
+
+
+def make_server(pdfs, latency):
+    """Start a local server that answers every request with the PDF of the
+    requested DOI (or 404) after latency seconds and return it"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            body = pdfs.get(self.path[1:])
+            if body is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def former_processing(DOIs, tempdirname):
+    """Download then extract each PDF as the former processData did"""
+    for idx, DOI in enumerate(DOIs):
+        sh.scihub_download(
+            DOI, paper_type="doi", out=os.path.join(tempdirname, str(idx))
+        )
+    texts = dict()
+    for idx, DOI in enumerate(DOIs):
+        path = os.path.join(tempdirname, f"{idx}.pdf")
+        if not os.path.exists(path):
+            continue
+        text = ""
+        with pdfplumber.open(path) as pdf:
+            for page in pdf.pages:
+                text += page.extract_text()
+        texts[idx] = text
+    return texts
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main(numDOIs=100, latency=250):
+    app = QApplication.instance() or QApplication(sys.argv)
+    DOIs = ["10.1000/%i" % idx for idx in range(numDOIs)]
+    pdfs = {DOI: make_pdf(3, idx) for idx, DOI in enumerate(DOIs)}
+    del pdfs[DOIs[len(DOIs) // 2]]
+    server = make_server(pdfs, latency / 1000)
+    base = "http://127.0.0.1:%i/" % server.server_port
+
+    def scihub_download(paper, paper_type, out):
+        response = requests.get(base + paper)
+        if response.status_code == 200:
+            with open(f"{out}.pdf", "wb") as file:
+                file.write(response.content)
+
+    with patch.object(sh, "scihub_download", scihub_download):
+        tempdirname = tempfile.mkdtemp()
+        duration, formerTexts = timed(former_processing, DOIs, tempdirname)
+        shutil.rmtree(tempdirname)
+        print("%i DOIs, former serial processing: %.2f s" % (
+            numDOIs, duration
+        ))
+
+        widget = sh.SciHubator()
+        widget.DOIs = DOIs
+        widget.cancel_operation = False
+        tempdirname = tempfile.mkdtemp()
+        duration, (texts, failed) = timed(
+            widget.downloadAndExtract, tempdirname
+        )
+        shutil.rmtree(tempdirname)
+        assert texts == formerTexts
+        assert failed == [(DOIs[len(DOIs) // 2], "download: no PDF found")]
+        print("%i DOIs, download and extraction pipeline: %.2f s" % (
+            numDOIs, duration
+        ))
+        widget.onDeleteWidget()
+        widget.deleteLater()
+    server.shutdown()
+    app.processEvents()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
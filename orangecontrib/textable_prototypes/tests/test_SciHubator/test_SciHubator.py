@@ -0,0 +1,181 @@
+"""
+A collection of tests for the Sci-Hubator widget.
+
+Downloads and PDF extraction are replaced by local stand-ins that write
+and read plain text files (and extraction runs in threads rather than in
+worker processes, which can't see the stand-ins).
+"""
+
+import importlib
+import os
+import shutil
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from AnyQt.QtTest import QTest
+from Orange.widgets.tests.base import GuiTest
+
+sh = importlib.import_module(
+    "orangecontrib.textable_prototypes.widgets.SciHubator"
+)
+
+
+class SciHubatorTests(GuiTest):
+
+    def setUp(self):
+        """ Prepare some values to make tests"""
+        self.failingDownloads = set()
+        self.failingPDFs = set()
+        self.delays = dict()
+        self.events = list()
+        self.lock = threading.Lock()
+        self.patches = [
+            patch.object(sh, "test_scihub_accessible", lambda: True),
+            patch.object(sh, "download_pdf", self.download_pdf),
+            patch.object(sh, "extract_pdf_text", self.extract_pdf_text),
+            patch.object(
+                sh,
+                "ProcessPoolExecutor",
+                lambda max_workers, mp_context: ThreadPoolExecutor(4),
+            ),
+        ]
+        for p in self.patches:
+            p.start()
+        self.widget = sh.SciHubator()
+
+    def tearDown(self):
+        self.widget.onDeleteWidget()
+        self.widget.deleteLater()
+        for p in self.patches:
+            p.stop()
+
+    def download_pdf(self, DOI, out):
+        """Stand-in for SciHubator.download_pdf"""
+        time.sleep(self.delays.get(DOI, 0))
+        if DOI in self.failingDownloads:
+            raise IOError("no PDF found")
+        with open(f"{out}.pdf", "w", encoding="utf-8") as file:
+            file.write(f"Text of {DOI}")
+        with self.lock:
+            self.events.append("written")
+        return f"{out}.pdf"
+
+    def extract_pdf_text(self, path):
+        """Stand-in for SciHubator.extract_pdf_text"""
+        with open(path, encoding="utf-8") as file:
+            text = file.read()
+        if text[len("Text of "):] in self.failingPDFs:
+            raise ValueError("broken PDF")
+        return text
+
+    def send(self, DOIs):
+        self.widget.DOIs = DOIs
+        self.widget.sendData()
+        self.assertTrue(QTest.qWaitFor(lambda: self.widget._task is None))
+        return self.widget.infoBox.stateLabel.text()
+
+    def output(self):
+        return [
+            (myInput[0].annotations["DOI"], myInput[0].get_content())
+            for myInput in self.widget.createdInputs
+        ]
+
+    def test_doi_order(self):
+        """ Test that results keep DOI order whatever the download order"""
+        DOIs = ["10.1000/%i" % idx for idx in range(5)]
+        for idx, DOI in enumerate(DOIs):
+            self.delays[DOI] = 0.02 * (len(DOIs) - idx)
+        message = self.send(DOIs)
+        self.assertIn("5 segments sent to output", message)
+        self.assertEqual(
+            self.output(), [(DOI, "Text of " + DOI) for DOI in DOIs]
+        )
+
+    def test_duplicate_dois(self):
+        """ Test that each occurrence of a DOI gets its segment"""
+        DOIs = ["10.1000/a", "10.1000/b", "10.1000/a"]
+        self.send(DOIs)
+        self.assertEqual(
+            self.output(), [(DOI, "Text of " + DOI) for DOI in DOIs]
+        )
+
+    def test_partial_failure(self):
+        """ Test that failed DOIs are skipped and reported"""
+        DOIs = ["10.1000/%i" % idx for idx in range(4)]
+        self.failingDownloads.add(DOIs[1])
+        self.failingPDFs.add(DOIs[2])
+        message = self.send(DOIs)
+        self.assertEqual(
+            self.output(),
+            [(DOI, "Text of " + DOI) for DOI in (DOIs[0], DOIs[3])],
+        )
+        self.assertEqual(
+            self.widget.failedDOIs,
+            [
+                (DOIs[1], "download: no PDF found"),
+                (DOIs[2], "PDF: broken PDF"),
+            ],
+        )
+        self.assertIn("2 segments sent to output", message)
+        self.assertIn("10.1000/1 (download: no PDF found)", message)
+        self.assertIn("10.1000/2 (PDF: broken PDF)", message)
+
+    def test_all_failing(self):
+        """ Test that the error reports why each DOI failed"""
+        DOIs = ["10.1000/0", "10.1000/1"]
+        self.failingDownloads.add(DOIs[0])
+        self.failingPDFs.add(DOIs[1])
+        message = self.send(DOIs)
+        self.assertEqual(self.output(), [])
+        self.assertIn("No PDF could be downloaded and parsed", message)
+        self.assertIn("10.1000/0 (download: no PDF found)", message)
+        self.assertIn("10.1000/1 (PDF: broken PDF)", message)
+
+    def test_cancel(self):
+        """ Test that cancelling skips queued downloads and removes the
+        download directory only after running downloads are done"""
+        started = list()
+        removeTree = shutil.rmtree
+
+        def download_pdf(DOI, out):
+            with self.lock:
+                started.append(out)
+                rank = len(started)
+            # Wait for the cancel, then finish the downloads one by one...
+            deadline = time.time() + 5
+            while not self.widget.cancel_operation and time.time() < deadline:
+                time.sleep(0.01)
+            time.sleep(0.1 * rank)
+            return self.download_pdf(DOI, out)
+
+        def rmtree(path, **kwargs):
+            with self.lock:
+                self.events.append("removed")
+            removeTree(path, **kwargs)
+
+        DOIs = ["10.1000/%i" % idx for idx in range(6)]
+        with patch.object(sh, "download_pdf", download_pdf), \
+                patch.object(sh.shutil, "rmtree", rmtree):
+            self.widget.DOIs = DOIs
+            self.widget.sendData()
+            self.assertTrue(QTest.qWaitFor(
+                lambda: len(started) == self.widget.downloadWorkers
+            ))
+            self.widget.cancel_manually()
+        self.assertTrue(QTest.qWaitFor(
+            lambda: not self.widget.sendButton.cancelButton.isEnabled()
+        ))
+        self.assertEqual(len(started), self.widget.downloadWorkers)
+        self.assertEqual(
+            self.events, ["written"] * self.widget.downloadWorkers
+            + ["removed"]
+        )
+        self.assertFalse(os.path.exists(os.path.dirname(started[0])))
+        self.assertEqual(self.widget.createdInputs, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+"""
+A collection of tests for the Scratodon widget.
+
+Mastodon API responses are served by a local stand-in for the Mastodon
+client, which pages through an account's statuses the way the API does
+(max_id and since_id are exclusive, newest statuses first).
+"""
+
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from Orange.widgets.tests.base import GuiTest
+
+from orangecontrib.textable_prototypes.widgets.Scratodon import Scratodon
+
+DOMAIN = "https://example.social/"
+
+
+def make_status(status_id, likes=0):
+    return SimpleNamespace(
+        id=status_id,
+        favourites_count=likes,
+        reblogs_count=0,
+        reblog=None,
+        in_reply_to_id=None,
+        media_attachments=[],
+    )
+
+
+class ReplayMastodon:
+    """Stand-in for a Mastodon client serving one account's statuses"""
+
+    def __init__(self, numStatuses):
+        self.statuses = [make_status(i) for i in range(numStatuses, 0, -1)]
+        self.requests = list()
+
+    def post(self, count=1):
+        """Publish count new statuses"""
+        first = self.statuses[0].id + 1
+        self.statuses[:0] = [
+            make_status(i) for i in range(first + count - 1, first - 1, -1)
+        ]
+
+    def account_lookup(self, user):
+        return SimpleNamespace(id=1)
+
+    def account_statuses(self, user_id, max_id=None, since_id=None,
+                         limit=40, **filters):
+        self.requests.append((max_id, since_id))
+        page = [
+            status for status in self.statuses
+            if (max_id is None or status.id < max_id)
+            and (since_id is None or status.id > since_id)
+        ]
+        return page[:limit]
+
+
+class ScratodonTests(GuiTest):
+
+    def setUp(self):
+        """ Prepare some values to make tests"""
+        self.folder = tempfile.TemporaryDirectory()
+        self.cachePatch = patch.object(
+            Scratodon, "cachedFoldername", self.folder.name
+        )
+        self.cachePatch.start()
+        self.widget = Scratodon()
+        self.client = ReplayMastodon(150)
+        self.widget.clients[DOMAIN] = self.client
+
+    def tearDown(self):
+        self.widget.onDeleteWidget()
+        self.widget.deleteLater()
+        self.cachePatch.stop()
+        self.folder.cleanup()
+
+    def fetch(self, n=100, refresh=False):
+        posts = self.widget.fetchUserPosts(
+            "user@example.social", n, refresh=refresh
+        )
+        return [post.id for post in posts]
+
+    def test_max_id_pagination(self):
+        """ Test that pages follow each other without gaps or overlaps"""
+        self.assertEqual(self.fetch(), list(range(150, 50, -1)))
+        self.assertEqual(
+            self.client.requests, [(None, None), (111, None), (71, None)]
+        )
+
+    def test_since_id_merging(self):
+        """ Test that only newer statuses are fetched on later sends"""
+        self.fetch()
+        self.client.post(5)
+        self.client.requests = list()
+        self.assertEqual(self.fetch(), list(range(155, 55, -1)))
+        self.assertEqual(
+            self.client.requests, [(None, 150), (151, 150)]
+        )
+
+    def test_since_id_gap(self):
+        """ Test that saved statuses are dropped when enough are newer"""
+        self.fetch(n=20)
+        self.client.post(30)
+        self.assertEqual(self.fetch(n=20), list(range(180, 160, -1)))
+
+    def test_older_statuses(self):
+        """ Test that older statuses are fetched when more are needed"""
+        self.fetch(n=20)
+        self.client.requests = list()
+        self.assertEqual(self.fetch(n=60), list(range(150, 90, -1)))
+        self.assertEqual(
+            self.client.requests, [(None, 150), (131, None)]
+        )
+
+    def test_exhausted(self):
+        """ Test that an exhausted account isn't paged through again"""
+        self.client = ReplayMastodon(30)
+        self.widget.clients[DOMAIN] = self.client
+        self.assertEqual(len(self.fetch()), 30)
+        self.client.requests = list()
+        self.assertEqual(len(self.fetch()), 30)
+        self.assertEqual(self.client.requests, [(None, 30)])
+
+    def test_refresh_counts(self):
+        """ Test that count filters see current like counts"""
+        self.fetch()
+        self.client.statuses[10].favourites_count = 5
+        self.widget.minLikes = 5
+        posts = self.widget.fetchUserPosts(
+            "user@example.social", 100, refresh=True
+        )
+        self.assertEqual(
+            [post.id for post in self.widget.filterPosts(posts)], [140]
+        )
+
+    def test_cancelled(self):
+        """ Test that a cancelled fetch returns None"""
+        self.widget.cancel_operation = True
+        self.assertIsNone(
+            self.widget.fetchUserPosts("user@example.social", 100)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
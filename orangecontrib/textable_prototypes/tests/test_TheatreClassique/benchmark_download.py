@@ -0,0 +1,130 @@
+"""
+Benchmark of the play download of the Theatre Classique widget against a
+local fixture server that serves XML-TEI files (with an ETag) after a fixed
+latency.
+
+Compares the former download (serial urlopen) with sendData on a cold disk
+cache, with revalidation of the disk cache (304 responses) and with plays
+already validated during the widget's session. Run with:
+
+    python benchmark_download.py [number of plays] [latency in ms]
+"""
+
+import importlib
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from AnyQt.QtWidgets import QApplication
+
+tc = importlib.import_module(
+    "orangecontrib.textable_prototypes.widgets.TheatreClassique"
+)
+
+PLAY = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n<TEI><teiHeader><title>%s'
+    '</title></teiHeader><text><body>%s</body></text></TEI>'
+)
+VERSE = "<l>Vers %i de la pièce, en alexandrins bien comptés.</l>\n"
+
+
+def make_server(latency):
+    """Start a local server that answers every request with an XML-TEI file
+    (or 304 if it was revalidated) after latency seconds and return it"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            etag = '"%s"' % self.path
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = (PLAY % (
+                self.path, "".join(VERSE % idx for idx in range(2500))
+            )).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_widget(base, numPlays):
+    """Create a widget whose catalogue lists numPlays plays of the fixture
+    server, all of them selected"""
+    widget = tc.TheatreClassique()
+    widget.document_base_url = base
+    widget.catalogue = widget.buildCatalogue([
+        {
+            "title": "Piece %04i" % idx,
+            "author": "Auteur %i" % (idx % 50),
+            "year": str(1600 + idx % 200),
+            "genre": "Tragedie",
+            "url": "documents/PIECE%04i.xml" % idx,
+        }
+        for idx in range(numPlays)
+    ])
+    widget.updateFilterValueList()
+    widget.selectedTitles = list(range(numPlays))
+    return widget
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main(numPlays=300, latency=50):
+    app = QApplication.instance() or QApplication(sys.argv)
+    server = make_server(latency / 1000)
+    base = "http://127.0.0.1:%i/pages/" % server.server_port
+    urls = ["documents/PIECE%04i.xml" % idx for idx in range(numPlays)]
+
+    duration = timed(lambda: [
+        urllib.request.urlopen(base + url).read().decode("utf-8")
+        for url in urls
+    ])
+    print("%i plays, former serial urlopen: %.2f s" % (numPlays, duration))
+
+    with tempfile.TemporaryDirectory() as folder, patch.object(
+        tc.TheatreClassique,
+        "cachedFoldername",
+        os.path.join(folder, "plays"),
+    ):
+        widget = make_widget(base, numPlays)
+        duration = timed(widget.sendData)
+        assert len(widget.segmentation) == numPlays
+        print("%i plays, cold disk cache: %.2f s" % (numPlays, duration))
+        print("%i plays, same widget session: %.2f s" % (
+            numPlays, timed(widget.sendData)
+        ))
+        widget.onDeleteWidget()
+        widget.deleteLater()
+
+        widget = make_widget(base, numPlays)
+        print("%i plays, revalidated disk cache (304): %.2f s" % (
+            numPlays, timed(widget.sendData)
+        ))
+        widget.onDeleteWidget()
+        widget.deleteLater()
+    server.shutdown()
+    app.processEvents()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
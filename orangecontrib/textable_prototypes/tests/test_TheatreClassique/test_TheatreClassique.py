@@ -0,0 +1,144 @@
+"""
+A collection of tests for the Theatre Classique widget.
+
+The streaming title table parser is checked against the original LTTL
+Segmenter pipeline, which is kept here as a correctness oracle.
+Refreshing the title list is run with stand-ins for the website.
+"""
+
+import importlib
+import re
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from AnyQt.QtTest import QTest
+from Orange.widgets.tests.base import GuiTest
+
+import LTTL.Segmenter as Segmenter
+from LTTL.Input import Input
+
+tc = importlib.import_module(
+    "orangecontrib.textable_prototypes.widgets.TheatreClassique"
+)
+
+ASSETS_DIR = Path(__file__).parent / 'assets'
+
+
+def segmenter_title_records(base_html):
+    """Extract title records with the original Segmenter pipeline"""
+    recoded_seg, _ = Segmenter.recode(Input(base_html), remove_accents=True)
+    table_seg = Segmenter.import_xml(
+        segmentation=recoded_seg,
+        element="table",
+        conditions={"id": re.compile(r"^table_AA$")},
+    )
+    line_seg = Segmenter.import_xml(segmentation=table_seg, element="tr")
+    field_regex = re.compile(
+        r"^\s*<td>\s*<a.+?>(.+?)</a>\s*</td>\s*"
+        r"<td>(.+?)</td>\s*"
+        r"<td.+?>\s*<a.+?>\s*(\d+?)\s*</a>\s*</td>\s*"
+        r"<td.+?>\s*(.+?)\s*</td>\s*"
+        r"<td.+?>\s*<a\s+.+?t=\.{2}/(.+?)'>\s*HTML"
+    )
+    title_seg = Segmenter.tokenize(
+        segmentation=line_seg,
+        regexes=[
+            (field_regex, "tokenize", {"author": "&1"}),
+            (field_regex, "tokenize", {"title": "&2"}),
+            (field_regex, "tokenize", {"year": "&3"}),
+            (field_regex, "tokenize", {"genre": "&4"}),
+            (field_regex, "tokenize", {"url": "&5"}),
+        ],
+        import_annotations=False,
+        merge_duplicates=True,
+    )
+    return [segment.annotations for segment in title_seg]
+
+
+class TheatreClassiqueTests(unittest.TestCase):
+
+    def setUp(self):
+        """ Prepare some values to make tests"""
+        self.page = Path(
+            ASSETS_DIR, 'theatre_classique_edition.html'
+        ).read_bytes()
+        self.expected = segmenter_title_records(
+            self.page.decode('iso-8859-1')
+        )
+
+    def chunks(self, size):
+        return (
+            self.page[i:i+size] for i in range(0, len(self.page), size)
+        )
+
+    def test_parse_title_table(self):
+        """ Test the parser against the Segmenter pipeline"""
+        records = tc.parse_title_table(self.chunks(len(self.page)))
+        self.assertTrue(records)
+        self.assertEqual(records, self.expected)
+
+    def test_parse_title_table_chunked(self):
+        """ Test that chunk boundaries don't change the records"""
+        for size in (1, 7, 1024):
+            self.assertEqual(
+                tc.parse_title_table(self.chunks(size)), self.expected
+            )
+
+    def test_remove_accents(self):
+        self.assertEqual(tc.remove_accents("Molière, Bérénice"),
+                         "Moliere, Berenice")
+
+
+class TheatreClassiqueRefreshTests(GuiTest):
+
+    def setUp(self):
+        self.widget = tc.TheatreClassique()
+
+    def tearDown(self):
+        self.widget.onDeleteWidget()
+        self.widget.deleteLater()
+
+    def refresh(self, getTitleList):
+        with patch.object(
+            tc.TheatreClassique, "getTitleListFromTheatreClassique",
+            getTitleList,
+        ):
+            self.widget.refreshTitleSeg()
+            self.assertFalse(self.widget.titleListbox.isEnabled())
+            self.assertTrue(QTest.qWaitFor(lambda: self.widget._task is None))
+        self.assertTrue(self.widget.titleListbox.isEnabled())
+        return self.widget.infoBox.stateLabel.text()
+
+    def test_refresh_failure(self):
+        """ Test the message shown when the website can't be accessed"""
+        message = self.refresh(lambda widget: None)
+        self.assertIn("Couldn't access theatre-classique website.", message)
+
+    def test_refresh_cancelled(self):
+        """ Test the message shown when the refresh stops on cancel"""
+        def getTitleList(widget):
+            widget.cancel_operation = True
+            return None
+        message = self.refresh(getTitleList)
+        self.assertIn("Operation cancelled.", message)
+
+    def test_cancel_refresh(self):
+        """ Test that the GUI is restored when a refresh is cancelled"""
+        release = threading.Event()
+        with patch.object(
+            tc.TheatreClassique, "getTitleListFromTheatreClassique",
+            lambda widget: release.wait(5),
+        ):
+            self.widget.refreshTitleSeg()
+            self.assertTrue(self.widget.sendButton.cancelButton.isEnabled())
+            # Cancelling waits for the worker thread to return...
+            release.set()
+            self.widget.cancel_manually()
+        self.assertTrue(QTest.qWaitFor(self.widget.titleListbox.isEnabled))
+        self.assertTrue(self.widget.controlArea.isEnabled())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+"""
+A collection of tests for the Transletto widget.
+
+Translation services are replaced by a local stand-in translator that
+translates from a fixed glossary and can be told to fail.
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import requests
+from deep_translator import exceptions as dt_exceptions
+from AnyQt.QtTest import QTest
+from Orange.widgets.tests.base import GuiTest
+
+import LTTL.Segmenter as Segmenter
+from LTTL.Input import Input
+
+from orangecontrib.textable_prototypes.widgets.transletto import Transletto
+
+GLOSSARY = {
+    "Good morning.": "Bonjour.",
+    "Thank you.": "Merci.",
+    "See you soon.": "A bientôt.",
+}
+
+
+class StandInTranslator:
+    """Stand-in for a deep_translator client. Errors queued in failures[text]
+    are raised (in order) before that text gets translated."""
+
+    def __init__(self):
+        self.calls = list()
+        self.failures = dict()
+        self.lock = threading.Lock()
+
+    def translate(self, text):
+        with self.lock:
+            self.calls.append(text)
+            pending = self.failures.get(text)
+            if pending:
+                raise pending.pop(0)
+        return GLOSSARY[text]
+
+
+class TranslettoTests(GuiTest):
+
+    def setUp(self):
+        """ Prepare some values to make tests"""
+        self.folder = tempfile.TemporaryDirectory()
+        self.memoryPatch = patch.object(
+            Transletto,
+            "memoryFilename",
+            os.path.join(self.folder.name, "memory.sqlite"),
+        )
+        self.memoryPatch.start()
+        self.sleepPatch = patch(
+            "orangecontrib.textable_prototypes.widgets.transletto.time.sleep"
+        )
+        self.sleep = self.sleepPatch.start()
+        self.widget = Transletto()
+        self.translator = StandInTranslator()
+        self.widget.threadTranslator = lambda source, target: self.translator
+        self.inputs = [Input(text) for text in GLOSSARY]
+        self.widget.inputSegmentation = Segmenter.concatenate(
+            self.inputs, import_labels_as=None,
+        )
+
+    def tearDown(self):
+        self.widget.onDeleteWidget()
+        self.widget.deleteLater()
+        self.sleepPatch.stop()
+        self.memoryPatch.stop()
+        self.folder.cleanup()
+
+    def contents(self, segmentation):
+        return [segment.get_content() for segment in segmentation]
+
+    def test_translate(self):
+        """ Test that texts are translated once and then read from memory"""
+        result = self.widget.processData()
+        self.assertEqual(self.contents(result), list(GLOSSARY.values()))
+        self.assertEqual(sorted(self.translator.calls), sorted(GLOSSARY))
+        self.widget.processData()
+        self.assertEqual(len(self.translator.calls), len(GLOSSARY))
+
+    def test_repeated_texts(self):
+        """ Test that repeated texts are translated once and keep one sorted,
+        non-overlapping segment per occurrence"""
+        texts = ["Thank you.", "Good morning.", "Thank you."]
+        self.widget.inputSegmentation = Segmenter.concatenate(
+            [Input(text) for text in texts], import_labels_as=None,
+        )
+        result = self.widget.processData()
+        self.assertEqual(
+            self.contents(result), [GLOSSARY[text] for text in texts]
+        )
+        self.assertEqual(self.translator.calls.count("Thank you."), 1)
+        spans = [(segment.start, segment.end) for segment in result]
+        self.assertEqual(spans, sorted(spans))
+        for (_, end), (start, _) in zip(spans, spans[1:]):
+            self.assertLessEqual(end, start)
+
+    def test_transient_errors_are_retried(self):
+        """ Test that rate limiting and network errors are retried"""
+        self.translator.failures["Thank you."] = [
+            dt_exceptions.TooManyRequests(),
+            requests.exceptions.ConnectionError(),
+        ]
+        result = self.widget.processData()
+        self.assertEqual(self.contents(result), list(GLOSSARY.values()))
+        self.assertEqual(self.translator.calls.count("Thank you."), 3)
+        self.assertEqual(
+            [call.args[0] for call in self.sleep.call_args_list],
+            [self.widget.retryDelay, 2 * self.widget.retryDelay],
+        )
+
+    def test_transient_errors_exhausted(self):
+        """ Test that giving up doesn't sleep after the last attempt"""
+        self.translator.failures["Thank you."] = [
+            requests.exceptions.Timeout()
+            for _ in range(self.widget.maxAttempts)
+        ]
+        result = self.widget.processData()
+        self.assertTrue(
+            result["error"].startswith("Translation failed for 1 segment ")
+        )
+        self.assertEqual(
+            self.translator.calls.count("Thank you."), self.widget.maxAttempts
+        )
+        self.assertEqual(self.sleep.call_count, self.widget.maxAttempts - 1)
+
+    def test_other_errors_fail_fast(self):
+        """ Test that other errors aren't retried and are reported"""
+        self.translator.failures["Thank you."] = [
+            dt_exceptions.ServerException(401)
+        ]
+        result = self.widget.processData()
+        self.assertIn("ERR_KEY_INVALID", result["error"])
+        self.assertEqual(self.translator.calls.count("Thank you."), 1)
+        self.sleep.assert_not_called()
+
+    def test_send_without_preserved_segments(self):
+        """ Test the report of a concatenation of whole translated Inputs"""
+        self.widget.preserveSegments = False
+        self.widget.sendData()
+        self.assertTrue(QTest.qWaitFor(lambda: self.widget._task is None))
+        numChars = sum(len(text) for text in GLOSSARY.values())
+        self.assertIn(
+            "3 segments sent to output (%i characters)." % numChars,
+            self.widget.infoBox.stateLabel.text(),
+        )
+
+    def test_is_transient(self):
+        """ Test the classification of translation errors"""
+        self.assertTrue(Transletto.isTransient(
+            dt_exceptions.ServerException(503)
+        ))
+        self.assertFalse(Transletto.isTransient(
+            dt_exceptions.ServerException(403)
+        ))
+        self.assertFalse(Transletto.isTransient(
+            dt_exceptions.LanguageNotSupportedException("xx")
+        ))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Benchmark of the Gutenberg catalogue search on a synthetic catalogue.
+
+Compares the former search query (one author per book computed in a CTE,
+then LIKE on every joined row) with search_index on the search tables built
+by build_search_index. Run with:
+
+    python benchmark_search.py [number of books]
+"""
+
+import os
+import random
+import sqlite3
+import string
+import sys
+import tempfile
+import time
+
+from orangecontrib.textable_prototypes.widgets.gutenberg import (
+    SQL_INDICES_FILENAME, SQL_SCHEMA_FILENAME, build_search_index,
+    search_index,
+)
+
+FORMER_QUERY = """
+    WITH unique_book_author AS
+    (SELECT * FROM book_authors
+    WHERE authorid IN (SELECT MAX(authorid) FROM book_authors GROUP BY bookid))
+    SELECT titles.name, authors.name, books.gutenbergbookid, languages.name
+    FROM titles
+    INNER JOIN books ON books.id = titles.bookid
+    INNER JOIN unique_book_author ON books.id = unique_book_author.bookid
+    INNER JOIN authors ON authors.id = unique_book_author.authorid
+    INNER JOIN languages ON books.languageid = languages.id
+    WHERE upper(titles.name) LIKE "%{title}%"
+    AND upper(authors.name) LIKE "%{author}%"
+    AND languages.name LIKE "%{lang}%"
+    LIMIT 200
+"""
+
+QUERIES = [("abc", ""), ("", "xyz"), ("hello", ""), ("ab_c", "")]
+
+
+def word():
+    return "".join(
+        random.choice(string.ascii_lowercase)
+        for _ in range(random.randint(3, 9))
+    )
+
+
+def make_catalogue(connection, numBooks):
+    """Fill a gutenbergpy cache with random titles and authors"""
+    with open(SQL_SCHEMA_FILENAME, "r") as file:
+        connection.executescript(file.read())
+    numAuthors = numBooks // 2
+    connection.executemany(
+        "INSERT INTO languages(name) VALUES (?)",
+        [(code,) for code in ("en", "fr", "de", "it", "es")],
+    )
+    connection.executemany(
+        "INSERT INTO authors(name) VALUES (?)",
+        [
+            (word().title() + ", " + word().title(),)
+            for _ in range(numAuthors)
+        ],
+    )
+    connection.executemany(
+        "INSERT INTO books(languageid, gutenbergbookid) VALUES (?, ?)",
+        [(random.randint(1, 5), i) for i in range(1, numBooks + 1)],
+    )
+    connection.executemany(
+        "INSERT INTO titles(name, bookid) VALUES (?, ?)",
+        [
+            (" ".join(word() for _ in range(5)).title(), i)
+            for i in range(1, numBooks + 1)
+        ],
+    )
+    connection.executemany(
+        "INSERT INTO book_authors(bookid, authorid) VALUES (?, ?)",
+        [
+            (i, random.randint(1, numAuthors))
+            for i in range(1, numBooks + 1)
+            for _ in range(random.randint(1, 2))
+        ],
+    )
+    with open(SQL_INDICES_FILENAME, "r") as file:
+        connection.executescript(file.read())
+    connection.commit()
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main(numBooks=75000):
+    random.seed(1)
+    with tempfile.TemporaryDirectory() as folder:
+        connection = sqlite3.connect(os.path.join(folder, "cache.sqlite"))
+        make_catalogue(connection, numBooks)
+        _, duration = timed(build_search_index, connection)
+        print("%i books, search tables built in %.0f ms" % (
+            numBooks, duration
+        ))
+        for title, author in QUERIES:
+            former, formerDuration = timed(
+                lambda: connection.execute(FORMER_QUERY.format(
+                    title=title, author=author, lang="",
+                )).fetchall()
+            )
+            results, duration = timed(
+                search_index, connection, title, [author]
+            )
+            print(
+                "title=%r author=%r: former query %.1f ms (%i results), "
+                "search_index %.1f ms (%i results)" % (
+                    title, author, formerDuration, len(former), duration,
+                    len(results),
+                )
+            )
+        connection.close()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
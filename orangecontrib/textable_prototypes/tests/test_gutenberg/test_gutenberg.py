@@ -0,0 +1,163 @@
+"""
+A collection of tests for the Gutenberg widget and the search of the
+Gutenberg catalogue.
+
+The catalogue is a small gutenbergpy cache built in memory
+(see benchmark_search.py for a benchmark on a large synthetic one).
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from AnyQt.QtTest import QTest
+from Orange.widgets.tests.base import GuiTest
+from gutenbergpy.gutenbergcachesettings import GutenbergCacheSettings
+
+from orangecontrib.textable_prototypes.widgets.gutenberg import (
+    SQL_SCHEMA_FILENAME, Gutenberg, build_search_index,
+    catalogue_build_time, search_index,
+)
+
+BOOKS = [
+    # (title, authors, language)
+    ("Pride and Prejudice", ["Austen, Jane"], "en"),
+    ("100% Pure", ["Doe, John"], "en"),
+    ("My_Book", ["Doe, John", "Roe, Richard"], "en"),
+    ("MyXBook", ["Smith, Anna"], "en"),
+    ("C:\\Path", ["Smith, Anna"], "en"),
+    ("Contes", ["Perrault, Charles"], "fr"),
+]
+
+
+class GutenbergSearchTests(unittest.TestCase):
+
+    def setUp(self):
+        """ Build a small catalogue and its search tables"""
+        self.connection = sqlite3.connect(":memory:")
+        with open(SQL_SCHEMA_FILENAME, "r") as file:
+            self.connection.executescript(file.read())
+        authors = sorted({a for _, names, _ in BOOKS for a in names})
+        languages = sorted({language for _, _, language in BOOKS})
+        for bookId, (title, names, language) in enumerate(BOOKS, 1):
+            self.connection.execute(
+                "INSERT INTO books(id, languageid, gutenbergbookid) "
+                "VALUES (?, ?, ?)",
+                (bookId, languages.index(language) + 1, 1000 + bookId),
+            )
+            self.connection.execute(
+                "INSERT INTO titles(name, bookid) VALUES (?, ?)",
+                (title, bookId),
+            )
+            for name in names:
+                self.connection.execute(
+                    "INSERT INTO book_authors(bookid, authorid) "
+                    "VALUES (?, ?)",
+                    (bookId, authors.index(name) + 1),
+                )
+        self.connection.executemany(
+            "INSERT INTO authors(name) VALUES (?)", [(a,) for a in authors]
+        )
+        self.connection.executemany(
+            "INSERT INTO languages(name) VALUES (?)",
+            [(language,) for language in languages],
+        )
+        build_search_index(self.connection)
+
+    def tearDown(self):
+        self.connection.close()
+
+    def titles(self, **criteria):
+        return sorted(
+            result[0] for result in search_index(self.connection, **criteria)
+        )
+
+    def test_substring(self):
+        """ Test case-insensitive substring search"""
+        self.assertEqual(self.titles(title="prejud"), ["Pride and Prejudice"])
+        self.assertEqual(self.titles(title="book"), ["MyXBook", "My_Book"])
+
+    def test_wildcards_are_literal(self):
+        """ Test that % and _ in queries are matched literally"""
+        self.assertEqual(self.titles(title="My_Book"), ["My_Book"])
+        self.assertEqual(self.titles(title="100%"), ["100% Pure"])
+        self.assertEqual(self.titles(title="0% P"), ["100% Pure"])
+        self.assertEqual(self.titles(title="C:\\Pa"), ["C:\\Path"])
+
+    def test_author_parts(self):
+        """ Test that author parts are matched in order"""
+        self.assertEqual(
+            self.titles(author=["Doe", ", John"]), ["100% Pure"]
+        )
+        self.assertEqual(self.titles(author=["John", "Doe"]), [])
+        self.assertEqual(self.titles(author=["smith"]), ["C:\\Path", "MyXBook"])
+
+    def test_language(self):
+        """ Test that languages are matched exactly"""
+        self.assertEqual(self.titles(language="fr"), ["Contes"])
+        self.assertEqual(self.titles(title="Co", language="en"), [])
+
+    def test_gutenbergpy_build_time(self):
+        """ Test that the build time of a gutenbergpy cache is recorded
+        before the search tables are added to it"""
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "cache.sqlite")
+            connection = sqlite3.connect(path)
+            self.connection.backup(connection)
+            connection.execute("DROP TABLE textable_catalogue_build")
+            connection.execute("DROP TABLE textable_search_version")
+            connection.close()
+            os.utime(path, (1000000, 1000000))
+            connection = sqlite3.connect(path)
+            build_search_index(connection)
+            connection.close()
+            self.assertGreater(os.path.getmtime(path), 1000000)
+            connection = sqlite3.connect(path)
+            self.assertEqual(catalogue_build_time(connection), 1000000)
+            connection.close()
+
+
+class GutenbergWidgetTests(GuiTest):
+
+    def setUp(self):
+        """ Point the cache to an empty folder"""
+        self.folder = tempfile.TemporaryDirectory()
+        self.cachePatch = patch.object(
+            GutenbergCacheSettings,
+            "CACHE_FILENAME",
+            os.path.join(self.folder.name, "gutenbergindex.db"),
+        )
+        self.cachePatch.start()
+        self.widget = Gutenberg()
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.widget.onDeleteWidget()
+        self.widget.deleteLater()
+        self.cachePatch.stop()
+        self.folder.cleanup()
+
+    def test_cancel_cache_generation(self):
+        """ Test that the GUI is restored when cache generation is cancelled"""
+        self.assertFalse(self.widget.queryBox.isEnabled())
+        with patch.object(
+            Gutenberg, "buildCache", lambda widget, incremental:
+                self.release.wait(5)
+        ):
+            self.widget.generate_cache()
+            self.assertFalse(self.widget.cacheBox.isEnabled())
+            # Cancelling waits for the worker thread to return...
+            self.release.set()
+            self.widget.cancel_manually()
+        self.assertTrue(QTest.qWaitFor(self.widget.cacheBox.isEnabled))
+        self.assertTrue(self.widget.cacheGenerationButton.isEnabled())
+        # No cache was generated, so searching is still impossible...
+        self.assertFalse(self.widget.queryBox.isEnabled())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -31,7 +31,6 @@ from Orange.widgets.utils.widgetpreview import WidgetPreview
 from LTTL.Segmentation import Segmentation
 from LTTL.Input import Input
 import LTTL.Segmenter as Segmenter
-import LTTL.Processor as Processor
 
 from _textable.widgets.TextableUtils import (
     OWTextableBaseWidget, VersionedSettingsHandler, pluralize,
@@ -40,11 +39,17 @@ from _textable.widgets.TextableUtils import (
 
 from PyQt5.QtWidgets import QMessageBox
 
+from bisect import bisect_left
+from html.parser import HTMLParser
+
 import urllib
 import re
+import codecs
 import inspect
 import os
 import pickle
+import requests
+import unicodedata
 
 
 class ECP(OWTextableBaseWidget):
@@ -83,6 +88,12 @@ class ECP(OWTextableBaseWidget):
 
     want_main_area = False
 
+    # Title catalogue file (in this module's directory), its format version
+    # and its columns...
+    catalogueFilename = "cached_title_list_ecp"
+    catalogueVersion = 1
+    catalogueColumns = ("title", "author", "genre", "url")
+
     def __init__(self):
         """Widget creator."""
 
@@ -91,9 +102,8 @@ class ECP(OWTextableBaseWidget):
         # Other attributes...
         self.segmentation = None
         self.createdInputs = list()
-        self.titleSeg = None
-        self.filteredTitleSeg = None
-        self.filterValues = dict()
+        self.catalogue = None
+        self.filteredRows = list()
         self.base_url =     \
           u"http://www.eighteenthcenturypoetry.org/works/#genres"
         self.document_base_url =     \
@@ -107,6 +117,7 @@ class ECP(OWTextableBaseWidget):
             widget=self.controlArea,
             master=self,
             callback=self.sendData,
+            cancelCallback=self.cancel_manually,
             infoBoxAttribute="infoBox",
             sendIfPreCallback=self.updateGUI,
         )
@@ -194,6 +205,10 @@ class ECP(OWTextableBaseWidget):
         )
         gui.separator(widget=titleBox, height=3)
 
+        # These elements are frozen while the title list is being fetched
+        # (see manageGuiVisibility)...
+        self.guiElements.extend([self.advancedSettings, filterBox, titleBox])
+
         gui.separator(widget=self.controlArea, height=3)
 
         gui.rubber(self.controlArea)
@@ -257,14 +272,14 @@ class ECP(OWTextableBaseWidget):
         try:
             for title in self.selectedTitles:
                 doc_url = self.document_base_url +  \
-                    self.filteredTitleSeg[title].annotations["url"]
+                    self.catalogue["url"][self.filteredRows[title]]
                 print(doc_url)
                 url = re.sub(r"/([^/]+)\.shtml", r"/\1/\1.xml", doc_url)
                 print(url)
                 response = urllib.request.urlopen(url)
                 xml_contents.append(response.read().decode('utf-8'))
                 source_annotations = \
-                self.filteredTitleSeg[title].annotations.copy()
+                self.rowAnnotations(self.filteredRows[title])
                 #source_annotations["url"] = source_annotations["href"]
                 #del source_annotations["href"]
                 annotations.append(source_annotations)
@@ -306,7 +321,7 @@ class ECP(OWTextableBaseWidget):
 
         # Store imported URLs as setting.
         self.importedURLs = [
-            self.filteredTitleSeg[self.selectedTitles[0]].annotations["url"]
+            self.catalogue["url"][self.filteredRows[self.selectedTitles[0]]]
         ]
 
         # Set status to OK and report data size...
@@ -329,159 +344,211 @@ class ECP(OWTextableBaseWidget):
         self.sendButton.resetSettingsChangedFlag()
 
     def getTitleSeg(self):
-        """Get title segmentation, either saved locally or online"""
+        """Get title catalogue, either saved locally or online"""
 
         # Try to open saved file in this module's directory...
-        path = os.path.dirname(
-            os.path.abspath(inspect.getfile(inspect.currentframe()))
-        )
-        try:
-            file = open(os.path.join(path, "cached_title_list_ecp"),"rb")
-            self.titleSeg = pickle.load(file)
-            file.close()
-        # Else try to load list from ECP and build new seg...
-        except IOError:
-            self.titleSeg = self.getTitleListFromECP()
-
-        # Build author and genre lists...
-        if self.titleSeg is not None:
-            self.filterValues["author"] = Processor.count_in_context(
-                units={
-                    "segmentation": self.titleSeg,
-                    "annotation_key": "author"
-                }
-            ).col_ids
-            self.filterValues["author"].sort()
-            self.filterValues["genre"] = Processor.count_in_context(
-                units={
-                    "segmentation": self.titleSeg,
-                    "annotation_key": "genre"
-                }
-            ).col_ids
-            self.filterValues["genre"].sort()
+        self.catalogue = self.loadCatalogue()
 
-        # Sort the segmentation alphabetically based on titles (nasty hack!)...
-        self.titleSeg.buffer.sort(key=lambda s: s.annotations["title"])
+        # Else try to load list from ECP and build new catalogue (in the
+        # background)...
+        if self.catalogue is None:
+            self.refreshTitleSeg()
 
         # Update title and filter value lists (only at init and on manual
         # refresh, therefore separate from self.updateGUI).
         self.updateFilterValueList()
 
     def refreshTitleSeg(self):
-        """Refresh title segmentation from website"""
-        self.titleSeg = self.getTitleListFromECP()
-        # Update title and filter value lists (only at init and on manual
-        # refresh, therefore separate from self.updateGUI).
-        self.updateFilterValueList()
-
-    def getTitleListFromECP(self):
-        """Fetch titles from the ECP website"""
-
-        self.infoBox.customMessage(
-            "Fetching data from ECP website, please wait"
+        """Refresh title catalogue from website (in a worker thread)"""
+        self.infoBox.setText(
+            "Fetching data from ECP website, please wait...",
+            "warning",
         )
+        self.progressBarInit()
+        self.threading(self.getTitleListFromECP)
 
-        # Attempt to connect to ECP...
-        try:
-            response = urllib.request.urlopen(self.base_url)
-            base_html = response.read().decode('utf-8')
-            self.infoBox.customMessage(
-                "Done fetching data from ECP website."
-            )
+    @OWTextableBaseWidget.task_decorator
+    def task_finished(self, f):
+        """All operations following the termination of a worker thread"""
+        catalogue = f.result()
 
-        # If unable to connect (somehow)...
-        except:
+        # If operation cancelled or unable to connect (somehow)...
+        if catalogue is None:
 
             # Set Info box and widget to "warning" state.
-            self.infoBox.noDataSent(
-                warning="Couldn't access ECP website."
-            )
-
-            # Empty title list box.
-            self.titleLabels = list()
-
-            # Reset output channel.
-            self.send("XML-TEI data", None)
-            return None
-
-        # Otherwise store HTML content in LTTL Input object.
-        base_html_seg = Input(base_html)
+            if self.cancel_operation:
+                self.infoBox.noDataSent(warning="Operation cancelled.")
+            else:
+                self.infoBox.noDataSent(
+                    warning="Couldn't access ECP website."
+                )
 
-        # Remove accents from the data...
-        recoded_seg, _ = Segmenter.recode(base_html_seg, remove_accents=True)
+            # Without any title list, empty title list box and reset output
+            # channel.
+            if self.catalogue is None:
+                self.titleLabels = list()
+                self.send("XML-TEI data", None)
+            return
 
-        # Extract table containing titles...
-        genresListSeg = Segmenter.import_xml(
-            segmentation=recoded_seg,
-            element="ul",
-            conditions={"id": re.compile(r"^genres-list")},
+        self.catalogue = catalogue
 
-        )
+        # Remove warning (if any)...
+        self.error(0)
+        self.warning(0)
 
-        # Extract genre annotation...
-        genreSeg = Segmenter.tokenize(
-            segmentation=genresListSeg,
-            regexes=[(re.compile(r'(?s)<a id[^>]+>(.+?)</a.+?(?=<a id|$)'), \
-            "tokenize", {"genre": "&1"})],
-            import_annotations=False,
-        )
+        # Update title and filter value lists (only at init and on manual
+        # refresh, therefore separate from self.updateGUI).
+        self.updateFilterValueList()
 
-        # Extract works...
-        titleSeg = Segmenter.tokenize(
-            segmentation=genreSeg,
-            regexes=[(re.compile(r'(?s)<li class="bibl".+?</span>'), \
-            "tokenize")],
+    def buildCatalogue(self, records):
+        """Build the title catalogue from a list of title records (dicts,
+        one per title and genre): records of the same title and author are
+        grouped with all their genres, then stored as one list per column
+        with rows sorted by title, and for each filter criterion the sorted
+        list of its values and the rows of each value"""
+        titles = dict()
+        for record in records:
+            title_id = (record["author"], record["title"])
+            if title_id not in titles:
+                titles[title_id] = dict(record, genres=set())
+            titles[title_id]["genres"].add(record["genre"])
+        records = sorted(
+            titles.values(),
+            key=lambda r: (r["title"], r["author"], r["url"]),
         )
-
-        # Extract annotations...
-        titleSeg = Segmenter.tokenize(
-            segmentation=titleSeg,
-            regexes=[
-                (
-                    re.compile(r"(?s)^.*>\n(.+?)</span>.*$"),
-                    "tokenize",
-                    {"author": "&1"}
-                ),
-                (
-                    re.compile(r'(?s)^.*href="(/works/.+?\.shtml)">.*$'),
-                    "tokenize",
-                    {"url": "&1"}
-                ),
-                (
-                    re.compile(r'(?s)^.*shtml">(.*)</a>.*$'),
-                    "tokenize",
-                    {"title": "&1"}
-                ),
-            ],
-            merge_duplicates=True,
+        for record in records:
+            record["genres"] = sorted(record["genres"])
+            record["genre"] = ", ".join(record["genres"])
+        catalogue = {"version": self.__class__.catalogueVersion}
+        for column in self.__class__.catalogueColumns + ("genres",):
+            catalogue[column] = [record[column] for record in records]
+        catalogue["index"] = {"author": dict(), "genre": dict()}
+        for row, author in enumerate(catalogue["author"]):
+            catalogue["index"]["author"].setdefault(author, list()).append(row)
+        for row, genres in enumerate(catalogue["genres"]):
+            for genre in genres:
+                catalogue["index"]["genre"].setdefault(genre, list()).append(
+                    row
+                )
+        catalogue["values"] = {
+            criterion: sorted(index)
+            for criterion, index in catalogue["index"].items()
+        }
+        catalogue["urlIndex"] = {
+            url: row for row, url in enumerate(catalogue["url"])
+        }
+        return catalogue
+
+    def catalogueRecords(self, catalogue):
+        """Return the title records of a catalogue (of any version) or of a
+        title segmentation (as saved by earlier versions)"""
+        if isinstance(catalogue, dict):
+            return [
+                dict(zip(self.__class__.catalogueColumns, values), genre=genre)
+                for values, genres in zip(
+                    zip(*(
+                        catalogue[column]
+                        for column in self.__class__.catalogueColumns
+                    )),
+                    catalogue["genres"],
+                )
+                for genre in genres
+            ]
+        return [segment.annotations for segment in catalogue]
+
+    def cataloguePath(self):
+        """Return the path of the title catalogue file"""
+        return os.path.join(
+            os.path.dirname(
+                os.path.abspath(inspect.getfile(inspect.currentframe()))
+            ),
+            self.__class__.catalogueFilename,
         )
 
-        # Try to save list in this module"s directory for future reference...
-        path = os.path.dirname(
-            os.path.abspath(inspect.getfile(inspect.currentframe()))
-        )
+    def loadCatalogue(self):
+        """Load the saved title catalogue (None if there is none). A
+        catalogue saved in another format is converted and saved again."""
         try:
-            file = open(os.path.join(path, "cached_title_list_ecp"), "wb")
-            pickle.dump(titleSeg, file, -1)
+            file = open(self.cataloguePath(), "rb")
+            catalogue = pickle.load(file)
             file.close()
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        if (
+            isinstance(catalogue, dict) and
+            catalogue.get("version") == self.__class__.catalogueVersion
+        ):
+            return catalogue
+        catalogue = self.buildCatalogue(self.catalogueRecords(catalogue))
+        self.saveCatalogue(catalogue)
+        return catalogue
+
+    def saveCatalogue(self, catalogue):
+        """Save the title catalogue in this module's directory"""
+        path = self.cataloguePath()
+        try:
+            file = open(path + ".part", "wb")
+            pickle.dump(catalogue, file, -1)
+            file.close()
+            os.replace(path + ".part", path)
         except IOError:
             pass
 
-        # Remove warning (if any)...
-        self.error(0)
-        self.warning(0)
+    def rowAnnotations(self, row):
+        """Return the annotations (title, author, etc.) of a catalogue row"""
+        return {
+            column: self.catalogue[column][row]
+            for column in self.__class__.catalogueColumns
+        }
+
+    def getTitleListFromECP(self):
+        """Fetch titles from the ECP website and build the title catalogue
+        (run in a worker thread)"""
+        self.signal_prog.emit(1, False)
+
+        # Attempt to connect to ECP and parse the genre lists while the page
+        # is being downloaded...
+        try:
+            response = requests.get(self.base_url, stream=True, timeout=30)
+            try:
+                response.raise_for_status()
+                records = parse_genres_list(self.readChunks(response))
+            finally:
+                response.close()
+        except requests.exceptions.RequestException:
+            return None
+        if self.cancel_operation or not records:
+            return None
 
-        return titleSeg
+        # Build the catalogue and try to save it in this module"s directory
+        # for future reference...
+        catalogue = self.buildCatalogue(records)
+        self.saveCatalogue(catalogue)
+        return catalogue
+
+    def readChunks(self, response):
+        """Iterate over the chunks of a streamed response, reporting
+        progress and stopping if the operation is cancelled"""
+        total = int(response.headers.get("Content-Length") or 0)
+        done = 0
+        for chunk in response.iter_content(16384):
+            if self.cancel_operation:
+                return
+            done += len(chunk)
+            if total:
+                self.signal_prog.emit(int(100*min(done, total)/total), False)
+            yield chunk
 
     def updateFilterValueList(self):
         """Update the list of filter values"""
 
         # In Advanced settings mode, populate filter value list...
-        if self.titleSeg is not None and self.displayAdvancedSettings:
+        if self.catalogue is not None and self.displayAdvancedSettings:
             self.filterValueCombo.clear()
             self.filterValueCombo.addItem("(all)")
-            for filterValue in self.filterValues[self.filterCriterion]:
-                self.filterValueCombo.addItem(filterValue)
+            self.filterValueCombo.addItems(
+                self.catalogue["values"][self.filterCriterion]
+            )
 
         # Reset filterValue if needed...
         if self.filterValue not in [
@@ -497,82 +564,41 @@ class ECP(OWTextableBaseWidget):
     def updateTitleList(self):
         """Update the list of titles"""
 
-        # If titleSeg has not been loaded for some reason, skip.
-        if self.titleSeg is None:
+        # If catalogue has not been loaded for some reason, skip.
+        if self.catalogue is None:
             return
 
-        # In Advanced settings mode, get list of selected titles...
+        # In Advanced settings mode, get the rows of the selected titles
+        # (rows are sorted by title, and titles with several genres have
+        # been grouped in a single row)...
         if self.displayAdvancedSettings and self.filterValue != "(all)":
-            self.filteredTitleSeg, _ = Segmenter.select(
-                segmentation=self.titleSeg,
-                regex=re.compile(r"^%s$" % self.filterValue),
-                annotation_key=self.filterCriterion,
-            )
+            self.filteredRows = self.catalogue["index"][
+                self.filterCriterion
+            ].get(self.filterValue, list())
         else:
-            self.filteredTitleSeg = self.titleSeg
-
-        # If criterion is not "genre" and his filter value not "all",
-        # group titles with different genres...
+            self.filteredRows = range(len(self.catalogue["title"]))
 
-        # Create a dictionary with "author" and "title" as key...
-
-        unique_titles = dict()
-        for title in self.filteredTitleSeg:
-            title_id = (
-                title.annotations["author"],
-                title.annotations["title"],
-            )
-            try:
-                unique_titles[title_id].append(title)
-            except KeyError:
-                unique_titles[title_id] = [title]
-
-        # Create a list with new annotation comporting all genres...
-        new_title_segments = list()
-        for unique_title in unique_titles.values():
-            title_genres = list()
-            new_title_segments.append(unique_title[0])
-            title_genres.append(unique_title[0].annotations["genre"])
-            for equivalent_title in unique_title[1:]:
-                title_genres.append(equivalent_title.annotations["genre"])
-            new_title_segments[-1].annotations["genre"] = ", ".join(
-                sorted(list(set(title_genres)))
-            )
-
-        self.filteredTitleSeg = Segmentation(None)
-        self.filteredTitleSeg.extend(new_title_segments)
-
-        # Populate titleLabels list with the titles...
-        self.titleLabels = sorted(
-            [s.annotations["title"] for s in self.filteredTitleSeg]
-        )
-
-        # Add specification (author, year and genre, depending on criterion)...
-        titleLabels = self.titleLabels[:]
-        for idx, titleLabel in enumerate(titleLabels):
-            specs = list()
-            if (
-                self.displayAdvancedSettings == False or
-                self.filterCriterion != "author" or
-                self.filterValue == "(all)"
-            ):
-                specs.append(
-                    self.filteredTitleSeg[idx].annotations["author"]
-                )
+        # Populate titleLabels list with the titles and their specification
+        # (author and genre, depending on criterion)...
+        columns = [
+            column for column in ("author", "genre")
             if (
                 self.displayAdvancedSettings == False or
-                self.filterCriterion != "genre" or
+                self.filterCriterion != column or
                 self.filterValue == "(all)"
-            ):
-                specs.append(
-                    self.filteredTitleSeg[idx].annotations["genre"]
-                )
-            titleLabels[idx] = titleLabel + " (%s)" % "; ".join(specs)
-        self.titleLabels = titleLabels
+            )
+        ]
+        self.titleLabels = [
+            self.catalogue["title"][row] + " (%s)" % "; ".join(
+                self.catalogue[column][row] for column in columns
+            )
+            for row in self.filteredRows
+        ]
 
         # Reset selectedTitles if needed...
-        if not set(self.importedURLs).issubset(
-            set(u.annotations["url"] for u in self.filteredTitleSeg)
+        if not all(
+            self.isFilteredRow(self.catalogue["urlIndex"].get(url))
+            for url in self.importedURLs
         ):
             self.selectedTitles = list()
         else:
@@ -580,6 +606,13 @@ class ECP(OWTextableBaseWidget):
 
         self.sendButton.settingsChanged()
 
+    def isFilteredRow(self, row):
+        """Tell whether a catalogue row is in the filtered title list"""
+        if row is None:
+            return False
+        idx = bisect_left(self.filteredRows, row)
+        return idx < len(self.filteredRows) and self.filteredRows[idx] == row
+
     def updateGUI(self):
         """Update GUI state"""
         if self.displayAdvancedSettings:
@@ -608,11 +641,145 @@ class ECP(OWTextableBaseWidget):
             changed = title != self.captionTitle
             super().setCaption(title)
             if changed:
+                self.cancel() # Cancel current operation
                 self.sendButton.settingsChanged()
         else:
             super().setCaption(title)
 
 
+class GenresListParser(HTMLParser):
+    """Streaming parser of the genre lists of the ECP works page: each work
+    listed under a genre gives a title record (genre, author, url and
+    title)"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.records = list()
+        self.depth = 0
+        self.done = False
+        self.genre = None
+        self.genreText = None
+        self.work = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if not self.depth:
+            if tag == "ul" and (dict(attrs).get("id") or "").startswith(
+                "genres-list"
+            ):
+                self.depth = 1
+            return
+        if tag == "ul":
+            self.depth += 1
+        tag_text = self.get_starttag_text()
+        if tag == "a" and tag_text.startswith("<a id"):
+            self.genreText = list()
+            self.work = None
+        elif tag == "li" and tag_text.startswith('<li class="bibl"'):
+            if self.genre is not None:
+                self.work = {
+                    "tail": list(),
+                    "afterTag": True,
+                    "titleText": None,
+                    "title": None,
+                    "url": None,
+                }
+        elif self.work is not None:
+            self.addTag(tag_text)
+            href = dict(attrs).get("href") or ""
+            if (
+                tag == "a" and href.startswith("/works/") and
+                href.endswith(".shtml") and tag_text.endswith('">')
+            ):
+                self.work["url"] = href
+                self.work["titleText"] = list()
+
+    def handle_endtag(self, tag):
+        if self.done or not self.depth:
+            return
+        if tag == "ul":
+            self.depth -= 1
+            if not self.depth:
+                self.done = True
+                return
+        if self.genreText is not None:
+            if tag == "a":
+                self.genre = "".join(self.genreText)
+                self.genreText = None
+            else:
+                self.genreText.append("</%s>" % tag)
+        elif self.work is not None:
+            if tag == "span":
+                self.addRecord(self.work)
+                self.work = None
+                return
+            if tag == "a" and self.work["titleText"] is not None:
+                self.work["title"] = "".join(self.work["titleText"])
+            self.addTag("</%s>" % tag)
+
+    def handle_data(self, data):
+        if self.genreText is not None:
+            self.genreText.append(data)
+        elif self.work is not None:
+            # The author is what follows the last line break after a tag...
+            if self.work["afterTag"] and data.startswith("\n"):
+                self.work["tail"] = [data[1:]]
+            else:
+                self.work["tail"].append(data)
+            self.work["afterTag"] = False
+            if self.work["titleText"] is not None:
+                self.work["titleText"].append(data)
+
+    # Keep entities as they are in the page...
+    def handle_entityref(self, name):
+        self.handle_data("&%s;" % name)
+
+    def handle_charref(self, name):
+        self.handle_data("&#%s;" % name)
+
+    def addTag(self, tag_text):
+        """Add a tag to the text of the current work"""
+        self.work["tail"].append(tag_text)
+        self.work["afterTag"] = True
+        if self.work["titleText"] is not None:
+            self.work["titleText"].append(tag_text)
+
+    def addRecord(self, work):
+        """Add the title record of a work (if it is complete)"""
+        author = "".join(work["tail"])
+        if not author or work["url"] is None or work["title"] is None:
+            return
+        self.records.append({
+            "genre": remove_accents(self.genre),
+            "author": remove_accents(author),
+            "url": remove_accents(work["url"]),
+            "title": remove_accents(work["title"]),
+        })
+
+
+def parse_genres_list(chunks):
+    """Return the title records of the ECP works page, parsing it from an
+    iterable of (utf-8 encoded) chunks and stopping at the end of the genre
+    lists"""
+    parser = GenresListParser()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        if parser.done:
+            break
+    parser.close()
+    return parser.records
+
+
+def remove_accents(text):
+    """Remove accents from a string (as Segmenter.recode does)"""
+    return "".join(
+        c for c in unicodedata.normalize("NFD", text)
+        if unicodedata.category(c) != "Mn"
+    )
+
+
 if __name__ == "__main__":
     #import sys
     #from PyQt5.QtWidgets import QApplication
@@ -29,10 +29,14 @@ import os
 import io
 import re
 import pickle
+import hashlib
 import inspect
 import zipfile
 import shutil
-import xml.etree.ElementTree as ET
+import itertools
+import multiprocessing
+import concurrent.futures
+from xml.sax.saxutils import unescape
 
 import requests
 from bs4 import BeautifulSoup
@@ -96,6 +100,8 @@ class Childes(OWTextableBaseWidget):
     baseUrl = "https://childes.talkbank.org/data-xml/"
     cacheFilename = "cache_childes"
     cachedFoldername = "cached_childes_corpora"
+    parsedFoldername = "cached_childes_parses"
+    parseCacheVersion = 2
 
     want_main_area = False
 
@@ -113,6 +119,7 @@ class Childes(OWTextableBaseWidget):
         self.selectedInDisplayedFolder = list()
         self.selectedInSelection = list()
         self.selectionLabels = list()
+        self.parsedFiles = dict()
         
 
         # Next two instructions are helpers from TextableUtils. Corresponding
@@ -348,7 +355,7 @@ class Childes(OWTextableBaseWidget):
         # Clear created Inputs and initialize progress bar...
         self.clearCreatedInputs()
         numberOfSteps = 2 if self.outputUtterances else 1
-        numberOfSteps += 2 if self.outputWords else 0        
+        numberOfSteps += 1 if self.outputWords else 0        
         self.infoBox.setText(
             "(1/%i) Retrieving data, please wait..." % numberOfSteps, 
             "warning",
@@ -356,7 +363,8 @@ class Childes(OWTextableBaseWidget):
         self.controlArea.setDisabled(True)
         progressBar = ProgressBar(self, iterations=len(self.importedCorpora))
         
-        annotations = list()
+        records = list()
+        pool = None
 
         # Iterate over corpora...
         for importedCorpus in self.importedCorpora:
@@ -375,14 +383,18 @@ class Childes(OWTextableBaseWidget):
                         importedCorpus[len(self.__class__.baseUrl):],
                     )
                 )
-                myZip = zipfile.ZipFile(corpusFilepath)
+                zipFile = open(corpusFilepath, "rb")
+                zipContent = zipFile.read()
+                zipFile.close()
+                myZip = zipfile.ZipFile(io.BytesIO(zipContent))
 
             except IOError:                
             
                 # Else try to download (and cache) requested zip file...
                 try:    
                     response = requests.get(importedCorpus)
-                    myZip = zipfile.ZipFile(io.BytesIO(response.content))
+                    zipContent = response.content
+                    myZip = zipfile.ZipFile(io.BytesIO(zipContent))
                     corpusFolderpath = os.path.dirname(corpusFilepath)
                     try:
                         os.makedirs(corpusFolderpath)
@@ -390,7 +402,7 @@ class Childes(OWTextableBaseWidget):
                         pass
                     try:
                         outputFile = open(corpusFilepath, "wb")
-                        outputFile.write(response.content)
+                        outputFile.write(zipContent)
                         outputFile.close()
                     except IOError:
                         pass
@@ -410,89 +422,41 @@ class Childes(OWTextableBaseWidget):
                     self.send("Utterances", None)
                     progressBar.finish()
                     self.controlArea.setDisabled(False)
+                    if pool is not None:
+                        pool.shutdown()
                     return
             
-            # Create Input for each zipped file and store annotations...
-            for file in myZip.infolist():
-                file_content = myZip.read(file).decode('utf-8')
-
-                # If word segmentation is requested...
-                if self.outputWords:
-                    # Implement replacements.
-                    file_content = re.sub(
-                        r"<w.+?(<replacement.+</replacement>).*?</w>", 
-                        r"\1",
-                        file_content,
-                    )
-                    # Prepend pre-clitics.
-                    file_content, n = re.subn(
-                        r"(<mor .+?)(<mor-pre>.+</mor-pre>)", 
-                        r"\2\1",
-                        file_content,
-                    )
-                    # Move <gra> into <mw>.
-                    file_content, n = re.subn(
-                        r"(</mw>)(<gra.+?/>)", 
-                        r"\2\1",
-                        file_content,
+            # Get parsed files from cache, or parse them (in parallel
+            # worker processes if there are several)...
+            zipKey = "%s_%i_%i" % (
+                hashlib.sha1(zipContent).hexdigest(),
+                self.outputWords,
+                self.__class__.parseCacheVersion,
+            )
+            parsedFiles = self.loadParsedFiles(zipKey)
+            if parsedFiles is None:
+                if pool is None and len(myZip.infolist()) > 1:
+                    # Worker processes are spawned rather than forked from
+                    # this (multithreaded) Qt process...
+                    pool = concurrent.futures.ProcessPoolExecutor(
+                        mp_context=multiprocessing.get_context("spawn"),
                     )
-                    
-                newInput = Input(file_content, self.captionTitle + "_files")
-                self.createdInputs.append(newInput)
-                chatSeg = Segmenter.import_xml(newInput, "CHAT")
-                annotations.append(dict())
-                annotations[-1]["file_path"] = file.filename
-                for key in ["Corpus", "Lang", "PID"]:
-                    try:
-                        annotations[-1][key.lower()] =  \
-                            chatSeg[0].annotations[key]
-                    except KeyError:
-                        pass
-                participantListSeg = Segmenter.import_xml(
-                    newInput, "Participants"
-                )
-                recodedInput, _ = Segmenter.recode(
-                    participantListSeg, [
-                        (re.compile("/>"), "> </participant>")
-                    ]
-                )
-                participantSeg = Segmenter.import_xml(
-                    recodedInput, "participant"
-                )
-                targetChildData = list()
-                for participant in participantSeg:
-                    if participant.annotations["role"] != "Target_Child":
-                        continue
-                    targetChildData.append(dict())
-                    if "age" in participant.annotations:
-                        targetChildData[-1]["target_child_age"] =   \
-                            participant.annotations["age"]
-                        age_parse = re.search(
-                            r"(\d+)Y(\d+)M(\d+)D",
-                            participant.annotations["age"],
-                        )
-                        if age_parse:
-                            targetChildData[-1]["target_child_years"] =     \
-                                age_parse.group(1)
-                            months = int(age_parse.group(2))   \
-                                + 12 * int(age_parse.group(1))
-                            targetChildData[-1]["target_child_months"] =     \
-                            '%02d' % months
-                            days = int(age_parse.group(3))   \
-                                + 30 * months
-                            targetChildData[-1]["target_child_days"] =     \
-                            '%02d' % days
-                    if "id" in participant.annotations:
-                        targetChildData[-1]["target_child_id"] =   \
-                            participant.annotations["id"]
-                    if "sex" in participant.annotations:
-                        targetChildData[-1]["target_child_sex"] =   \
-                            participant.annotations["sex"]
-                if len(targetChildData) == 1:
-                    annotations[-1].update(targetChildData[0])
+                parsedFiles = self.parseZip(myZip, pool)
+                self.saveParsedFiles(zipKey, parsedFiles)
+            records.extend(parsedFiles)
                     
             progressBar.advance()
 
+        if pool is not None:
+            pool.shutdown()
+
+        # Create Input for each zipped file and store annotations...
+        annotations = list()
+        for record in records:
+            newInput = Input(record["content"], self.captionTitle + "_files")
+            self.createdInputs.append(newInput)
+            annotations.append(record["annotations"])
+
         # If there's only one file, the widget's output is the created Input...
         if len(self.createdInputs) == 1:
             self.fileSegmentation = self.createdInputs[0]
@@ -528,10 +492,22 @@ class Childes(OWTextableBaseWidget):
                 self, 
                 iterations=len(self.fileSegmentation)
             )
-            self.utteranceSegmentation = Segmenter.import_xml(
-                self.fileSegmentation,
-                "u",
-                progress_callback=progressBar.advance,
+            utteranceSegments = list()
+            for fileSegment, record in zip(self.fileSegmentation, records):
+                for start, end, attributes in record["utterances"]:
+                    utteranceAnnotations = fileSegment.annotations.copy()
+                    utteranceAnnotations.update(attributes)
+                    utteranceSegments.append(
+                        Segment(
+                            fileSegment.str_index,
+                            start,
+                            end,
+                            utteranceAnnotations,
+                        )
+                    )
+                progressBar.advance()
+            self.utteranceSegmentation = Segmentation(
+                utteranceSegments,
                 label=self.captionTitle + "_utterances",
             )
             progressBar.finish()
@@ -549,50 +525,43 @@ class Childes(OWTextableBaseWidget):
                     % (2 + (1 if self.outputUtterances else 0), numberOfSteps), 
                 "warning",
             )     
-            try:
-                baseSegmentation = self.utteranceSegmentation
-            except:
-                baseSegmentation = self.fileSegmentation            
             progressBar = ProgressBar(
                 self, 
-                iterations=2*len(baseSegmentation)
-            )
-            wordSegmentation = Segmenter.import_xml(
-                baseSegmentation,
-                "w",
-                progress_callback=progressBar.advance,
-            )
-            mwSegmentation = Segmenter.import_xml(
-                baseSegmentation,
-                "mw",
-                progress_callback=progressBar.advance,
-            )
-            
-            # Analyze words to extract annotations...
-            self.infoBox.setText(
-                "(%i/%i) Extracting word annotations, please wait..."    \
-                    % (3 + (1 if self.outputUtterances else 0), numberOfSteps), 
-                "warning",
-            )     
-            progressBar.finish()
-            progressBar = ProgressBar(
-                self, 
-                iterations=len(wordSegmentation)
+                iterations=len(self.fileSegmentation)
             )
             wordSegments = list()
-            for word in wordSegmentation:
-                mws = word.get_contained_segments(
-                    mwSegmentation
-                )
-                if mws:
-                    for mw in mws:
-                        wordSegment = word.deepcopy()
-                        wordSegment.annotations.update(
-                            self.extractWordAnnotations(mw)
+            for fileSegment, record in zip(self.fileSegmentation, records):
+                for start, end, attributes, utterance, morphemes   \
+                        in record["words"]:
+                    wordAnnotations = fileSegment.annotations.copy()
+                    if self.outputUtterances and utterance is not None:
+                        wordAnnotations.update(
+                            record["utterances"][utterance][2]
+                        )
+                    wordAnnotations.update(attributes)
+                    if not morphemes:
+                        wordSegments.append(
+                            Segment(
+                                fileSegment.str_index,
+                                start,
+                                end,
+                                wordAnnotations,
+                            )
+                        )
+                        continue
+                    for morpheme in morphemes:
+                        morphemeAnnotations = wordAnnotations.copy()
+                        morphemeAnnotations.update(
+                            self.extractWordAnnotations(morpheme)
+                        )
+                        wordSegments.append(
+                            Segment(
+                                fileSegment.str_index,
+                                start,
+                                end,
+                                morphemeAnnotations,
+                            )
                         )
-                        wordSegments.append(wordSegment) 
-                else:
-                    wordSegments.append(word)
                 progressBar.advance()
                                                     
             self.wordSegmentation = Segmentation(
@@ -616,45 +585,87 @@ class Childes(OWTextableBaseWidget):
 
         self.sendButton.resetSettingsChangedFlag()
 
-    def extractWordAnnotations(self, mw):
-        """Extract annotations from a word's mor tag in CHILDES XML format and 
-        return a dict of annotations.
+    def parseZip(self, myZip, pool=None):
+        """Parse every file in a zipped CHILDES corpus and return a list
+        of records (see parseChatFile), using a process pool if provided.
         """
-        root = ET.fromstring(
-            "<mw>" + mw.get_content() + "</mw>"
+        filenames = list()
+        fileContents = list()
+        for file in myZip.infolist():
+            filenames.append(file.filename)
+            fileContents.append(myZip.read(file).decode('utf-8'))
+        if pool is not None:
+            try:
+                return list(
+                    pool.map(
+                        parseChatFile,
+                        filenames,
+                        fileContents,
+                        itertools.repeat(self.outputWords),
+                    )
+                )
+            # Fall back on serial parsing if worker processes can't run...
+            except (OSError, RuntimeError):
+                pass
+        return [
+            parseChatFile(filename, fileContent, self.outputWords)
+            for filename, fileContent in zip(filenames, fileContents)
+        ]
+
+    def loadParsedFiles(self, zipKey):
+        """Retrieve parsed files from memory or disk cache (or None)"""
+        try:
+            return self.parsedFiles[zipKey]
+        except KeyError:
+            pass
+        path = os.path.dirname(
+            os.path.abspath(inspect.getfile(inspect.currentframe()))
         )
-        annotations = dict()
-        pos_items = list()
-        prefixes = list()
-        suffixes = list()
-        for child in root:
-            if child.tag == "pos":
-                for grandchild in child:
-                    if grandchild.tag == "c":
-                        pos_items.insert(0, grandchild.text)
-                    else:
-                        pos_items.append(grandchild.text)
-            elif child.tag == "stem":
-                stem = child.text
-            elif child.tag == "mpfx":
-                prefixes.append(child.text)
-            elif child.tag == "mk":
-                if child.attrib["type"] == "sfxf":
-                    suffixes.append("&" + child.text)
-                elif child.attrib["type"] == "sfx":
-                    suffixes.append("-" + child.text)
-                elif child.attrib["type"] == "mc":
-                    suffixes.append(":" + child.text)
-            elif child.tag == "gra":
-                for key in ["index", "head", "relation"]:
-                    annotations[key] = child.attrib[key]
-        annotations["pos"] = ":".join(pos_items)
-        if prefixes:
-            annotations["prefixes"] = "#".join(prefixes)               
+        try:
+            file = open(
+                os.path.join(path, self.__class__.parsedFoldername, zipKey),
+                "rb",
+            )
+            parsedFiles = pickle.load(file)
+            file.close()
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        self.parsedFiles[zipKey] = parsedFiles
+        return parsedFiles
+
+    def saveParsedFiles(self, zipKey, parsedFiles):
+        """Store parsed files in memory and disk cache"""
+        self.parsedFiles[zipKey] = parsedFiles
+        path = os.path.join(
+            os.path.dirname(
+                os.path.abspath(inspect.getfile(inspect.currentframe()))
+            ),
+            self.__class__.parsedFoldername,
+        )
+        try:
+            os.makedirs(path)
+        except OSError:
+            pass
+        try:
+            file = open(os.path.join(path, zipKey), "wb")
+            pickle.dump(parsedFiles, file, -1)
+            file.close()
+        except IOError:
+            pass
+
+    def extractWordAnnotations(self, morpheme):
+        """Build a word's annotations from the content of one of its mw tags
+        (as parsed by parseChatFile) and return a dict of annotations.
+        """
+        annotations = dict(morpheme["gra"])
+        annotations["pos"] = ":".join(morpheme["pos"])
+        stem = morpheme["stem"]
+        if morpheme["prefixes"]:
+            annotations["prefixes"] = "#".join(morpheme["prefixes"])
             if self.includePrefixes:
                 stem = annotations["prefixes"] + "#" + stem
-        if suffixes:
-            annotations["suffixes"] = "".join(suffixes)               
+        if morpheme["suffixes"]:
+            annotations["suffixes"] = "".join(morpheme["suffixes"])
         if self.includePOSTag:
             stem = annotations["pos"] + "|" + stem
         annotations["stem"] = stem
@@ -944,6 +955,195 @@ class Childes(OWTextableBaseWidget):
             super().setCaption(title)
 
 
+tagRegex = re.compile(r"<(/?)([\w:.-]+)([^>]*?)(/?)>")
+attributeRegex = re.compile(r'([\w:.-]+)\s*=\s*"([^"]*)"')
+suffixMarkers = {"sfxf": "&", "sfx": "-", "mc": ":"}
+
+
+def parseChatFile(filename, file_content, outputWords=False):
+    """Parse a file in CHILDES XML format in a single pass and return a
+    record with its (possibly rewritten) content, its annotations and the
+    offsets of its utterances (and of its words, with the parsed content of
+    their mw tags, if outputWords is True). Defined at module level so that
+    it can run in worker processes.
+    """
+
+    # If word segmentation is requested...
+    if outputWords:
+        # Implement replacements.
+        file_content = re.sub(
+            r"<w.+?(<replacement.+</replacement>).*?</w>", 
+            r"\1",
+            file_content,
+        )
+        # Prepend pre-clitics.
+        file_content, n = re.subn(
+            r"(<mor .+?)(<mor-pre>.+</mor-pre>)", 
+            r"\2\1",
+            file_content,
+        )
+        # Move <gra> into <mw>.
+        file_content, n = re.subn(
+            r"(</mw>)(<gra.+?/>)", 
+            r"\2\1",
+            file_content,
+        )
+
+    annotations = dict()
+    annotations["file_path"] = filename
+    targetChildData = list()
+    spans = {"u": list(), "w": list(), "mw": list()}
+    openElements = {"u": list(), "w": list(), "mw": list()}
+    morphemes = list()
+    morphemeTag = None
+    chatHeaderFound = False
+    for match in tagRegex.finditer(file_content):
+        closing, name, attributes, selfClosing = match.groups()
+
+        # Content of mw tags (pos, stem, prefixes, suffixes and gra)...
+        if openElements["mw"] and name != "mw":
+            morpheme = morphemes[-1]
+            if name == "gra" and not closing:
+                attributes = dict(attributeRegex.findall(attributes))
+                for key in ["index", "head", "relation"]:
+                    if key in attributes:
+                        morpheme["gra"][key] = attributes[key]
+            elif name in ("c", "s", "stem", "mpfx", "mk"):
+                if not closing:
+                    morphemeTag = (
+                        name,
+                        match.end(),
+                        dict(attributeRegex.findall(attributes)),
+                    )
+                elif morphemeTag is not None and morphemeTag[0] == name:
+                    text = unescape(
+                        file_content[morphemeTag[1]:match.start()],
+                        {"&quot;": '"', "&apos;": "'"},
+                    )
+                    if name == "c":
+                        morpheme["pos"].insert(0, text)
+                    elif name == "s":
+                        morpheme["pos"].append(text)
+                    elif name == "stem":
+                        morpheme["stem"] = text
+                    elif name == "mpfx":
+                        morpheme["prefixes"].append(text)
+                    elif morphemeTag[2].get("type") in suffixMarkers:
+                        morpheme["suffixes"].append(
+                            suffixMarkers[morphemeTag[2]["type"]] + text
+                        )
+                    morphemeTag = None
+            continue
+
+        # File metadata...
+        if name == "CHAT" and not closing and not chatHeaderFound:
+            chatHeaderFound = True
+            attributes = dict(attributeRegex.findall(attributes))
+            for key in ["Corpus", "Lang", "PID"]:
+                try:
+                    annotations[key.lower()] = attributes[key]
+                except KeyError:
+                    pass
+            continue
+
+        # Target child data...
+        if name == "participant" and not closing:
+            participant = dict(attributeRegex.findall(attributes))
+            if participant.get("role") != "Target_Child":
+                continue
+            targetChildData.append(dict())
+            if "age" in participant:
+                targetChildData[-1]["target_child_age"] =   \
+                    participant["age"]
+                age_parse = re.search(
+                    r"(\d+)Y(\d+)M(\d+)D",
+                    participant["age"],
+                )
+                if age_parse:
+                    targetChildData[-1]["target_child_years"] =     \
+                        age_parse.group(1)
+                    months = int(age_parse.group(2))   \
+                        + 12 * int(age_parse.group(1))
+                    targetChildData[-1]["target_child_months"] =     \
+                    '%02d' % months
+                    days = int(age_parse.group(3))   \
+                        + 30 * months
+                    targetChildData[-1]["target_child_days"] =     \
+                    '%02d' % days
+            if "id" in participant:
+                targetChildData[-1]["target_child_id"] =   \
+                    participant["id"]
+            if "sex" in participant:
+                targetChildData[-1]["target_child_sex"] =   \
+                    participant["sex"]
+            continue
+
+        # Utterances, words and mw's...
+        if name not in spans or selfClosing:
+            continue
+        if closing:
+            if openElements[name]:
+                start, attributes = openElements[name].pop()
+                if name == "mw":
+                    attributes = morphemes.pop()
+                spans[name].append((start, match.start(), attributes))
+        else:
+            if name == "mw":
+                morphemes.append(
+                    {
+                        "pos": list(),
+                        "stem": "",
+                        "prefixes": list(),
+                        "suffixes": list(),
+                        "gra": dict(),
+                    }
+                )
+            openElements[name].append(
+                (match.end(), dict(attributeRegex.findall(attributes)))
+            )
+    if len(targetChildData) == 1:
+        annotations.update(targetChildData[0])
+
+    record = dict()
+    record["content"] = file_content
+    record["annotations"] = annotations
+    record["utterances"] = sorted(spans["u"], key=lambda span: span[0])
+    if outputWords:
+
+        # Store the index of the utterance containing each word and align
+        # words with the mw's they contain (both sorted by start position)
+        # in a single merge-join pass...
+        words = list()
+        utterances = record["utterances"]
+        mws = sorted(spans["mw"], key=lambda span: span[0])
+        utteranceIdx = 0
+        mwIdx = 0
+        for start, end, attributes in sorted(
+            spans["w"], key=lambda span: span[0]
+        ):
+            while(
+                utteranceIdx < len(utterances)
+                and utterances[utteranceIdx][1] < end
+            ):
+                utteranceIdx += 1
+            if(
+                utteranceIdx < len(utterances)
+                and utterances[utteranceIdx][0] <= start
+            ):
+                utterance = utteranceIdx
+            else:
+                utterance = None
+            while mwIdx < len(mws) and mws[mwIdx][0] < start:
+                mwIdx += 1
+            wordMorphemes = list()
+            while mwIdx < len(mws) and mws[mwIdx][1] <= end:
+                wordMorphemes.append(mws[mwIdx][2])
+                mwIdx += 1
+            words.append((start, end, attributes, utterance, wordMorphemes))
+        record["words"] = words
+    return record
+
+
 if __name__ == "__main__":
     #import sys
     #from PyQt5.QtWidgets import QApplication
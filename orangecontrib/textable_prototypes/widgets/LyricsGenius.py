@@ -31,14 +31,14 @@ from LTTL.Segmentation import Segmentation
 import LTTL.Segmenter as Segmenter
 from LTTL.Input import Input
 
-import urllib
-import urllib.request
-import urllib.parse
-import json
+import codecs
+import hashlib
+import inspect
+import os
+import pickle
 import requests
-from urllib import request
-from urllib import parse
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html.parser import HTMLParser
 
 from _textable.widgets.TextableUtils import (
     OWTextableBaseWidget, VersionedSettingsHandler, pluralize,
@@ -82,11 +82,32 @@ class LyricsGenius(OWTextableBaseWidget):
     autoSend = settings.Setting(True)
     myBasket = settings.Setting([])
 
+    # Disk cache of extracted lyrics (one file per song path)...
+    cachedFoldername = "cached_genius_lyrics"
+    cacheVersion = 1
+
+    # Max number of concurrent requests to Genius...
+    maxWorkers = 8
+
+    # Token to use the Genius API. DO NOT CHANGE.
+    ACCESS_TOKEN = "PNlSRMxGK1NqOUBelK32gLirqAtWxPzTey" \
+                   "9pReIjzNiVKbHBrn3o59d5Zx7Yej8g"
+    USER_AGENT = "CompuServe Classic/1.22"
+
     def __init__(self):
         """Widget creator."""
 
         super().__init__()
 
+        # Session reusing connections to Genius (API and song pages)...
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=2,
+            pool_maxsize=self.__class__.maxWorkers,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
         # ATTRIBUTS
         # searchFunction
         self.searchResults = None
@@ -282,8 +303,7 @@ class LyricsGenius(OWTextableBaseWidget):
         query_string = self.newQuery
 
         if query_string != "":
-            page = 1
-            page_max = int(self.nbr_results)/10
+            page_max = int(self.nbr_results)//10
             result_id = 0
             result_artist = []
 
@@ -295,16 +315,43 @@ class LyricsGenius(OWTextableBaseWidget):
                 iterations=page_max
             )
 
-            while page <= page_max:
-                values = {'q':query_string, 'page':page}
-                data = urllib.parse.urlencode(values)
-                query_url = 'http://api.genius.com/search?' + data
-                json_obj = self.url_request(query_url)
-                body = json_obj["response"]["hits"]
-
-                # Each result is stored in a dictionnary with its title,
-                # artist's name, artist's ID and URL path
-                for result in body:
+            # Request all result pages concurrently...
+            executor = ThreadPoolExecutor(
+                max_workers=self.__class__.maxWorkers
+            )
+            futures = {
+                executor.submit(
+                    self.url_request,
+                    'http://api.genius.com/search',
+                    {'q': query_string, 'page': page},
+                ): page
+                for page in range(1, page_max+1)
+            }
+            pages = dict()
+            try:
+                for future in as_completed(futures):
+                    pages[futures[future]] = \
+                        future.result()["response"]["hits"]
+                    # 1 tick on the progress bar of the widget
+                    progressBar.advance()
+
+            # If an error occurs (e.g. http error)...
+            except (requests.exceptions.RequestException, KeyError,
+                    ValueError):
+                executor.shutdown(wait=False, cancel_futures=True)
+                self.infoBox.setText(
+                    "Couldn't search Genius website.",
+                    "error"
+                )
+                progressBar.finish()
+                self.controlArea.setDisabled(False)
+                return
+            executor.shutdown()
+
+            # Each result is stored in a dictionnary with its title,
+            # artist's name, artist's ID and URL path (in page order)
+            for page in sorted(pages):
+                for result in pages[page]:
                     result_id += 1
                     title = result["result"]["title"]
                     artist = result["result"]["primary_artist"]["name"]
@@ -313,10 +360,7 @@ class LyricsGenius(OWTextableBaseWidget):
                     result_list[result_id] = {'artist': artist,
                                               'artist_id':artist_id,
                                               'path':path, 'title':title}
-                page += 1
 
-                # 1 tick on the progress bar of the widget
-                progressBar.advance()
             # Stored the results list in the "result_list" variable
             self.searchResults = result_list
 
@@ -344,40 +388,91 @@ class LyricsGenius(OWTextableBaseWidget):
 
 
     # Function contacting the Genius API and returning JSON objects
-    def url_request(self, url):
+    def url_request(self, url, params=None):
         """Opens a URL and returns it as a JSON object"""
-
-        # Token to use the Genius API. DO NOT CHANGE.
-        ACCESS_TOKEN = "PNlSRMxGK1NqOUBelK32gLirqAtWxPzTey" \
-                       "9pReIjzNiVKbHBrn3o59d5Zx7Yej8g"
-        USER_AGENT = "CompuServe Classic/1.22"
-
-        request = urllib.request.Request(url, headers={
-            "Authorization" : "Bearer " + ACCESS_TOKEN,
-            "User-Agent" : USER_AGENT
-            })
-        response = urllib.request.urlopen(request)
-        raw = response.read().decode('utf-8')
-        json_obj = json.loads(raw)
+        response = self.session.get(
+            url,
+            params=params,
+            headers={
+                "Authorization": "Bearer " + self.__class__.ACCESS_TOKEN,
+                "User-Agent": self.__class__.USER_AGENT,
+            },
+            timeout=30,
+        )
+        response.raise_for_status()
         # retourne un objet json
-        return json_obj
+        return response.json()
 
     # Function converting HTML to string
     def html_to_text(self, page_url):
         """Extracts the lyrics (as a string) of the html page"""
-
-        page = requests.get(page_url)
-        html = BeautifulSoup(page.text, "html.parser")
-        [h.extract() for h in html('script')]
-        lyrics = ""
-        for element in html.find_all("div", class_=re.compile(r"^Lyrics__Container")):
-            lyrics_part = element.get_text()
-            lyrics = lyrics + lyrics_part
+        response = self.session.get(page_url, stream=True, timeout=30)
+        try:
+            response.raise_for_status()
+            lyrics = extract_lyrics(
+                response.iter_content(16384),
+                response.encoding or "utf-8",
+            )
+        finally:
+            response.close()
         lyrics = re.sub(r"(?<=\S)(\[|\(|[A-Z])", r" \1", lyrics)
         # return a string
         return lyrics
-        
 
+    def getLyrics(self, path):
+        """Get the lyrics of a song, from the disk cache if they have
+        already been extracted, otherwise from its Genius page (empty
+        lyrics aren't cached, so that they are extracted again next time)"""
+        cached = self.loadCachedLyrics(path)
+        if cached is not None:
+            return cached["lyrics"]
+        lyrics = self.html_to_text("http://genius.com" + path)
+        if lyrics.strip():
+            self.saveCachedLyrics(
+                path,
+                {"version": self.__class__.cacheVersion, "lyrics": lyrics},
+            )
+        return lyrics
+
+    def cachedLyricsPath(self, path):
+        """Return the path of the disk cache file for a song path"""
+        return os.path.join(
+            os.path.dirname(
+                os.path.abspath(inspect.getfile(inspect.currentframe()))
+            ),
+            self.__class__.cachedFoldername,
+            hashlib.sha1(path.encode("utf-8")).hexdigest(),
+        )
+
+    def loadCachedLyrics(self, path):
+        """Load lyrics from disk cache (None if absent, outdated or
+        empty)"""
+        try:
+            file = open(self.cachedLyricsPath(path), "rb")
+            cached = pickle.load(file)
+            file.close()
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        if cached.get("version") != self.__class__.cacheVersion:
+            return None
+        if not cached["lyrics"].strip():
+            return None
+        return cached
+
+    def saveCachedLyrics(self, path, cached):
+        """Save extracted lyrics to disk cache"""
+        cachePath = self.cachedLyricsPath(path)
+        try:
+            os.makedirs(os.path.dirname(cachePath))
+        except OSError:
+            pass
+        try:
+            file = open(cachePath + ".part", "wb")
+            pickle.dump(cached, file, -1)
+            file.close()
+            os.replace(cachePath + ".part", cachePath)
+        except IOError:
+            pass
 
     # Function clearing the results list
     def clearResults(self):
@@ -452,38 +547,46 @@ class LyricsGenius(OWTextableBaseWidget):
         # Initialize progress bar.
         progressBar = ProgressBar(
             self,
-            iterations=len(self.myBasket)
+            iterations=len(set(song['path'] for song in self.myBasket))
         )
 
-        # Attempt to connect to Genius and retrieve lyrics...
-        selectedSongs = list()
-        song_content = list()
-        annotations = list()
-        try:
-            for song in self.myBasket:
-                # song is a dict {'idx1':{'title':'song1'...},
-                # 'idx2':{'title':'song2'...}}
-                page_url = "http://genius.com" + song['path']
-                lyrics = self.html_to_text(page_url)
-                song_content.append(lyrics)
-                annotations.append(song.copy())
-                # 1 tick on the progress bar of the widget
-                progressBar.advance()
-
-        # If an error occurs (e.g. http error, or memory error)...
-        except:
+        # Attempt to connect to Genius and retrieve lyrics concurrently
+        # (from the disk cache if they have already been extracted)...
+        paths = set(song['path'] for song in self.myBasket)
+        lyrics = dict()
+        failed = set()
+        executor = ThreadPoolExecutor(max_workers=self.__class__.maxWorkers)
+        futures = {
+            executor.submit(self.getLyrics, path): path for path in paths
+        }
+        for future in as_completed(futures):
+            try:
+                lyrics[futures[future]] = future.result()
+            except requests.exceptions.RequestException:
+                failed.add(futures[future])
+            # 1 tick on the progress bar of the widget
+            progressBar.advance()
+        executor.shutdown()
+
+        # If no song could be downloaded...
+        if len(failed) == len(paths):
             # Set Info box and widget to "error" state.
             self.infoBox.setText(
                 "Couldn't download data from Genius website.",
                 "error"
             )
+            progressBar.finish()
             self.controlArea.setDisabled(False)
             return
 
         # Store downloaded lyrics strings in input objects...
-        for song in song_content:
-            newInput = Input(song, self.captionTitle)
+        annotations = list()
+        for song in self.myBasket:
+            if song['path'] in failed:
+                continue
+            newInput = Input(lyrics[song['path']], self.captionTitle)
             self.createdInputs.append(newInput)
+            annotations.append(song.copy())
 
         # If there"s only one play, the widget"s output is the created Input.
         if len(self.createdInputs) == 1:
@@ -516,7 +619,14 @@ class LyricsGenius(OWTextableBaseWidget):
             numChars += segmentLength
         message += "(%i character@p)." % numChars
         message = pluralize(message, numChars)
-        self.infoBox.setText(message)
+        if failed:
+            message += " Couldn't download: %s." % ", ".join(
+                song["title"] for song in self.myBasket
+                if song["path"] in failed
+            )
+            self.infoBox.setText(message, "warning")
+        else:
+            self.infoBox.setText(message)
 
         self.send("Lyrics importation", self.segmentation)
         self.sendButton.resetSettingsChangedFlag()
@@ -541,5 +651,51 @@ class LyricsGenius(OWTextableBaseWidget):
             super().setCaption(title)
 
 
+class LyricsExtractor(HTMLParser):
+    """Collect the text of the lyrics containers of a Genius song page
+    (the divs whose class starts with "Lyrics__Container"), leaving out
+    scripts"""
+
+    def __init__(self):
+        super().__init__()
+        self.parts = list()
+        self.depth = 0
+        self.inScript = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "script":
+            self.inScript = True
+        elif tag == "div":
+            if self.depth:
+                self.depth += 1
+            elif any(
+                value.startswith("Lyrics__Container")
+                for value in (dict(attrs).get("class") or "").split()
+            ):
+                self.depth = 1
+
+    def handle_endtag(self, tag):
+        if tag == "script":
+            self.inScript = False
+        elif tag == "div" and self.depth:
+            self.depth -= 1
+
+    def handle_data(self, data):
+        if self.depth and not self.inScript:
+            self.parts.append(data)
+
+
+def extract_lyrics(chunks, encoding="utf-8"):
+    """Return the lyrics of a Genius song page, parsing it from an iterable
+    of (encoded) chunks"""
+    parser = LyricsExtractor()
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    return "".join(parser.parts)
+
+
 if __name__ == "__main__":
     WidgetPreview(LyricsGenius).run()
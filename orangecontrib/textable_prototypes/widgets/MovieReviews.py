@@ -38,6 +38,12 @@ from LTTL.Input import Input
 
 import imdb
 import random
+import inspect
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from _textable.widgets.TextableUtils import (
     OWTextableBaseWidget, VersionedSettingsHandler, pluralize,
@@ -77,6 +83,14 @@ class MovieReviews(OWTextableBaseWidget):
 
     want_main_area = False
 
+    #----------------------------------------------------------------------
+    # Movie metadata cache and concurrent retrieval...
+
+    cachedFoldername = "cached_imdb_movies"
+    metadataCacheSize = 256
+    maxWorkers = 8
+    threadData = threading.local()
+
     def __init__(self):
         """Widget creator."""
         super().__init__()
@@ -96,6 +110,16 @@ class MovieReviews(OWTextableBaseWidget):
 
         # stocks the imdbpy instance
         self.ia = imdb.IMDb()
+        # Movie metadata (title and year) by movieID, in memory and on disk
+        self.metadataCache = MovieMetadataCache(
+            os.path.join(
+                os.path.dirname(
+                    os.path.abspath(inspect.getfile(inspect.currentframe()))
+                ),
+                self.__class__.cachedFoldername,
+            ),
+            self.__class__.metadataCacheSize,
+        )
         # stock all the inputs (movie names) in a list
         self.createdInputs = list()
 
@@ -456,19 +480,8 @@ class MovieReviews(OWTextableBaseWidget):
                 random.shuffle(filtered_results)
 
             elif self.filter_results == 'Alphabetical':
-                alpha_dict = dict()
-                for result in filtered_results:
-                    my_id = result.movieID
-                    alpha_dict[str(result)] = my_id
-                    print(alpha_dict)
-                sorted_dict = sorted(alpha_dict.keys(), key=lambda x:x.lower())
-                print(sorted_dict)
-                filtered_results = list()
-                for i in sorted_dict:
-                    value = alpha_dict[i]
-                    print(value)
-                    print(self.ia.get_movie(value))
-                    filtered_results.append(self.ia.get_movie(value))
+                # Sort on the titles already present in search results
+                filtered_results.sort(key=lambda x: str(x).lower())
 
             # Each result is stored in a dictionnary with its title
             # and year of publication if it is specified
@@ -579,52 +592,44 @@ class MovieReviews(OWTextableBaseWidget):
         # Initialize progress bar.
         progressBar = ProgressBar(
             self,
-            iterations=len(self.myBasket)
+            iterations=len(set(item['id'] for item in self.myBasket))
         )
 
-        # Connect to imdb and add elements in lists
-        list_review = list()
-        list_annotation = list()
-        annotations = list()
-        try:
-            for item in self.myBasket:
-                movie = self.ia.get_movie_reviews(item['id'])
-                movie_annotations = self.ia.get_movie(item['id'])
-                list_review.append(movie)
-                list_annotation.append(movie_annotations)
-                # 1 tick on the progress bar of the widget
-                progressBar.advance()
-
-        # If an error occurs (e.g. http error, or memory error)...
-        except:
+        # Connect to imdb and get the reviews and metadata of the movies
+        # concurrently (metadata from cache if possible)...
+        movieIDs = list(OrderedDict.fromkeys(
+            item['id'] for item in self.myBasket
+        ))
+        movies, failed = fetch_movies(
+            movieIDs,
+            self.getMovie,
+            self.__class__.maxWorkers,
+            progressBar.advance,
+        )
+
+        # If no movie could be downloaded...
+        if len(failed) == len(movieIDs):
             # Set Info box and widget to "error" state.
             self.infoBox.setText(
                 "Couldn't download data from imdb",
                 "error"
             )
+            progressBar.finish()
             self.controlArea.setDisabled(False)
             return
 
-        # Store movie critics strings in input objects...
-        list_range = list()
-        for movie in list_review:
-            data = movie.get('data', "")
-            reviews_data = data.get('reviews')
-            list_range.append(len(reviews_data))
-            for review in reviews_data:
-                reviews = review.get('content')
-                newInput = Input(reviews, self.captionTitle)
+        # Store movie critics strings in input objects, and the annotations
+        # as dicts in a separate list...
+        annotations = list()
+        for movieID in movieIDs:
+            if movieID in failed:
+                continue
+            reviews, metadata = movies[movieID]
+            for review in reviews:
+                newInput = Input(review, self.captionTitle)
                 self.createdInputs.append(newInput)
-        num = 0
-        for item in list_annotation:
-            print(item)
-            # Store the annotation as dicts in a separate list
-            annotations_dict = {"title": item, "year": item["year"]}
-            annot_dict_copy = annotations_dict.copy()
-            for i in range(list_range[num]):
-                annotations.append(annot_dict_copy)
-            num += 1
-        print(annotations)
+                annotations.append(metadata.copy())
+
         # If there's only one item, the widget's output is the created Input.
         if len(self.createdInputs) == 1:
             self.segmentation = self.createdInputs[0]
@@ -656,11 +661,37 @@ class MovieReviews(OWTextableBaseWidget):
             numChars += segmentLength
         message += " (%i character@p)." % numChars
         message = pluralize(message, numChars)
-        self.infoBox.setText(message)
+        if failed:
+            message += " Couldn't download: %s." % ", ".join(
+                str(item["name"]) for item in self.myBasket
+                if item['id'] in failed
+            )
+            self.infoBox.setText(message, "warning")
+        else:
+            self.infoBox.setText(message)
 
         self.send('Segmentation', self.segmentation)
         self.sendButton.resetSettingsChangedFlag()
 
+    def thread_imdb(self):
+        """Returns the IMDb instance of the current worker thread"""
+        try:
+            return self.threadData.ia
+        except AttributeError:
+            self.threadData.ia = imdb.IMDb()
+            return self.threadData.ia
+
+    def getMovie(self, movieID):
+        """Get the review contents and the metadata (annotations) of a
+        movie"""
+        ia = self.thread_imdb()
+        movie = ia.get_movie_reviews(movieID)
+        data = movie.get('data', "")
+        reviews = [
+            review.get('content') for review in data.get('reviews', list())
+        ]
+        return reviews, self.metadataCache.get(movieID, ia)
+
     def clearResults(self):
         """Clear the results list"""
         del self.titleLabels[:]
@@ -692,5 +723,93 @@ class MovieReviews(OWTextableBaseWidget):
         else:
             super().setCaption(title)
 
+class MovieMetadataCache:
+    """Metadata (title and year) of IMDb movies by movieID, kept in memory
+    (up to a given number of most recently used movies) and on disk"""
+
+    cacheVersion = 1
+
+    def __init__(self, folder, size=256):
+        self.folder = folder
+        self.size = size
+        self.movies = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, movieID, ia):
+        """Return the metadata of a movie, fetching it with IMDb instance
+        ia if it isn't cached"""
+        with self.lock:
+            if movieID in self.movies:
+                self.movies.move_to_end(movieID)
+                return self.movies[movieID]
+        metadata = self.load(movieID)
+        if metadata is None:
+            movie = ia.get_movie(movieID)
+            metadata = {"title": str(movie), "year": movie.get("year")}
+            self.save(movieID, metadata)
+        with self.lock:
+            self.movies[movieID] = metadata
+            self.movies.move_to_end(movieID)
+            while len(self.movies) > self.size:
+                self.movies.popitem(last=False)
+        return metadata
+
+    def path(self, movieID):
+        """Return the path of the disk cache file of a movie"""
+        return os.path.join(self.folder, str(movieID))
+
+    def load(self, movieID):
+        """Load the metadata of a movie from disk (None if absent or
+        outdated)"""
+        try:
+            file = open(self.path(movieID), "rb")
+            cached = pickle.load(file)
+            file.close()
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        if cached.get("version") != self.cacheVersion:
+            return None
+        return cached["metadata"]
+
+    def save(self, movieID, metadata):
+        """Save the metadata of a movie to disk"""
+        path = self.path(movieID)
+        try:
+            os.makedirs(self.folder)
+        except OSError:
+            pass
+        try:
+            file = open(path + ".part", "wb")
+            pickle.dump(
+                {"version": self.cacheVersion, "metadata": metadata},
+                file,
+                -1,
+            )
+            file.close()
+            os.replace(path + ".part", path)
+        except IOError:
+            pass
+
+
+def fetch_movies(movieIDs, fetch, max_workers, progress=None):
+    """Call fetch for each movieID concurrently and return the results by
+    movieID along with the set of movieIDs that failed"""
+    movies = dict()
+    failed = set()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {
+        executor.submit(fetch, movieID): movieID for movieID in movieIDs
+    }
+    for future in as_completed(futures):
+        try:
+            movies[futures[future]] = future.result()
+        except Exception:
+            failed.add(futures[future])
+        if progress is not None:
+            progress()
+    executor.shutdown()
+    return movies, failed
+
+
 if __name__ == "__main__":
     WidgetPreview(MovieReviews).run()
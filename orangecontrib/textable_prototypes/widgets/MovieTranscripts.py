@@ -26,26 +26,35 @@ __email__ = "aris.xanthos@unil.ch"
 
 import os
 import re
-import copy
+import time
+import string
 import PyQt5
-import urllib
 import pickle
 import inspect
+import importlib.util
 import requests
-import LTTL.Segmenter as Segmenter
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import LTTL.SegmenterThread as Segmenter
 from LTTL.Input import Input
-from bs4 import BeautifulSoup
-from urllib import request, parse
+from bs4 import BeautifulSoup, SoupStrainer
 from LTTL.Segmentation import Segmentation
 from Orange.widgets import widget, gui, settings
 from Orange.widgets.utils.widgetpreview import WidgetPreview
-from fuzzywuzzy import fuzz, process
+from rapidfuzz import fuzz, process, utils
 from _textable.widgets.TextableUtils import ProgressBar
 from _textable.widgets.TextableUtils import (
     OWTextableBaseWidget, VersionedSettingsHandler, pluralize,
     InfoBox, SendButton,
 )
 
+# Use the faster lxml parser when available...
+if importlib.util.find_spec("lxml") is not None:
+    HTML_PARSER = "lxml"
+else:
+    HTML_PARSER = "html.parser"
+
 class MovieTranscripts(OWTextableBaseWidget):
     """Textable widget for importing movie scripts from the 
     springfieldspringfield.co.uk website 
@@ -85,6 +94,21 @@ class MovieTranscripts(OWTextableBaseWidget):
     # Other class variables...
 
     cacheFilename = "cache_movie_transcripts"
+    checkpointFilename = "cache_movie_transcripts_checkpoint"
+    scriptsFoldername = "cached_movie_scripts"
+
+    # php_query_string and http_query_string are the variables that will need
+    # to be changed if different database is used or if current database's
+    # structure undergoes changes...
+    php_query_string = '/movie_script.php?movie='
+    http_query_string = 'https://www.springfieldspringfield.co.uk/' +   \
+                        'movie_scripts.php?order='
+    alphabet = ['0'] + list(string.ascii_uppercase)
+
+    # Concurrent crawling parameters...
+    maxWorkers = 4
+    maxAttempts = 3
+    retryDelay = 1.0
 
     def __init__(self):
         """Widget creator."""
@@ -111,6 +135,8 @@ class MovieTranscripts(OWTextableBaseWidget):
         self.movie_titles = list()
         # stock all the movies titles and link parts
         self.title_to_href = dict()
+        # fuzzy search index of the movie titles
+        self.titleIndex = TitleIndex(self.title_to_href)
 
         # Next two instructions are helpers from TextableUtils. Corresponding
         # interface elements are declared here and actually drawn below (at
@@ -120,6 +146,7 @@ class MovieTranscripts(OWTextableBaseWidget):
             widget=self.controlArea,
             master=self,
             callback=self.sendData,
+            cancelCallback=self.cancel_manually,
             infoBoxAttribute="infoBox",
             )
 
@@ -254,6 +281,9 @@ class MovieTranscripts(OWTextableBaseWidget):
             )
         self.clearmyBasket.setDisabled(True)
 
+        # Both boxes are frozen while a task runs (see manageGuiVisibility)...
+        self.guiElements.extend([queryBox, mytitleBox])
+
         gui.rubber(self.controlArea)
 
     #----------------------------------------------------------------------
@@ -279,7 +309,6 @@ class MovieTranscripts(OWTextableBaseWidget):
 
         # Search from the springfieldspringfield.co.uk
         query_string = self.newQuery
-        testdict = self.title_to_href
 
         # Reset and clear the visible widget list
         del self.titleLabels[:]
@@ -291,10 +320,8 @@ class MovieTranscripts(OWTextableBaseWidget):
             # Initialize progress bar.
             progressBar = ProgressBar(self, iterations=1)
 
-            self.searchResults = process.extractBests(
-                query_string, 
-                testdict,
-                limit=100000,
+            self.searchResults = self.titleIndex.search(
+                query_string,
                 score_cutoff=80
             )
 
@@ -347,6 +374,7 @@ class MovieTranscripts(OWTextableBaseWidget):
             file = open(os.path.join(path, self.__class__.cacheFilename), "rb")
             self.title_to_href = pickle.load(file)
             file.close()
+            self.titleIndex = TitleIndex(self.title_to_href)
 
         # Else try to rebuild cache from SpringfieldSpringfield website...
         except IOError:
@@ -355,11 +383,6 @@ class MovieTranscripts(OWTextableBaseWidget):
     def refreshTitles(self):
         """Refresh the database cache"""
 
-        basepath = os.path.dirname(
-            os.path.abspath(inspect.getfile(inspect.currentframe()))
-            )
-        cachedFilename = self.__class__.cacheFilename
-
         dialog = PyQt5.QtWidgets.QMessageBox()
         response = dialog.question(
             self,
@@ -369,100 +392,218 @@ class MovieTranscripts(OWTextableBaseWidget):
             dialog.Yes | dialog.No
         )
 
+        if response == dialog.No:
+            return
+
         self.infoBox.setText(
             "Scraping SpringfieldSpringfield website, please wait...",
             "warning",
         )
         self.warning("Warning : it will take several minutes")
-        if response == dialog.No:
-            return
-        else:
-            try:
-                self.get_all_titles()
-                try:
-                    path = os.path.dirname(
-                        os.path.abspath(inspect.getfile(inspect.currentframe()))
-                    )
-                    file = open(
-                        os.path.join(path, self.__class__.cacheFilename),
-                        "wb",
-                    )
-                    pickle.dump(self.title_to_href, file)
-                    file.close()
-                    self.infoBox.setText(
-                        "Database successfully updated",
-                    )
-                except IOError:
-                    self.infoBox.setText(
-                        "Couldn't save database to disk.",
-                        "warning",
-                    )
-            except requests.exceptions.ConnectionError:
-                self.infoBox.setText(
-                    "Error while attempting to scrape the "
-                    + "SpringfieldSpringfield website.",
-                    "error",
-                )
-
-
-	# Get all movie titles from www.springfieldspringfield.co.uk
+        self.progressBarInit()
+        self.threading(partial(self.get_all_titles))
+
+    # Get all movie titles from www.springfieldspringfield.co.uk
     def get_all_titles(self):
-        """Get all movie titles from www.springfieldspringfield.co.uk"""
-        
-        '''php_query_string and http_query_string are the variable that will need to be changed
-        if different database is used or if current database's structure undergoes changes'''
-        php_query_string = '/movie_script.php?movie='
-        http_query_string = 'https://www.springfieldspringfield.co.uk/' +   \
-                            'movie_scripts.php?order='
-        alphabet = ['0', 'A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 
-                    'K', 'L', 'M', 'N', 'O', 'P', 'K', 'R', 'S', 'T', 'U', 
-                    'V', 'W', 'X', 'Y', 'Z']
-
-        # Initialize progress bar.
-        progressBar = ProgressBar(
-            self,
-            iterations=len(alphabet)
+        """Get all movie titles from www.springfieldspringfield.co.uk, crawling
+        letters concurrently (run in a worker thread). Progress is saved
+        to a checkpoint file so that an interrupted crawl can be resumed.
+        """
+        self.signal_prog.emit(1, False)
+        checkpoint = self.loadCheckpoint()
+        pending = [
+            letter for letter in self.__class__.alphabet
+            if checkpoint["pages"].get(letter, 1) is not None
+        ]
+        lock = threading.Lock()
+        session = self.makeSession()
+        executor = ThreadPoolExecutor(max_workers=self.__class__.maxWorkers)
+        futures = {
+            executor.submit(
+                self.crawlLetter, session, letter, checkpoint, lock
+            ): letter
+            for letter in pending
+        }
+        failed = list()
+        done = len(self.__class__.alphabet) - len(pending)
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except requests.exceptions.RequestException:
+                failed.append(futures[future])
+            done += 1
+            self.signal_prog.emit(
+                int(100*done/len(self.__class__.alphabet)), False
+            )
+            with lock:
+                self.saveCheckpoint(checkpoint)
+            if self.cancel_operation:
+                executor.shutdown(wait=False, cancel_futures=True)
+                return {
+                    "titles": checkpoint["titles"],
+                    "failed": list(),
+                    "cancelled": True,
+                }
+        executor.shutdown()
+        return {"titles": checkpoint["titles"], "failed": sorted(failed)}
+
+    def crawlLetter(self, session, letter, checkpoint, lock):
+        """Get the movie titles of one letter, page after page, from where
+        the checkpoint says to start (run in a worker thread)"""
+        page_num = checkpoint["pages"].get(letter, 1)
+        while not self.cancel_operation:
+            page_url = self.__class__.http_query_string + '%s&page=%i' % (
+                letter,
+                page_num,
+            )
+            links = parse_title_links(
+                self.fetchPage(session, page_url),
+                self.__class__.php_query_string,
+            )
+            with lock:
+                if not links:
+                    checkpoint["pages"][letter] = None
+                    return
+                checkpoint["titles"].update(links)
+                checkpoint["pages"][letter] = page_num + 1
+            page_num += 1
+
+    def makeSession(self):
+        """Return a requests session with a connection pool sized for the
+        worker threads"""
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.__class__.maxWorkers,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def fetchPage(self, session, page_url):
+        """Download a page, retrying with exponential backoff"""
+        for attempt in range(self.__class__.maxAttempts):
+            try:
+                response = session.get(page_url, timeout=30)
+                response.raise_for_status()
+                return response.content
+            except requests.exceptions.RequestException:
+                if attempt == self.__class__.maxAttempts - 1:
+                    raise
+                time.sleep(self.__class__.retryDelay * 2 ** attempt)
+
+    def checkpointPath(self):
+        """Return the path of the crawl checkpoint file"""
+        return os.path.join(
+            os.path.dirname(
+                os.path.abspath(inspect.getfile(inspect.currentframe()))
+            ),
+            self.__class__.checkpointFilename,
         )
-        self.controlArea.setDisabled(True)
 
+    def loadCheckpoint(self):
+        """Load the state of an interrupted crawl (or a new one)"""
         try:
-            for lettre in alphabet:
-                page_num = 1
-                # 1 tick on the progress bar of the widget
-                progressBar.advance()
+            file = open(self.checkpointPath(), "rb")
+            checkpoint = pickle.load(file)
+            file.close()
+            return checkpoint
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return {"pages": dict(), "titles": dict()}
+
+    def saveCheckpoint(self, checkpoint):
+        """Save the state of the current crawl"""
+        try:
+            file = open(self.checkpointPath(), "wb")
+            pickle.dump(checkpoint, file, -1)
+            file.close()
+        except IOError:
+            pass
+
+    @OWTextableBaseWidget.task_decorator
+    def task_finished(self, f):
+        """All operations following the termination of a worker thread"""
+        processed_data = f.result()
+
+        # Operation cancelled by user...
+        if processed_data is None:
+            return
+
+        # Database refresh...
+        if "titles" in processed_data:
+            self.titlesRefreshed(processed_data)
+            return
+
+        if "error" in processed_data:
+            self.infoBox.setText(processed_data["error"], "error")
+            self.send("Movie transcripts", None)
+            return
+
+        self.segmentation = processed_data["segmentation"]
+
+        # Set status to OK (or warn about missing movies) and report data
+        # size...
+        message = "%i segment@p sent to output " % len(self.segmentation)
+        message = pluralize(message, len(self.segmentation))
+        numChars = 0
+        for segment in self.segmentation:
+            segmentLength = len(Segmentation.get_data(segment.str_index))
+            numChars += segmentLength
+        message += "(%i character@p)." % numChars
+        message = pluralize(message, numChars)
+        if processed_data["failed"]:
+            message += " Couldn't download: %s." % ", ".join(
+                processed_data["failed"]
+            )
+            self.infoBox.setText(message, "warning")
+        else:
+            self.infoBox.setText(message)
 
-                # This part of code is what gets all the movie titles from each
-                # page of the database
-                while True:
-                    page_url = http_query_string + '%s&page=%i' % (
-                        lettre, 
-                        page_num,
-                    )
-                    page = urllib.request.urlopen(page_url)
-                    soup = BeautifulSoup(page, 'html.parser')
-                    # script_links is a variable that may need to be changed if 
-                    # another database is used or current database undergoes 
-                    # change
-                    script_links = soup.find_all('a', class_=re.compile(r"^btn btn-dark btn-sm"))
-                    
-                    if not script_links:
-                        break
-                    links = dict()
-                    for link in soup.find_all('a', class_=re.compile(r"^btn btn-dark btn-sm")):
-                        links[link.text] =  \
-                            link.get('href')[len(php_query_string):]
-                    self.title_to_href.update(links)
-                    page_num += 1
-
-        except:
+        self.send("Movie transcripts", self.segmentation)
+        self.sendButton.resetSettingsChangedFlag()
+
+    def titlesRefreshed(self, processed_data):
+        """Update and save the database after a refresh"""
+        self.title_to_href.update(processed_data["titles"])
+        self.titleIndex = TitleIndex(self.title_to_href)
+        if processed_data.get("cancelled"):
             self.infoBox.setText(
-                "Couldn't download data from springfieldspringfield website.",
+                "Refresh interrupted, it will resume where it stopped.",
+                "warning",
+            )
+            return
+        if processed_data["failed"]:
+            self.infoBox.setText(
+                "Couldn't download titles starting with %s from "
+                "springfieldspringfield website, please refresh again to "
+                "resume." % ", ".join(processed_data["failed"]),
                 "error"
             )
-        # Clear progress bar.
-        progressBar.finish()
-        self.controlArea.setDisabled(False)
-        return self.title_to_href
+            return
+
+        # Crawl complete: save database and forget checkpoint...
+        try:
+            path = os.path.dirname(
+                os.path.abspath(inspect.getfile(inspect.currentframe()))
+            )
+            file = open(
+                os.path.join(path, self.__class__.cacheFilename),
+                "wb",
+            )
+            pickle.dump(self.title_to_href, file)
+            file.close()
+            self.infoBox.setText(
+                "Database successfully updated",
+            )
+        except IOError:
+            self.infoBox.setText(
+                "Couldn't save database to disk.",
+                "warning",
+            )
+        try:
+            os.remove(self.checkpointPath())
+        except OSError:
+            pass
 
     # Add Movies function
     def Add(self):
@@ -523,96 +664,122 @@ class MovieTranscripts(OWTextableBaseWidget):
         # Clear created Inputs.
         self.clearCreatedInputs()
 
-        annotations = list()
-        script_list = list()
-        annotations_dict = dict()
-        self.controlArea.setDisabled(True)
-
-        # Initialize progress bar.
-        progressBar = ProgressBar(self, iterations=len(self.myBasket))
-
-        # This part of code is what fetches the actual script
-        try:
-            for movie in self.myBasket:
-                # Each movie that is in the corpus is split into title and year
-                # (rsplit makes sure to only split last occurence) which will 
-                # become annotations
-                b = copy.copy(movie)
-                future_annotation = b.rsplit('(', 1)
-                movie_title = future_annotation[0]
-                movie_year = future_annotation[-1]
-                movie_year = movie_year[:-1]
-                annotations_dict["Movie Title"] = movie_title
-                annotations_dict["Year of release"] = movie_year
-                # It is important to make a copy of dictionary, otherwise each 
-                # iteration will replace every element of the annotations list
-                annotations.append(annotations_dict.copy())
-                # link_end and page_url are the two variables that will have to
-                # be changed in case scripts need to be taken from elsewhere
-                link_end = self.path_storage[movie]
-                page_url = "https://www.springfieldspringfield.co.uk/" +   \
-                    "movie_script.php?movie=" + link_end
-                page = urllib.request.urlopen(page_url)
-                soup = BeautifulSoup(page, 'html.parser')
-
-                # This is what grabs the movie script
-                script = soup.find("div", {"class":"movie_script"})
-
-                script_list.append(script.text)
-
-                # 1 tick on the progress bar of the widget
-                progressBar.advance()
-
-        except:
-            self.infoBox.setText(
-                "Couldn't download data from SpringfieldSpringfield website.",
-                "error"
-            )
-            self.controlArea.setDisabled(False)
-            return
-
-        # Store downloaded script strings in input objects...
-        for script in script_list:
-            newInput = Input(script, self.captionTitle)
+        self.infoBox.setText("Step 1/2: Downloading scripts...", "warning")
+        self.progressBarInit()
+
+        # Download scripts in a worker thread...
+        self.threading(partial(self.processData, list(self.myBasket)))
+
+    def processData(self, basket):
+        """Get the scripts of the movies in basket, from the script store
+        or else by downloading them concurrently, and build the output
+        segmentation (run in a worker thread)"""
+        self.signal_prog.emit(1, False)
+
+        # link_end is the variable that will have to be changed in case
+        # scripts need to be taken from elsewhere
+        link_ends = {
+            movie: self.path_storage.get(movie, self.title_to_href.get(movie))
+            for movie in basket
+        }
+        scripts = dict()
+        failed = list()
+        session = self.makeSession()
+        executor = ThreadPoolExecutor(max_workers=self.__class__.maxWorkers)
+        futures = {
+            executor.submit(self.getScript, session, link_end): movie
+            for movie, link_end in link_ends.items()
+        }
+        cur_itr = 1
+        for future in as_completed(futures):
+            movie = futures[future]
+            try:
+                scripts[movie] = future.result()
+            except (requests.exceptions.RequestException, ValueError):
+                failed.append(movie)
+            self.signal_prog.emit(int(100*cur_itr/len(futures)), False)
+            cur_itr += 1
+            if self.cancel_operation:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self.signal_prog.emit(100, False)
+                return None
+        executor.shutdown()
+
+        if not scripts:
+            return {
+                "error": "Couldn't download data from "
+                         "SpringfieldSpringfield website."
+            }
+
+        self.signal_text.emit("Step 2/2: Post-processing...", "warning")
+        self.signal_prog.emit(1, True)
+
+        # Store script strings in input objects annotated with title and
+        # year of release...
+        for movie in basket:
+            if movie not in scripts:
+                continue
+            # Each movie that is in the corpus is split into title and year
+            # (rsplit makes sure to only split last occurence) which will
+            # become annotations
+            future_annotation = movie.rsplit('(', 1)
+            newInput = Input(scripts[movie], self.captionTitle)
+            segment = newInput[0]
+            segment.annotations["Movie Title"] = future_annotation[0]
+            segment.annotations["Year of release"] = future_annotation[-1][:-1]
+            newInput[0] = segment
             self.createdInputs.append(newInput)
 
-       # If there's only one play, the widget"s output is the created Input.
+        # If there's only one movie, the widget"s output is the created Input.
         if len(self.createdInputs) == 1:
-            self.segmentation = self.createdInputs[0]
+            segmentation = self.createdInputs[0]
 
         # Otherwise the widget"s output is a concatenation...
         else:
-            self.segmentation = Segmenter.concatenate(
-                self.createdInputs,
-                self.captionTitle,
+            segmentation = Segmenter.concatenate(
+                caller=self,
+                segmentations=self.createdInputs,
+                label=self.captionTitle,
                 import_labels_as=None,
             )
 
-        # Annotate segments...
-        for idx, segment in enumerate(self.segmentation):
-            segment.annotations.update(annotations[idx])
-            self.segmentation[idx] = segment
-
-        # Clear progress bar.
-        progressBar.finish()
-
-        self.controlArea.setDisabled(False)
-
-        # Set status to OK and report data size...
-        message = "%i segment@p sent to output " % len(self.segmentation)
-        message = pluralize(message, len(self.segmentation))
-        numChars = 0
-        for segment in self.segmentation:
-            segmentLength = len(Segmentation.get_data(segment.str_index))
-            numChars += segmentLength
-        message += "(%i character@p)." % numChars
-        message = pluralize(message, numChars)
-        self.infoBox.setText(message)
-
-        self.send("Movie transcripts", self.segmentation)
-        self.sendButton.resetSettingsChangedFlag()
+        return {"segmentation": segmentation, "failed": sorted(failed)}
+
+    def getScript(self, session, link_end):
+        """Get a movie script from the script store, or else download it
+        and save it in the store (run in a worker thread)"""
+        if link_end is None:
+            raise ValueError("Unknown movie")
+        path = os.path.join(
+            os.path.dirname(
+                os.path.abspath(inspect.getfile(inspect.currentframe()))
+            ),
+            self.__class__.scriptsFoldername,
+            re.sub(r"[^\w.-]", "_", link_end) + ".txt",
+        )
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                return file.read()
+        except IOError:
+            pass
 
+        page_url = "https://www.springfieldspringfield.co.uk/" +   \
+            "movie_script.php?movie=" + link_end
+        script = parse_script(self.fetchPage(session, page_url))
+        if script is None:
+            raise ValueError("No script found")
 
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            pass
+        try:
+            with open(path + ".part", "w", encoding="utf-8") as file:
+                file.write(script)
+            os.replace(path + ".part", path)
+        except IOError:
+            pass
+        return script
 
     def clearCreatedInputs(self):
         """Delete all Input objects that have been created."""
@@ -626,12 +793,70 @@ class MovieTranscripts(OWTextableBaseWidget):
             changed = title != self.captionTitle
             super().setCaption(title)
             if changed:
-                self.SendButton.settingsChanged()
+                self.cancel() # Cancel current operation
+                self.sendButton.settingsChanged()
         else:
             super().setCaption(title)
 
 
 
+def parse_title_links(page, php_query_string):
+    """Parse a page of the springfieldspringfield movie list (once, keeping
+    only the script links) and return a dict mapping movie titles to the
+    end of their script page urls"""
+    # This is a variable that may need to be changed if another database
+    # is used or current database undergoes change...
+    strainer = SoupStrainer("a", class_=re.compile(r"^btn btn-dark btn-sm"))
+    soup = BeautifulSoup(page, HTML_PARSER, parse_only=strainer)
+    return {
+        link.text: link.get('href')[len(php_query_string):]
+        for link in soup.find_all("a")
+    }
+
+
+def parse_script(page):
+    """Extract the script from a springfieldspringfield script page
+    (parsing only its script div), or None if there is none"""
+    # This is what grabs the movie script
+    strainer = SoupStrainer("div", {"class": "movie_script"})
+    script = BeautifulSoup(page, HTML_PARSER, parse_only=strainer).find(
+        "div", {"class": "movie_script"}
+    )
+    if script is None:
+        return None
+    return script.text
+
+
+class TitleIndex(object):
+    """Fuzzy search index of the movie titles, built once so that each
+    search only has to score the titles.
+
+    Link parts are processed once here, and a search scores all of them
+    against the query with rapidfuzz's (compiled) WRatio scorer.
+    """
+
+    def __init__(self, title_to_href):
+        self.titles = list(title_to_href)
+        self.hrefs = [title_to_href[title] for title in self.titles]
+        self.processed = [utils.default_process(href) for href in self.hrefs]
+
+    def search(self, query, score_cutoff=80):
+        """Return the (link part, score, title) tuples of the titles
+        matching query, by decreasing score"""
+        matches = process.extract(
+            utils.default_process(query),
+            self.processed,
+            scorer=fuzz.WRatio,
+            processor=None,
+            limit=None,
+            score_cutoff=score_cutoff,
+        )
+        return [
+            (self.hrefs[idx], score, self.titles[idx])
+            for _, score, idx in matches
+        ]
+
+
 if __name__ == "__main__":
     #import sys
     #from PyQt5.QtWidgets import QApplication
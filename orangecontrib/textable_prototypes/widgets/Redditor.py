@@ -34,17 +34,22 @@ from Orange.widgets.utils.widgetpreview import WidgetPreview
 
 from _textable.widgets.TextableUtils import (
     OWTextableBaseWidget, VersionedSettingsHandler, pluralize,
-    InfoBox, SendButton, ProgressBar
+    InfoBox, SendButton
 )
 
 from LTTL.Segmentation import Segmentation
-import LTTL.Segmenter as Segmenter
 from LTTL.Segment import Segment
 from LTTL.Input import Input
 
 from datetime import datetime
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import os
 import re
+import inspect
+import sqlite3
+import threading
 
 class Redditor(OWTextableBaseWidget):
     """An Orange widget to scrape Reddit"""
@@ -93,28 +98,40 @@ class Redditor(OWTextableBaseWidget):
 
     labelsPanier = Setting(list())
 
-    # Data settings...
+    # Data settings (query parameters and ids of the posts they returned,
+    # whose content is kept in the local post store)...
+
+    queryParams = Setting(list())
+    queryIds = Setting(list())
+
+    # Data settings of previous versions (migrated to the post store)...
 
     queryList = Setting(list())
     annotList = Setting(list())
 
     #----------------------------------------------------------------------
-    # Praw instance
+    # Praw instances (one per comment worker thread, plus the main one)
 
-    reddit = praw.Reddit(
+    redditCredentials = dict(
         client_id="aHeP3Ub7aILvsg",
         client_secret=None,
         username="RedditorApp",
         password="RedditorProg2019",
         user_agent="Redditor by /u/RedditorApp"
     )
+    reddit = praw.Reddit(**redditCredentials)
+    threadData = threading.local()
+    commentWorkers = 4
 
     #----------------------------------------------------------------------
-    # Temporary inputs and data lists
+    # Local post store (SQLite database in this module's directory)
+
+    storeFilename = "redditor_store.sqlite"
+
+    #----------------------------------------------------------------------
+    # Temporary inputs
 
     createdInputs = list()
-    listeTempAnnot = list()
-    listeTempPosts = list()
 
     def __init__(self):
         """Init of the module: UI and variables definition"""
@@ -123,6 +140,10 @@ class Redditor(OWTextableBaseWidget):
         # queryBox indexes
         self.indicesPanier = list()
 
+        # Move data saved by previous versions to the post store...
+        if self.queryList:
+            self.migrate_settings()
+
         #----------------------------------------------------------------------
         # User interface...
 
@@ -176,6 +197,7 @@ class Redditor(OWTextableBaseWidget):
             widget=self.controlArea,
             master=self,
             callback=self.send_data,
+            cancelCallback=self.cancel_manually,
             infoBoxAttribute='infoBox',
         )
 
@@ -493,207 +515,281 @@ class Redditor(OWTextableBaseWidget):
         a (int): Stands for 'amount', amount of posts to be fetched
 
         """
-        self.controlArea.setDisabled(True)
+        # Check if anything was put in the input
+        if ((m == "Subreddit" and len(sI) > 0) or
+            (m == "URL" and len(uI) > 0) or
+            (m == "Full text" and len(ftI) > 0)):
+            self.fetch_queries([dict(
+                m=m, pA=pA, sI=sI, uI=uI, ftI=ftI,
+                sTF=sTF, ftTF=ftTF, iI=iI, iC=iC, a=a,
+            )])
+        else:
+            # If no input is registered, signal it to the user
+            self.infoBox.setText(
+                "Please type a query.",
+                "warning"
+            )
+
+    def fetch_queries(self, queries, replace=False):
+        """Launches the fetching of a list of queries in a worker thread
+
+        Parameters:
+        queries (list): list of dicts of get_content parameters
+        replace (bool): whether the results replace the current basket
+        """
         self.infoBox.setText(
             "Processing query, please wait.",
             "warning"
         )
+        self.progressBarInit()
+        self.threading(partial(self.process_queries, queries, replace))
 
-        # Check if anything was put in the input
-        if ((m == "Subreddit" and len(sI) > 0) or
-            (m == "URL" and len(uI) > 0) or
-            (m == "Full text" and len(ftI) > 0)):
-            if pA == "All":
-                varTimeFilter = "all"
-            elif pA == "Past day":
-                varTimeFilter = "day"
-            elif pA == "Past hour":
-                varTimeFilter = "hour"
-            elif pA == "Past week":
-                varTimeFilter = "week"
-            elif pA == "Past month":
-                varTimeFilter = "month"
-            elif pA == "Past year":
-                varTimeFilter = "year"
-
-            # Differenciate method depending of user selection
-            if self.mode == "Subreddit":
-                # Get the subreddit based on subreddit name
+    def process_queries(self, queries, replace):
+        """Fetches posts and comments for each query (run in a worker thread)
+
+        Posts are listed in this thread while the comments of each post are
+        fetched concurrently by a bounded pool of worker threads, each with
+        its own Reddit instance (PRAW instances are not thread-safe). PRAW
+        paces each instance according to the rate limit headers sent by
+        Reddit for the shared client id.
+
+        Fetched posts and comments are saved in the local post store. Returns
+        a dict with the queries, a list of (post ids, number of segments)
+        results and the replace flag, or None if the operation was cancelled.
+        """
+        self.signal_prog.emit(1, False)
+        results = list()
+        executor = ThreadPoolExecutor(max_workers=self.commentWorkers)
+        store = self.open_store()
+        try:
+            # Progress units: one per post listed plus one per post whose
+            # comments have been fetched (if comments are requested)...
+            self.progressUnits = sum(
+                (query["a"] if query["m"] != "URL" else 1)
+                * (2 if query["iC"] else 1)
+                for query in queries
+            )
+            self.progressDone = 0
+            for query in queries:
                 try:
-                    subreddit = self.reddit.subreddit(sI)
-                    # Set list of posts "posts" according to filter
-                    # Initiate lists without time filters applicable first
-                    if sTF == "Hot":
-                        posts = subreddit.hot(limit=a)
-                    elif sTF == "New":
-                        posts = subreddit.new(limit=a)
-                    elif sTF == "Rising":
-                        posts = subreddit.rising(limit=a)
-                    # Initiate lists with time filters
-                    elif sTF == "Controversial":
-                        posts = subreddit.controversial(limit=a, time_filter=varTimeFilter)
-                    elif sTF == "Top":
-                        posts = subreddit.top(limit=a, time_filter=varTimeFilter)
-                    # Loop on the posts found
-                    for post in posts:
-                		# Creation of corresponding segments
-                        self.create_post_segments(post, iI, iC)
-                # Handle exceptions
+                    result = self.process_query(query, executor, store)
                 except prawcore.exceptions.Redirect:
-                    self.infoBox.setText(
-                        "Error in redirect, please make sure the subreddit name is correct.",
-                        "error"
-                    )
-                    return
+                    return {"error": "Error in redirect, please make sure "
+                                     "the subreddit name is correct."}
                 except prawcore.exceptions.NotFound:
-                    self.infoBox.setText(
-                        "Subreddit not found.",
-                        "error"
-                    )
-                    return
-            elif self.mode == "URL":
-                # Get post based on URL
-                try:
-                    # Set list of posts "posts" according to filter
-                    # Initiate lists without time filters applicable first
-                    post = self.reddit.submission(url=uI)
-                	# Creation of corresponding segment
-                    self.create_post_segments(post, iI, iC)
-                # Handle exceptions
-                except prawcore.exceptions.NotFound:
-                    self.infoBox.setText(
-                        "No match for URL.",
-                        "error"
-                    )
-                    return
+                    if query["m"] == "URL":
+                        return {"error": "No match for URL."}
+                    return {"error": "Subreddit not found."}
                 except praw.exceptions.ClientException:
-                    self.infoBox.setText(
-                        "URL not found.",
-                        "error"
-                    )
-                    return
-            elif self.mode == "Full text":
-                # Get posts based on a full text research
-                userSearch = ftI
-                reddit = self.reddit.subreddit("all")
-
-                # Get posts based on the filter chosen by the user
-                if ftTF == "Relevance":
-                    posts = reddit.search(
-                        userSearch,
-                        sort="relevance",
-                        limit=a,
-                        time_filter=varTimeFilter,
-                    )
-                elif ftTF == "Top":
-                    posts = reddit.search(
-                        userSearch,
-                        sort="top",
-                        limit=a,
-                        time_filter=varTimeFilter,
-                    )
-                elif ftTF == "Comments":
-                    posts = reddit.search(
-                        userSearch,
-                        sort="comments",
-                        limit=a,
-                        time_filter=varTimeFilter,
-                    )
-                elif ftTF == "New":
-                    posts = reddit.search(
-                        userSearch,
-                        sort="new",
-                        limit=a,
-                    )
-            
-                for post in posts:
-                    # Creation of corresponding segment
-                    self.create_post_segments(post, iI, iC)
-
-            if len(self.listeTempPosts) > 0:
-                # If content was gathered, add the data to the 
-                # Settings' data list and label list 
-                self.queryList.append(self.listeTempPosts)
-                self.annotList.append(self.listeTempAnnot)
-                self.add_to_list(
-                    m = m,
-                    pA = pA,
-                    sI = sI,
-                    uI = uI,
-                    ftI = ftI,
-                    sTF = sTF,
-                    ftTF = ftTF,
-                    iI = iI,
-                    iC = iC,
-                    a = a
+                    return {"error": "URL not found."}
+                except prawcore.exceptions.PrawcoreException:
+                    return {"error": "Couldn't connect to Reddit, please "
+                                     "try again later."}
+                if result is None:
+                    return None
+                results.append(result)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            store.close()
+        self.signal_prog.emit(100, False)
+        return {"queries": queries, "results": results, "replace": replace}
+
+    def process_query(self, query, executor, store):
+        """Fetches the posts (and their comments) for a single query
+
+        Posts already in the store only have their comments fetched again
+        if their number of comments has changed, so that refreshing scales
+        with new content. Returns a tuple (post ids, number of segments),
+        or None if the operation was cancelled.
+        """
+        m, pA, a = query["m"], query["pA"], query["a"]
+        if pA == "All":
+            varTimeFilter = "all"
+        elif pA == "Past day":
+            varTimeFilter = "day"
+        elif pA == "Past hour":
+            varTimeFilter = "hour"
+        elif pA == "Past week":
+            varTimeFilter = "week"
+        elif pA == "Past month":
+            varTimeFilter = "month"
+        elif pA == "Past year":
+            varTimeFilter = "year"
+
+        # Differenciate method depending of user selection
+        if m == "Subreddit":
+            # Get the subreddit based on subreddit name
+            subreddit = self.reddit.subreddit(query["sI"])
+            # Set list of posts "posts" according to filter
+            # Initiate lists without time filters applicable first
+            sTF = query["sTF"]
+            if sTF == "Hot":
+                posts = subreddit.hot(limit=a)
+            elif sTF == "New":
+                posts = subreddit.new(limit=a)
+            elif sTF == "Rising":
+                posts = subreddit.rising(limit=a)
+            # Initiate lists with time filters
+            elif sTF == "Controversial":
+                posts = subreddit.controversial(limit=a, time_filter=varTimeFilter)
+            elif sTF == "Top":
+                posts = subreddit.top(limit=a, time_filter=varTimeFilter)
+        elif m == "URL":
+            # Get post based on URL
+            posts = [self.reddit.submission(url=query["uI"])]
+            a = 1
+        elif m == "Full text":
+            # Get posts based on a full text research
+            reddit = self.reddit.subreddit("all")
+            ftTF = query["ftTF"]
+            if ftTF == "New":
+                posts = reddit.search(
+                    query["ftI"],
+                    sort="new",
+                    limit=a,
                 )
-                # Empty temporary lists and signal a change in the settings
-                self.refreshButton.setDisabled(False)
-                self.clearButton.setDisabled(False)
-                self.listeTempPosts = list()
-                self.listeTempAnnot = list()
-                self.sendButton.settingsChanged()
             else:
-                # If no centent is found, explain why to the user
-                self.infoBox.setText(
-                    "The posts found only contained images. Try to include images or comments.",
-                    "warning"
+                posts = reddit.search(
+                    query["ftI"],
+                    sort=ftTF.lower(),
+                    limit=a,
+                    time_filter=varTimeFilter,
                 )
-        else:
-            # If no input is registered, signal it to the user
+
+        # List and store posts, and submit the fetching of their comments
+        # when they are new or have changed...
+        postIds = list()
+        futures = dict()
+        for post in posts:
+            previousNumComments = self.store_post(store, post)
+            postIds.append(post.id)
+            self.advance_progress()
+            if query["iC"]:
+                if previousNumComments == post.num_comments:
+                    self.advance_progress()
+                else:
+                    futures[executor.submit(
+                        self.create_comments_segments,
+                        post.id,
+                        post.title,
+                    )] = (post.id, post.num_comments)
+            if self.cancel_operation:
+                return None
+        unitsPerPost = 2 if query["iC"] else 1
+        self.progressUnits -= (a - len(postIds)) * unitsPerPost
+
+        # Store comments as they arrive...
+        for future in as_completed(futures):
+            postId, numComments = futures[future]
+            self.store_comments(store, postId, future.result(), numComments)
+            self.advance_progress()
+            if self.cancel_operation:
+                return None
+
+        numSegments = len(self.load_segments(store, query, postIds))
+        return postIds, numSegments
+
+    def advance_progress(self):
+        """Advances the progress bar by one unit (called in worker thread)"""
+        self.progressDone += 1
+        self.signal_prog.emit(
+            int(100 * self.progressDone / max(self.progressUnits, 1)),
+            False,
+        )
+
+    @OWTextableBaseWidget.task_decorator
+    def task_finished(self, f):
+        """Adds the fetched queries to the basket"""
+        processed_data = f.result()
+
+        if processed_data is None:
+            return
+
+        if "error" in processed_data:
+            self.infoBox.setText(processed_data["error"], "error")
+            return
+
+        if processed_data["replace"]:
+            self.clearPressed()
+
+        emptyQueries = 0
+        for query, (postIds, numSegments) in zip(
+            processed_data["queries"], processed_data["results"]
+        ):
+            if numSegments > 0:
+                # If content was gathered, add the query and post ids to
+                # the Settings' data lists and label list 
+                self.queryParams.append(query)
+                self.queryIds.append(postIds)
+                self.add_to_list(numSegments=numSegments, **query)
+            else:
+                emptyQueries += 1
+
+        if self.queryIds:
+            self.refreshButton.setDisabled(False)
+            self.clearButton.setDisabled(False)
+        if emptyQueries:
+            # If no centent is found, explain why to the user
             self.infoBox.setText(
-                "Please type a query.",
+                "The posts found only contained images. Try to include images or comments.",
                 "warning"
             )
-
-        self.controlArea.setDisabled(False)
-        return
+        else:
+            self.infoBox.setText("Query added to selection.")
+        self.sendButton.settingsChanged()
 
     def refresh_content(self):
         """Refreshes all the queries in the list of queries to update the corpus"""
+        queries = list()
+        for idx, label in enumerate(self.labelsPanier):
+            if idx < len(self.queryParams):
+                queries.append(self.queryParams[idx])
+            else:
+                queries.append(self.parse_label(label))
+
+        # Fetch all queries again and replace the basket's content
+        self.fetch_queries(queries, replace=True)
+
+    def parse_label(self, label):
+        """Gets the parameters of a query from its label in the basket
+        (only needed for baskets saved by previous versions)"""
         # Set a list of regex to get the information necessary
         modeReg = re.compile(r"(?<=Mode: ).+?(?=; Value)")
         valueReg = re.compile(r"(?<=Value: ).+?(?=; Settings)")
         settingsReg = re.compile(r"(?<=Settings: ).+?(?=; Include)")
         includeImageReg = re.compile(r"(?<=Include image: )\w+(?=; Include)")
         includeCommentsReg = re.compile(r"(?<=Include comments: )\w+(?=; Segments)")
-        # Get labels
-        labels = self.labelsPanier
-        # Clear labels
-        self.clearPressed()
-        for label in labels:
-            # For each labels, get data using the regex
-            mode = re.search(modeReg, label).group(0)
-            value = re.search(valueReg, label).group(0)
-            settings = re.search(settingsReg, label).group(0).split(", ")
-            incIma = re.search(includeImageReg, label).group(0)
-            incCom = re.search(includeCommentsReg, label).group(0)
-            subIn = ""
-            urlIn = ""
-            ftxtIn = ""
-            if mode == "Subreddit":
-                subIn = value
-            elif mode == "URL":
-                urlIn = value
-            elif mode == "Full text":
-                ftxtIn = value
-
-            if settings[1] == "[not specified]":
-                settings[1] = "All"
-            
-            # Call the get_content method with the information gathered
-            self.get_content(
-                m = mode,
-                pA = settings[1],
-                sI = subIn,
-                uI = urlIn,
-                ftI = ftxtIn,
-                sTF = settings[0],
-                ftTF = settings[0],
-                iI = incIma,
-                iC = incCom,
-                a = int(settings[2])
-            )
+        # Get data using the regex
+        mode = re.search(modeReg, label).group(0)
+        value = re.search(valueReg, label).group(0)
+        settings = re.search(settingsReg, label).group(0).split(", ")
+        incIma = re.search(includeImageReg, label).group(0) == "True"
+        incCom = re.search(includeCommentsReg, label).group(0) == "True"
+        subIn = ""
+        urlIn = ""
+        ftxtIn = ""
+        if mode == "Subreddit":
+            subIn = value
+        elif mode == "URL":
+            urlIn = value
+        elif mode == "Full text":
+            ftxtIn = value
+
+        if settings[1] == "[not specified]":
+            settings[1] = "All"
+        
+        return dict(
+            m = mode,
+            pA = settings[1],
+            sI = subIn,
+            uI = urlIn,
+            ftI = ftxtIn,
+            sTF = settings[0],
+            ftTF = settings[0],
+            iI = incIma,
+            iC = incCom,
+            a = int(settings[2])
+        )
      
     def confirm_settings(self):
         """Sets all the values for filters entered by user"""
@@ -721,90 +817,208 @@ class Redditor(OWTextableBaseWidget):
             a = amount
         )
 
+    def create_comments_segments(self, postId, postTitle):
+        """ Creation of segments for each comment in the post
 
-    def create_post_segments(self, post, includeImage, includeComments):
-        """ Creation of segments from posts"""
-        self.create_content_segment(post, includeImage)
-        # If "Comments" is checked, we create the corresponding segments
-        if includeComments:
-            self.create_comments_segments(post)
-            return
-
-    def create_content_segment(self, post, includeImage = False):
-        """ Creation of segments for posts"""
-        progressBar = ProgressBar(self, iterations=1)
-        self.infoBox.setText(
-            "Processing post content, please wait.",
-            "warning"
-        )
-        # Create annotations
-        annotations = dict()
-        annotations["Title"] = post.title
-        annotations["Id"] = post.id
-        annotations["Parent"] = post.id
-        annotations["Author"] = post.author
-        annotations["Score"] = post.score
-        annotations["Parent_type"] = "0"
-
-        # Time annotations
-        time = post.created_utc
-        ts = int(time)
-        date = datetime.utcfromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
-        annotations["Posted_Unix"] = time
-        annotations["Posted_at"] = date
-
-        # author, created_utc (ou created ?) et score
-        content = post.selftext
-        if content == "":
-            content = "[image]"
-
-        if not (includeImage == False and content == "[image]"):
-            # Create a segment is the user wishes to have a segment
-            # When there is only an image
-            progressBar.advance()
-            self.listeTempPosts.append(content)
-            self.listeTempAnnot.append(annotations)
-            progressBar.finish()
-        
-        return
-
-    def create_comments_segments(self, post):
-        """ Creation of segments for each comment in the post"""
+        Run in a worker thread, with this thread's own Reddit instance.
+        Returns a list of tuples to be stored in the post store.
+        """
         # Get the totality of the comments under a post
+        post = self.thread_reddit().submission(id=postId)
         post.comments.replace_more(limit=None)
         comments = post.comments.list()
 
-        progressBar = ProgressBar(self, iterations=len(comments))
-        self.infoBox.setText(
-            "Processing comments, this can take a while, please wait.",
-            "warning"
-        )
-
-        # Creation of a segment for each comment
-        for comment in comments:
-            annotations = dict()
-            annotations["Title"] = post.title
-            annotations["Id"] = comment.id
-            annotations["Author"] = comment.author
-            annotations["Score"] = comment.score
-
-            # Time annotations
-            time = comment.created_utc
-            ts = int(time)
-            date = datetime.utcfromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
-            annotations["Posted_Unix"] = time
-            annotations["Posted_at"] = date
-
+        # Creation of a row for each comment
+        rows = list()
+        for position, comment in enumerate(comments):
             # author, created_utc (ou created ?) et score
             parentId= comment.parent_id.split("_")
-            annotations["Parent"] = parentId[1]
-            annotations["Parent_type"] = parentId[0][1]
+            rows.append((
+                comment.id,
+                postId,
+                position,
+                comment.body,
+                postTitle,
+                str(comment.author) if comment.author else None,
+                comment.score,
+                comment.created_utc,
+                parentId[1],
+                parentId[0][1],
+                None,
+            ))
+        return rows
+
+    def open_store(self):
+        """Opens (and creates if needed) the local post store"""
+        path = os.path.dirname(
+            os.path.abspath(inspect.getfile(inspect.currentframe()))
+        )
+        store = sqlite3.connect(
+            os.path.join(path, self.__class__.storeFilename)
+        )
+        store.execute(
+            """CREATE TABLE IF NOT EXISTS items (
+                id TEXT PRIMARY KEY,
+                post_id TEXT,
+                position INTEGER,
+                content TEXT,
+                title TEXT,
+                author TEXT,
+                score INTEGER,
+                created_utc REAL,
+                parent TEXT,
+                parent_type TEXT,
+                num_comments INTEGER
+            )"""
+        )
+        store.execute(
+            "CREATE INDEX IF NOT EXISTS items_post_id ON items (post_id)"
+        )
+        return store
+
+    def store_post(self, store, post):
+        """Saves a post in the store and returns its previously stored
+        number of comments (None if the post is new)"""
+        row = store.execute(
+            "SELECT num_comments FROM items WHERE id = ?", (post.id,)
+        ).fetchone()
+        store.execute(
+            "INSERT OR REPLACE INTO items VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+            (
+                post.id,
+                post.id,
+                0,
+                post.selftext,
+                post.title,
+                str(post.author) if post.author else None,
+                post.score,
+                post.created_utc,
+                post.id,
+                "0",
+                row[0] if row else None,
+            ),
+        )
+        store.commit()
+        return row[0] if row else None
+
+    def store_comments(self, store, postId, rows, numComments):
+        """Replaces the stored comments of a post and records the number of
+        comments reported by Reddit for it"""
+        store.execute(
+            "DELETE FROM items WHERE post_id = ? AND parent_type != '0'",
+            (postId,),
+        )
+        store.executemany(
+            "INSERT OR REPLACE INTO items VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+            rows,
+        )
+        store.execute(
+            "UPDATE items SET num_comments = ? WHERE id = ?",
+            (numComments, postId),
+        )
+        store.commit()
+
+    def load_segments(self, store, query, postIds):
+        """Gets the (content, annotations) pairs of a query from the store"""
+        columns = "id, post_id, content, title, author, score, "   \
+            "created_utc, parent, parent_type"
+        posts = dict()
+        comments = dict()
+        for first in range(0, len(postIds), 500):
+            chunk = postIds[first:first + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for row in store.execute(
+                "SELECT %s FROM items WHERE post_id IN (%s) "
+                "ORDER BY post_id, position" % (columns, placeholders),
+                chunk,
+            ):
+                if row[8] == "0":
+                    posts[row[0]] = row
+                elif query["iC"]:
+                    comments.setdefault(row[1], list()).append(row)
+
+        segments = list()
+        for postId in postIds:
+            rows = list()
+            if postId in posts:
+                content = posts[postId][2]
+                if content == "":
+                    content = "[image]"
+                # Create a segment is the user wishes to have a segment
+                # When there is only an image
+                if query["iI"] or content != "[image]":
+                    rows.append(
+                        posts[postId][:2] + (content,) + posts[postId][3:]
+                    )
+            rows.extend(comments.get(postId, list()))
+            for row in rows:
+                annotations = dict()
+                annotations["Title"] = row[3]
+                annotations["Id"] = row[0]
+                annotations["Author"] = row[4]
+                annotations["Score"] = row[5]
+
+                # Time annotations
+                ts = int(row[6])
+                date = datetime.utcfromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+                annotations["Posted_Unix"] = row[6]
+                annotations["Posted_at"] = date
+
+                annotations["Parent"] = row[7]
+                annotations["Parent_type"] = row[8]
+                segments.append((row[2], annotations))
+        return segments
+
+    def migrate_settings(self):
+        """Moves the data saved by previous versions into the post store"""
+        store = self.open_store()
+        for texts, annotList in zip(self.queryList, self.annotList):
+            postIds = list()
+            postId = None
+            position = 0
+            for text, annotations in zip(texts, annotList):
+                if annotations["Parent_type"] == "0":
+                    postId = annotations["Id"]
+                elif annotations["Parent_type"] == "3":
+                    postId = annotations["Parent"]
+                elif postId is None:
+                    postId = annotations["Id"]
+                if postId not in postIds:
+                    postIds.append(postId)
+                    position = 0
+                position += 1
+                store.execute(
+                    "INSERT OR REPLACE INTO items "
+                    "VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                    (
+                        annotations["Id"],
+                        postId,
+                        position if annotations["Parent_type"] != "0" else 0,
+                        text if text != "[image]" else "",
+                        annotations["Title"],
+                        str(annotations["Author"])
+                            if annotations["Author"] else None,
+                        annotations["Score"],
+                        annotations["Posted_Unix"],
+                        annotations["Parent"],
+                        annotations["Parent_type"],
+                        None,
+                    ),
+                )
+            self.queryIds.append(postIds)
+        store.commit()
+        store.close()
+        self.queryParams = [self.parse_label(l) for l in self.labelsPanier]
+        self.queryList = list()
+        self.annotList = list()
 
-            self.listeTempPosts.append(comment.body)
-            self.listeTempAnnot.append(annotations)
-            progressBar.advance()
-        progressBar.finish()
-        return
+    def thread_reddit(self):
+        """Returns the Reddit instance of the current worker thread"""
+        try:
+            return self.threadData.reddit
+        except AttributeError:
+            self.threadData.reddit = praw.Reddit(**self.redditCredentials)
+            return self.threadData.reddit
     
     def checkSubredditSortMode(self):
         """Change available settings to the user based on the SubReddit mode"""
@@ -839,8 +1053,8 @@ class Redditor(OWTextableBaseWidget):
         # Delete the corret element from both the label list and the data list
         for idx in sorted(self.indicesPanier, reverse=True):
             del labelsPanier[idx]
-            del self.queryList[idx]
-            del self.annotList[idx]
+            del self.queryParams[idx]
+            del self.queryIds[idx]
         
         self.labelsPanier = labelsPanier
         self.sendButton.settingsChanged()
@@ -849,13 +1063,13 @@ class Redditor(OWTextableBaseWidget):
     def clearPressed(self):
         """Empty all the queries in the data list and all of labels in the label list"""
         self.labelsPanier = list()
-        self.queryList = list()
-        self.annotList = list()
+        self.queryParams = list()
+        self.queryIds = list()
         self.sendButton.settingsChanged()
         self.refreshButton.setDisabled(True)
         self.clearButton.setDisabled(True)
     
-    def add_to_list(self, m, pA, sI, uI, ftI, sTF, ftTF, iI, iC, a):
+    def add_to_list(self, m, pA, sI, uI, ftI, sTF, ftTF, iI, iC, a, numSegments):
         """Add a label to the basket created with the fonction information from get_content
 
         Parameters:
@@ -869,6 +1083,7 @@ class Redditor(OWTextableBaseWidget):
         iI (string): Stands for 'include image', defines if the images should be included
         iC (string): Stands for 'include comments', defines if comments should be included
         a (int): Stands for 'amount', amount of posts to be fetched
+        numSegments (int): number of segments produced by the query
         """
         labelsPanier = self.labelsPanier
 
@@ -911,7 +1126,7 @@ class Redditor(OWTextableBaseWidget):
                 amount,
                 image,
                 comments,
-                len(self.queryList[len(self.queryList)-1])
+                numSegments
             )
         )
 
@@ -939,38 +1154,34 @@ class Redditor(OWTextableBaseWidget):
         self.clearCreatedInputs()
         segmentation = None
 
-        # Goes over each queries in the data list
-        for query in self.queryList:
-            for text in query:
-                # Create inputs 
-                newInput = Input(text)
-                self.createdInputs.append(newInput)
-
-        # If there is only one input, create a segmentation...
-        if len(self.createdInputs) == 1:
-            segmentation = self.createdInputs[0]
-
-        # Otherwise the widget's output is a concatenation...
-        else:
-            segmentation = Segmenter.concatenate(
-                self.createdInputs,
-                import_labels_as=None,
-            )
-
-        # Annotate segments...
+        # Get the content and annotations of each query from the store
+        contents = list()
         annotations = list()
-        for elem in self.annotList:
-            for dic in elem:
-                annotations.append(dic)
-
-        for idx, segment in enumerate(segmentation):
-            segment.annotations.update(annotations[idx])
-            segmentation[idx] = segment
+        store = self.open_store()
+        for query, postIds in zip(self.queryParams, self.queryIds):
+            for content, annotation in self.load_segments(
+                store, query, postIds
+            ):
+                contents.append(content)
+                annotations.append(annotation)
+        store.close()
+
+        # Create a single input and one segment per post or comment...
+        segments = list()
+        start = 0
+        if contents:
+            newInput = Input("".join(contents), self.captionTitle)
+            self.createdInputs.append(newInput)
+            str_index = newInput[0].str_index
+            for content, annotation in zip(contents, annotations):
+                segments.append(
+                    Segment(str_index, start, start + len(content), annotation)
+                )
+                start += len(content)
+        segmentation = Segmentation(segments, label=self.captionTitle)
 
         # Calculate number of characters...
-        num_chars = 0
-        for segment in segmentation:
-            num_chars += len(Segmentation.get_data(segment.str_index))
+        num_chars = start
         
         # If there is data...
         if len(segmentation) != 0:
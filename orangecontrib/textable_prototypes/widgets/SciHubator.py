@@ -29,8 +29,13 @@ __email__ = "aris.xanthos@unil.ch"
 import re
 import time
 import tempfile
+import shutil
 import os
+import multiprocessing
 
+from concurrent.futures import (
+    ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+)
 from functools import partial
 import pdfplumber
 import requests
@@ -60,6 +65,7 @@ class SciHubator(OWTextableBaseWidget):
         DOI (str) : Single DOI value.
         DOIs (list) : List of DOIs added by the user
         createdInputs (list) : List of created LTTL.Inputs
+        failedDOIs (list) : DOIs that couldn't be processed, with the reason
     """
 
     #Version minimale
@@ -99,6 +105,11 @@ class SciHubator(OWTextableBaseWidget):
     # Ici-dessous les variables qui n'ont pas été copiées, et conçues spécialement pour SciHubator
     importAllorBib = Setting(0)
 
+    # Max number of concurrent downloads and of PDF extraction processes
+    # (None for the number of processors)...
+    downloadWorkers = 4
+    extractWorkers = None
+
     def __init__(self):
         """
         Initializes the SciHubator widget, including the GUI components and settings
@@ -111,6 +122,7 @@ class SciHubator(OWTextableBaseWidget):
         self.extractedText = ''
         self.DOI = ''
         self.createdInputs = []
+        self.failedDOIs = []
 
         self.infoBox = InfoBox(widget=self.controlArea)
         self.sendButton = SendButton(
@@ -290,19 +302,19 @@ class SciHubator(OWTextableBaseWidget):
 
         Steps:
             1. Verifies Sci-Hub accessibility.
-            2. Downloads PDFs for each DOI.
-            3. Extracts text from each PDF using pdfplumber.
-            4. Wraps extracted text into LTTL.Inputs with DOI annotations.
-            5. Concatenates inputs if multiple DOIs are processed.
+            2. Downloads PDFs for each DOI and extracts their text using
+               pdfplumber, in a pipeline (see downloadAndExtract).
+            3. Wraps extracted text into LTTL.Inputs with DOI annotations.
+            4. Concatenates inputs if multiple DOIs are processed.
 
         Returns :
             Segmentation: A single or concatenated segmentation(s) ready for output.
-
-        Raises:
-            Emits error messages and halts processing if:
+            dict: An error message (under the "error" key) if:
             - Sci-Hub is unreachable.
-            - A download fails.
-            - A PDF cannot be parsed.
+            - No PDF could be downloaded and parsed (with the reason of
+              each failure).
+            DOIs whose download or parsing fails are skipped and reported
+            in a warning (see self.failedDOIs).
         """
 
         # At start of processing, set progress bar to 1%.
@@ -312,73 +324,46 @@ class SciHubator(OWTextableBaseWidget):
 
         # DOIList.append(self.DOIContent)
 
-        # Indicate the total number of iterations that the
-        # progress bar will go through (e.g. number of input
-        # segments, number of selected files, etc.), then
-        # set current iteration to 1.
-        max_itr = len(self.DOIs)
-        cur_itr = 1
-
         # Permet de tester la connexion à Sci-Hub
         if not test_scihub_accessible():
-            self.sendNoneToOutputs()
-            self.infoBox.setText("SciHub inaccessible - verify your connexion", 'error')
-            return
+            return {"error": "SciHub inaccessible - verify your connexion"}
         # Actual processing...
 
-        # For each progress bar iteration...
-        tempdir = tempfile.TemporaryDirectory()
-        for DOI in self.DOIs:
-
-            # Update progress bar manually...
-            self.signal_prog.emit(int(100 * cur_itr / max_itr), False)
-            cur_itr += 1
-
-            # code ajouté ici
-            paper = DOI
-            paper_type = "doi"
-            out = f"{tempdir.name}/{self.DOIs.index(DOI)}"
-            try:
-                scihub_download(paper, paper_type=paper_type, out=out)
-            except Exception as ex:
-                print(ex)
-                self.sendNoneToOutputs()
-                self.infoBox.setText("An error occurred when downloading", 'error')
-                return
-            # Cancel operation if requested by user...
-            time.sleep(0.00001)  # Needed somehow!
-            if self.cancel_operation:
-                self.signal_prog.emit(100, False)
-                return
+        # Download the PDFs and extract their text (each PDF is extracted as
+        # soon as it is downloaded, while other downloads go on). After a
+        # cancel, extraction processes may still be reading PDFs when the
+        # directory is removed...
+        tempdirname = tempfile.mkdtemp()
+        try:
+            texts, self.failedDOIs = self.downloadAndExtract(tempdirname)
+        finally:
+            shutil.rmtree(tempdirname, ignore_errors=True)
+        if self.cancel_operation:
+            self.signal_prog.emit(100, False)
+            return
+        if not texts:
+            return {
+                "error": "No PDF could be downloaded and parsed. Please, "
+                         "verify DOI or connexion - failed: " + ", ".join(
+                             f"{DOI} ({reason})"
+                             for DOI, reason in self.failedDOIs
+                         )
+            }
 
         # Update infobox and reset progress bar...
-        self.signal_text.emit("Step 2/3: Processing...",
+        self.signal_text.emit("Step 3/3: Post-processing...",
                               "warning")
-        cur_itr = 0
+        max_itr = len(texts)
         cur_itr_p3 = 0
         self.signal_prog.emit(0, True)
         empty_re = False
-        for DOI in self.DOIs:
-            DOIText = ""
-            if os.path.exists(f"{tempdir.name}/{self.DOIs.index(DOI)}.pdf"):
-                try:
-                    with pdfplumber.open(f"{tempdir.name}/{self.DOIs.index(DOI)}.pdf") as pdf:
-                        for page in pdf.pages:
-                            self.signal_prog.emit(int(100 * cur_itr / max_itr), False)
-                            cur_itr += (1 / len(pdf.pages))
-                            DOIText += page.extract_text()
-                except Exception as e:
-                    self.sendNoneToOutputs()
-                    self.infoBox.setText(f"Error occurred when reading PDF: {str(e)}", 'error')
-                    return
-            else:
-                self.sendNoneToOutputs()
-                self.infoBox.setText("Download failed. Please, verify DOI or connexion", 'error')
-                return
-            ########
+        for idx, DOI in enumerate(self.DOIs):
+            if idx not in texts:
+                continue
+            DOIText = texts[idx]
 
             # Create an LTTL.Input...
-            if len(self.DOIs) == 1:
+            if len(texts) == 1:
                 # self.captionTitle is the name of the widget,
                 # which will become the label of the output
                 # segmentation.
@@ -388,11 +373,9 @@ class SciHubator(OWTextableBaseWidget):
 
             myInput = Input(DOIText, label)
 
-            self.signal_text.emit("Step 3/3: Post-processing...",
-                                  "warning")
-            max_itr = 2*len(self.DOIs) #+ int(self.importText)
+            cur_itr_p3 += 1
+            self.signal_prog.emit(int(100 * cur_itr_p3 / max_itr), False)
             if self.importAllorBib == 0:
-                cur_itr_p3 += 1
                 # Extract the first (and single) segment in the
                 # newly created LTTL.Input and annotate it with
                 # the length of the input segmentation.
@@ -406,10 +389,8 @@ class SciHubator(OWTextableBaseWidget):
                 # Add the  LTTL.Input to self.createdInputs.
                 self.createdInputs.append(myInput)
             if self.importAllorBib == 1:
-                cur_itr_p3 += 1
                 ma_regex = re.compile(r'(?<=\n)\n?(([Bb]iblio|[Rr][eé]f)\w*\W*\n)(.|\n)*')
                 regexes = [(ma_regex, 'tokenize')]
-                self.signal_prog.emit(int(100 * cur_itr_p3 / max_itr), False)
                 new_segmentation = tokenize(myInput, regexes)
                 if len(new_segmentation) == 0:
                     empty_re = True
@@ -429,7 +410,6 @@ class SciHubator(OWTextableBaseWidget):
             if self.cancel_operation:
                 self.signal_prog.emit(100, False)
                 return
-        tempdir.cleanup()
 
 
         # If there's only one LTTL.Input created, it is the
@@ -439,7 +419,7 @@ class SciHubator(OWTextableBaseWidget):
                 None, "SciHubator", "Not all sections were segmented",
                 QMessageBox.Ok
             )
-        if len(self.DOIs) == 1:
+        if len(self.createdInputs) == 1:
             return self.createdInputs[0]
         # Otherwise the widget's output is a concatenation...
         return Segmenter.concatenate(
@@ -449,6 +429,101 @@ class SciHubator(OWTextableBaseWidget):
             import_labels_as=None,
         )
 
+    def downloadAndExtract(self, tempdirname):
+        """
+        Download the PDF of each DOI and extract its text, in a pipeline.
+
+        A bounded pool of threads downloads the PDFs and hands each
+        downloaded PDF over to a pool of worker processes (if there are
+        several DOIs) that extracts its text, so that extraction overlaps
+        with the remaining downloads. A DOI that fails doesn't abort the
+        batch.
+
+        Args :
+            tempdirname (str): Directory where the PDFs are downloaded.
+
+        Returns :
+            tuple: The extracted texts by DOI position (dict) and the list
+            of failed DOIs with the reason of the failure.
+        """
+        self.signal_text.emit("Step 2/3: Processing...", "warning")
+        max_itr = 2 * len(self.DOIs)
+        cur_itr = 0
+        texts = dict()
+        failed = list()
+        downloadExecutor = ThreadPoolExecutor(
+            max_workers=self.downloadWorkers
+        )
+        if len(self.DOIs) > 1:
+            # Worker processes are spawned rather than forked from this
+            # (multithreaded) Qt process...
+            extractExecutor = ProcessPoolExecutor(
+                max_workers=self.extractWorkers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            extractExecutor = ThreadPoolExecutor(max_workers=1)
+        downloads = {
+            downloadExecutor.submit(
+                self.downloadUnlessCancelled,
+                DOI,
+                os.path.join(tempdirname, str(idx)),
+            ): idx
+            for idx, DOI in enumerate(self.DOIs)
+        }
+        extractions = dict()
+
+        # Hand over each downloaded PDF to the extraction pool...
+        for future in as_completed(downloads):
+            idx = downloads[future]
+            cur_itr += 1
+            try:
+                path = future.result()
+            except Exception as ex:
+                failed.append((idx, f"download: {ex}"))
+                cur_itr += 1
+            else:
+                extractions[
+                    extractExecutor.submit(extract_pdf_text, path)
+                ] = idx
+            self.signal_prog.emit(int(100 * cur_itr / max_itr), False)
+            if self.cancel_operation:
+                break
+
+        # Collect extracted texts...
+        if not self.cancel_operation:
+            for future in as_completed(extractions):
+                idx = extractions[future]
+                cur_itr += 1
+                try:
+                    texts[idx] = future.result()
+                except Exception as ex:
+                    failed.append((idx, f"PDF: {ex}"))
+                self.signal_prog.emit(int(100 * cur_itr / max_itr), False)
+                if self.cancel_operation:
+                    break
+
+        # Wait for running downloads (at most downloadWorkers) so that none
+        # of them writes to the directory once it is removed, but if
+        # cancelled, don't wait for running extractions...
+        downloadExecutor.shutdown(wait=True, cancel_futures=True)
+        extractExecutor.shutdown(
+            wait=not self.cancel_operation, cancel_futures=True
+        )
+        return texts, [(self.DOIs[idx], reason) for idx, reason in sorted(failed)]
+
+    def downloadUnlessCancelled(self, DOI, out):
+        """
+        Download the PDF of a DOI (see download_pdf), unless the operation
+        has been cancelled while the download was queued.
+
+        Raises :
+            IOError: If cancelled or if no PDF could be downloaded.
+        """
+        if self.cancel_operation:
+            raise IOError("cancelled")
+        return download_pdf(DOI, out)
+
     @OWTextableBaseWidget.task_decorator
     def task_finished(self, f):
         """
@@ -456,6 +531,7 @@ class SciHubator(OWTextableBaseWidget):
 
         This method :
             - Retrieves the result of the processing task.
+            - Displays the error message if processing failed.
             - Calculates the number of segments and total characters.
             - Displays an informative message to the user.
             - Sends the processed data to the output.
@@ -468,11 +544,23 @@ class SciHubator(OWTextableBaseWidget):
         # Get the result value of self.processData.
         processed_data = f.result()
 
+        # If processing failed...
+        if isinstance(processed_data, dict):
+            self.infoBox.setText(processed_data["error"], "error")
+            self.sendNoneToOutputs()
+            return
+
         # If it is not None...
         if processed_data:
             message = f"{len(processed_data)} segment@p sent to output "
             message = pluralize(message, len(processed_data))
-            self.infoBox.setText(message)
+            if self.failedDOIs:
+                message += "- failed: " + ", ".join(
+                    f"{DOI} ({reason})" for DOI, reason in self.failedDOIs
+                )
+                self.infoBox.setText(message, "warning")
+            else:
+                self.infoBox.setText(message)
             self.send("Segmentation", processed_data)
 
     # The following method should be copied verbatim in
@@ -571,6 +659,40 @@ class SciHubator(OWTextableBaseWidget):
     def onDeleteWidget(self):
         """Clear created inputs on widget deletion"""
         self.clearCreatedInputs()
+def download_pdf(DOI, out):
+    """
+    Download the PDF of a DOI from Sci-Hub.
+
+    Args :
+        DOI (str): The DOI of the article.
+        out (str): Path of the PDF (without the .pdf extension).
+
+    Returns :
+        str: Path of the downloaded PDF.
+
+    Raises :
+        IOError: If no PDF could be downloaded.
+    """
+    scihub_download(DOI, paper_type="doi", out=out)
+    if not os.path.exists(f"{out}.pdf"):
+        raise IOError("no PDF found")
+    return f"{out}.pdf"
+
+
+def extract_pdf_text(path):
+    """
+    Extract the text of a PDF with pdfplumber.
+
+    Args :
+        path (str): Path of the PDF.
+
+    Returns :
+        str: The text of all pages.
+    """
+    with pdfplumber.open(path) as pdf:
+        return "".join(page.extract_text() or "" for page in pdf.pages)
+
+
 def test_scihub_accessible():
     """
     Test the internet connection and/or sci-hub's accessibility.
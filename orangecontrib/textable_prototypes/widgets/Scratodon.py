@@ -3,14 +3,19 @@ from Orange.widgets.utils.widgetpreview import WidgetPreview
 
 from _textable.widgets.TextableUtils import (
     OWTextableBaseWidget, VersionedSettingsHandler,
-    InfoBox, SendButton, ProgressBar,
+    InfoBox, SendButton,
 )
-from mastodon import Mastodon
+from mastodon import Mastodon, MastodonError
 from LTTL.Segment import Segment
 from LTTL.Segmentation import Segmentation
-import LTTL.Segmenter as Segmenter
+import LTTL.SegmenterThread as Segmenter
 from LTTL.Input import Input
+import os
+import re
 import time
+import pickle
+import inspect
+from functools import partial
 from urllib.parse import urlparse
 
 class Scratodon(OWTextableBaseWidget):
@@ -59,18 +64,24 @@ class Scratodon(OWTextableBaseWidget):
     minReblogs = settings.Setting(0)
     minLikes = settings.Setting(0)
 
+    # Folder where fetched posts are saved, per account/timeline
+    cachedFoldername = "cached_scratodon_posts"
+
     def __init__(self):
         super().__init__()
 
         #Attributs initilizations...
         self.segmentation = Input("")
         self.createdInputs = list()
+        self.clients = dict()
+        self.accountIds = dict()
 
         # GUI
         self.sendButton = SendButton(
             widget=self.controlArea,
             master=self,
             callback=self.sendData,
+            cancelCallback=self.cancel_manually,
             infoBoxAttribute="infoBox",
             sendIfPreCallback=self.updateGUI,
         )
@@ -285,8 +296,14 @@ class Scratodon(OWTextableBaseWidget):
             self.URLBox.setVisible(True)
 
 
-    def fetchUserPosts(self, username_at_instance, n=100, exclude_replies=False, exclude_reblogs=False, only_media=False):
-        """Takes a string like (@)user@instance.net or a URL and returns a dictionary of the n last posts from user"""
+    def getClient(self, domain):
+        """Return the Mastodon client for an instance, created only once"""
+        if domain not in self.clients:
+            self.clients[domain] = Mastodon(api_base_url=domain)
+        return self.clients[domain]
+
+    def fetchUserPosts(self, username_at_instance, n=100, exclude_replies=False, exclude_reblogs=False, only_media=False, refresh=False):
+        """Takes a string like (@)user@instance.net or a URL and returns a list of the n last posts from user"""
 
         # If url input
         if isinstance(username_at_instance, str) and username_at_instance.startswith("http"):
@@ -299,85 +316,50 @@ class Scratodon(OWTextableBaseWidget):
         if isinstance(username_at_instance, str) and username_at_instance[0] == "@":
             username_at_instance = username_at_instance[1:]
 
-        # Initialize progress bar...
-        progressBar = ProgressBar(
-            self,
-            iterations=int(n/40)+1
-        )
-        
         try:
             user, instance = username_at_instance.split("@")
-        except Exception as e:
-                print(f"Une erreur est survenue: {e}")
-                #Return an error
-                self.infoBox.setText("Can't find any '@', please check your User ID", "warning")
-                self.send('Scratted posts', None)
-
-                #And free the user
-                self.controlArea.setDisabled(False)
-                return
+        except ValueError:
+            raise ValueError("Can't find any '@', please check your User ID")
 
         domain = f"https://{instance}/"
         
-        myMastodon = Mastodon(api_base_url=domain)
-
-        print(f"Trying to get {n} posts from @{user} on {domain}", "\n")
-
         try:
-            user_id = myMastodon.account_lookup(user).id
-        except Exception as e:
-            #Return an error
-            self.infoBox.setText("Can't find this account, please check your User ID", "warning")
-            self.send('Scratted posts', None)
-
-            #And free the user
-            self.controlArea.setDisabled(False)
-            return            
-
-        print(f"{username_at_instance}'s id is: {user_id}", "\n")
-
-        # Initialisation d'un dict vide pour contenir les objects
-        all_posts = []
-        # Créer un index pour requetes de plus de 40 posts
-        max_id = None
-
-        # Récupération des publications par lots jusqu'à atteindre le
-        # nombre désiré `n` ou qu'il n'y ait plus de publications disponibles
-        while len(all_posts) < n:
-            posts = myMastodon.account_statuses(
-                    user_id,
-                    exclude_replies=exclude_replies,
-                    exclude_reblogs=exclude_reblogs,
-                    only_media=only_media,
-                    max_id=max_id,
-                    limit=min(40, n - len(all_posts)))
-
-            all_posts.extend(posts)
-            
-            try:
-                max_id = posts[-1].id - 1
-            #If fetching all the account isn't enough, tell the user
-            except:
-                print(f"Got ALL posts from this user, only {len(all_posts)}")
-                return all_posts
-
-            print(f"Fetched {len(all_posts)} posts so far.")
-            progressBar.advance()
+            myMastodon = self.getClient(domain)
+            if (domain, user) not in self.accountIds:
+                self.accountIds[domain, user] =     \
+                    myMastodon.account_lookup(user).id
+        except Exception:
+            raise ValueError("Can't find this account, please check your User ID")
+        user_id = self.accountIds[domain, user]
+
+        def fetchPage(max_id, since_id, limit):
+            return myMastodon.account_statuses(
+                user_id,
+                exclude_replies=exclude_replies,
+                exclude_reblogs=exclude_reblogs,
+                only_media=only_media,
+                max_id=max_id,
+                since_id=since_id,
+                limit=limit,
+            )
 
-        print(f"Got {len(all_posts)} posts from {username_at_instance}", "\n")
-        return all_posts
+        cacheKey = "user_%s_%s_%i%i%i" % (
+            instance, user, exclude_replies, exclude_reblogs, only_media,
+        )
+        return self.fetchStatuses(fetchPage, cacheKey, n, refresh)
 
-    def fetchTimelines(self, instance, n=100, only_media=False):
+    def fetchTimelines(self, instance, n=100, only_media=False, refresh=False):
         """
         Récupère les publications des timelines publiques locales ou fédérées d'une instance Mastodon.
 
         Args:
         instance (str): URL de l'instance Mastodon, par exemple "https://instance.net" ou "instance.net"
-        is_local (bool): True pour récupérer à partir de la timeline locale, False pour la timeline fédérée
         n (int): Nombre de publications à récupérer
+        only_media (bool): True pour ne récupérer que les publications avec médias
+        refresh (bool): True pour récupérer à nouveau les publications déjà enregistrées
 
         Returns:
-        all_post: Une dict contenant les publications de la timeline spécifiée
+        all_post: Une liste contenant les publications de la timeline spécifiée
         """
 
         # Transformer la logique de sélection Local/Fédéré d'une string (GUI) en Bool (Utilisé par le script)
@@ -388,56 +370,138 @@ class Scratodon(OWTextableBaseWidget):
             is_local = False
 
         # Normalisation de l'URL de l'instance pour garantir l'inclusion de "https://"
-        if not self.URL.startswith("http://") and not self.URL.startswith("https://"):
-            instance = f"https://{self.URL}"
+        if not instance.startswith("http://") and not instance.startswith("https://"):
+            instance = f"https://{instance}"
 
-        # Initialize progress bar...
-        progressBar = ProgressBar(
-            self,
-            iterations=int(n/40)+1
-        )
+        try:
+            myMastodon = self.getClient(instance)
+        except Exception:
+            raise ValueError("Can't find this instance, please check your URL")
+
+        def fetchPage(max_id, since_id, limit):
+            return myMastodon.timeline(
+                'public',
+                local=is_local,
+                max_id=max_id,
+                since_id=since_id,
+                only_media=only_media,
+                limit=limit,
+            )
 
-        # Initialisation de la connexion à l'instance
-        myMastodon = Mastodon(api_base_url=instance)
-        
-        # Initialisation d'un dict vide pour contenir les objects
-        all_posts = []
-        # Argument qui limite le nombre de posts
-        remaining = n
-        # Créer un index pour requetes de plus de 40 posts
-        max_id = None
-
-        # Récupération des publications par lots jusqu'à atteindre le nombre désiré `n` ou qu'il n'y ait plus de publications disponibles
-        while remaining > 0:
-            try:
-                timeline = myMastodon.timeline('public', 
-                                            local=is_local,
-                                            max_id=max_id,
-                                            only_media=only_media,
-                                            limit=min(remaining, n))
-                if not timeline:
+        cacheKey = "timeline_%s_%s_%i" % (
+            urlparse(instance).netloc, self.selectedSource, only_media,
+        )
+        return self.fetchStatuses(fetchPage, cacheKey, n, refresh)
+
+    def fetchStatuses(self, fetchPage, cacheKey, n, refresh=False):
+        """Return the n most recent statuses of an account or timeline.
+
+        Statuses saved by previous sends are reused: only statuses newer than
+        the most recent saved one are fetched (since_id), then older ones
+        (max_id) if more are needed. Saved statuses keep the like and reblog
+        counts they had when they were fetched, so with refresh=True all n
+        statuses are fetched again (and saved with their current counts).
+        Pages are fetched 40 statuses at a time (the API maximum) and
+        cancellation is checked between pages; None is returned if the
+        operation was cancelled.
+        """
+        if refresh:
+            cached = {"posts": list(), "exhausted": False}
+        else:
+            cached = self.loadCachedPosts(cacheKey)
+        posts = cached["posts"]
+        exhausted = cached["exhausted"]
+        max_itr = int(n/40)+1
+        cur_itr = 1
+
+        # Statuses newer than the saved ones...
+        if posts:
+            newPosts = list()
+            max_id = None
+            while len(newPosts) < n:
+                page = fetchPage(
+                    max_id=max_id, since_id=posts[0].id, limit=40,
+                )
+                if not page:
                     break
+                newPosts.extend(page)
+                max_id = page[-1].id
+                self.signal_prog.emit(int(100*cur_itr/max_itr), False)
+                cur_itr += 1
+                if self.cancel_operation:
+                    return None
+
+            # If there are enough new statuses, drop the saved ones (there
+            # may be a gap between them)...
+            if len(newPosts) >= n:
+                posts = newPosts
+                exhausted = False
+            else:
+                posts = newPosts + posts
+
+        # Older statuses, until n statuses or no more statuses available...
+        while len(posts) < n and not exhausted:
+            page = fetchPage(
+                max_id=posts[-1].id if posts else None,
+                since_id=None,
+                limit=min(40, n - len(posts)),
+            )
+            if not page:
+                exhausted = True
+                break
+            posts.extend(page)
+            self.signal_prog.emit(int(100*cur_itr/max_itr), False)
+            cur_itr += 1
+            if self.cancel_operation:
+                return None
+
+        self.saveCachedPosts(
+            cacheKey,
+            {"posts": posts[:n], "exhausted": exhausted and len(posts) <= n},
+        )
+        return posts[:n]
 
-                all_posts.extend(timeline)
-                remaining -= 40
-                max_id = timeline[-1]['id']
-                limit=min(remaining, n)
-
-                print(f"Fetched {len(all_posts)} posts so far.")
-                progressBar.advance()
-
-            except Exception as e:
-                print(f"Une erreur est survenue: {e}")
-                #Return an error
-                self.infoBox.setText("Can't find this instance, please check your URL", "warning")
-                self.send('Scratted posts', None)
-
-                #And free the user
-                self.controlArea.setDisabled(False)
-                return
-
-        print(f"Got {len(all_posts)} posts from timeline of {instance}", "\n")
-        return all_posts
+    def loadCachedPosts(self, cacheKey):
+        """Load the statuses saved for an account or timeline"""
+        path = os.path.dirname(
+            os.path.abspath(inspect.getfile(inspect.currentframe()))
+        )
+        try:
+            file = open(
+                os.path.join(
+                    path,
+                    self.__class__.cachedFoldername,
+                    re.sub(r"[^\w.-]", "_", cacheKey),
+                ),
+                "rb",
+            )
+            cached = pickle.load(file)
+            file.close()
+            return cached
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return {"posts": list(), "exhausted": False}
+
+    def saveCachedPosts(self, cacheKey, cached):
+        """Save the statuses fetched for an account or timeline"""
+        path = os.path.join(
+            os.path.dirname(
+                os.path.abspath(inspect.getfile(inspect.currentframe()))
+            ),
+            self.__class__.cachedFoldername,
+        )
+        try:
+            os.makedirs(path)
+        except OSError:
+            pass
+        try:
+            file = open(
+                os.path.join(path, re.sub(r"[^\w.-]", "_", cacheKey)),
+                "wb",
+            )
+            pickle.dump(cached, file, -1)
+            file.close()
+        except IOError:
+            pass
 
     def filterPosts(self, all_posts):
         """Set an empty dictionary, where the segmentation will be filtered"""
@@ -464,12 +528,7 @@ class Scratodon(OWTextableBaseWidget):
 
         if not filtered_posts:
             #Return an error
-            self.infoBox.setText("Filters too strong, no posts were kept", "warning")
-            self.send('Scratted posts', None)
-
-            #And free the user
-            self.controlArea.setDisabled(False)
-            return
+            raise ValueError("Filters too strong, no posts were kept")
         return filtered_posts
     
     def createSegmentation(self, posts_dict):
@@ -499,8 +558,9 @@ class Scratodon(OWTextableBaseWidget):
         # Otherwise the widget's output is a concatenation...
         else:
             self.segmentation = Segmenter.concatenate(
-                self.createdInputs,
-                self.captionTitle,
+                caller=self,
+                segmentations=self.createdInputs,
+                label=self.captionTitle,
                 import_labels_as=None,
             )
 
@@ -558,14 +618,6 @@ class Scratodon(OWTextableBaseWidget):
             #And replace it's original (we need to do it this way because LTTL)
             self.segmentation[idx] = segment
 
-        #Debug, print chaque segment et son contenu
-        for segment in self.segmentation:
-            print(segment)
-            print(segment.get_content(), "\n")
-        print(f"Segmented {len(posts_dict)} posts.")
-
-        self.controlArea.setDisabled(False)
-
         return self.segmentation
 
     #sendData method
@@ -585,7 +637,6 @@ class Scratodon(OWTextableBaseWidget):
 
         # Clear old created Inputs
         self.clearCreatedInputs()
-        self.controlArea.setDisabled(True)
 
         #Initialiser filtres
         excludeReblogs = False
@@ -600,13 +651,53 @@ class Scratodon(OWTextableBaseWidget):
         if self.filterMedias=="Keep Only":
             onlyMedia = True
 
-        if self.selectedSource == "User":
-            dictPosts = self.fetchUserPosts(self.userID, self.amount, excludeReplies, excludeReblogs, onlyMedia)
-        else:
-            dictPosts = self.fetchTimelines(self.URL, self.amount, onlyMedia)
+        self.infoBox.setText("Step 1/2: Fetching posts...", "warning")
+        self.progressBarInit()
+
+        # Fetch posts and build segmentation in a worker thread...
+        self.threading(
+            partial(self.processData, excludeReplies, excludeReblogs, onlyMedia)
+        )
+
+    def processData(self, excludeReplies, excludeReblogs, onlyMedia):
+        """Fetch, filter and segment posts (run in a worker thread)"""
+        self.signal_prog.emit(1, False)
+        try:
+            # Like and reblog counts of saved statuses may be outdated, so
+            # they are fetched again if these counts are filtered...
+            refresh = self.minLikes > 0 or self.minReblogs > 0
+            if self.selectedSource == "User":
+                dictPosts = self.fetchUserPosts(self.userID, self.amount, excludeReplies, excludeReblogs, onlyMedia, refresh)
+            else:
+                dictPosts = self.fetchTimelines(self.URL, self.amount, onlyMedia, refresh)
+
+            # Operation cancelled by user...
+            if dictPosts is None:
+                return None
+
+            self.signal_text.emit("Step 2/2: Segmenting posts...", "warning")
+            filteredPosts = self.filterPosts(dictPosts)
+        except ValueError as error:
+            return {"error": str(error)}
+        except MastodonError:
+            return {"error": "Can't reach this instance, please check your "
+                             "connection or URL"}
+        return self.createSegmentation(filteredPosts)
+
+    @OWTextableBaseWidget.task_decorator
+    def task_finished(self, f):
+        """Send the segmentation built by self.processData"""
+        processed_data = f.result()
+
+        if processed_data is None:
+            return
+
+        if isinstance(processed_data, dict):
+            self.infoBox.setText(processed_data["error"], "warning")
+            self.send('Scratted posts', None)
+            return
 
-        filteredPosts = self.filterPosts(dictPosts)
-        self.segmentation = self.createSegmentation(filteredPosts)
+        self.segmentation = processed_data
 
         # Send confirmation of how many toots were outputted
         message = f"Successfully scrapped! {len(self.segmentation)} segments sent to output"
@@ -629,6 +720,7 @@ class Scratodon(OWTextableBaseWidget):
             changed = title != self.captionTitle
             super().setCaption(title)
             if changed:
+                self.cancel() # Cancel current operation
                 self.sendButton.settingsChanged()
         else:
             super().setCaption(title)
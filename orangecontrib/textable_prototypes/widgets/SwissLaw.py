@@ -31,10 +31,18 @@ from LTTL.Input import Input
 
 from Orange.widgets.utils.widgetpreview import WidgetPreview
 
+from LTTL.Segment import Segment
+
 import inspect
 import os
 import csv
+import hashlib
+import pickle
+import re
 import requests
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from xml.parsers import expat
 
 
 from _textable.widgets.TextableUtils import (
@@ -79,6 +87,13 @@ class SwissLaw(OWTextableBaseWidget):
     myBasket = settings.Setting([])
     importedURLs = settings.Setting([])
 
+    # Persistent cache of downloaded documents (bump version to invalidate)
+    cachedFoldername = "cached_swisslaw_documents"
+    cacheVersion = 4
+
+    # Concurrent download parameters
+    maxWorkers = 4
+
     def __init__(self):
         """Widget creator."""
 
@@ -119,14 +134,33 @@ class SwissLaw(OWTextableBaseWidget):
         except IOError:
             print("Failed to open csv file.")
 
-        # Dict stocking the documents (avoid re-download)
+        # Index of law texts by name, and of urls by law text and language
+        self.languages = ["FR", "DE", "IT"]
+        self.lawIndex = {
+            law_text: idx
+            for idx, law_text in enumerate(self.database["law_text"])
+        }
+        self.urlIndex = {
+            (law_text, language): self.database["Urls"][idx][lang_idx]
+            for law_text, idx in self.lawIndex.items()
+            for lang_idx, language in enumerate(self.languages)
+        }
+
+        # Dict stocking the documents validated during this session
         self.cached = dict()
+        # Session reusing connections to fedlex.admin.ch
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.__class__.maxWorkers,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         # Stock all the documents names and parameters
         self.documents = sorted(self.database["law_text"])
         self.selectedDocument = self.documents[0]
         self.segLevels = list()
         self.selectedSegLevel = "No segmentation"
-        self.languages = ["FR", "DE", "IT"]
         self.selectedLanguage = "FR"
         # Selections box attributs
         self.corpusSelectedItems = list()
@@ -295,13 +329,14 @@ class SwissLaw(OWTextableBaseWidget):
         self.segLevels.append("No Segmentation")
 
         # Check if the selected law text has title, article or chapter
-        if int(self.database["title"][self.database["law_text"].index(self.selectedDocument)]) > 0:
+        idx = self.lawIndex[self.selectedDocument]
+        if int(self.database["title"][idx]) > 0:
             self.segLevels.append("Into title")
 
-        if int(self.database["chap"][self.database["law_text"].index(self.selectedDocument)]) > 0:
+        if int(self.database["chap"][idx]) > 0:
             self.segLevels.append("Into chapter")
 
-        if int(self.database["art"][self.database["law_text"].index(self.selectedDocument)]) > 0:
+        if int(self.database["art"][idx]) > 0:
             self.segLevels.append("Into article")
 
         self.selectedSegLevel = self.segLevels[0]
@@ -364,10 +399,78 @@ class SwissLaw(OWTextableBaseWidget):
         self.selectedLanguage = "FR"
 
     def get_xml_contents(self, urls) -> str:
-        """Download xml law text based on the url"""
-        response = requests.get(urls)
+        """Get xml law text based on the url"""
+        return self.get_document(urls)["content"]
+
+    def get_document(self, urls):
+        """Get xml law text and its structural index based on the url, from
+        the disk cache if it is still up to date (checked with a conditional
+        request), otherwise by downloading and indexing it"""
+        cached = self.loadCachedDocument(urls)
+        headers = dict()
+        if cached is not None:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["lastModified"]:
+                headers["If-Modified-Since"] = cached["lastModified"]
+        try:
+            response = self.session.get(urls, headers=headers, timeout=30)
+        except requests.exceptions.RequestException:
+            # Offline: fall back on cached copy if any...
+            if cached is not None:
+                return cached
+            raise
+        if response.status_code == 304 and cached is not None:
+            return cached
+        response.raise_for_status()
         xml_content = response.content.decode('utf-8')
-        return xml_content
+        document = {
+            "version": self.__class__.cacheVersion,
+            "etag": response.headers.get("ETag"),
+            "lastModified": response.headers.get("Last-Modified"),
+            "content": xml_content,
+            "index": index_structure(response.content),
+        }
+        self.saveCachedDocument(urls, document)
+        return document
+
+    def cachedDocumentPath(self, url):
+        """Return the path of the disk cache file for a document url"""
+        return os.path.join(
+            os.path.dirname(
+                os.path.abspath(inspect.getfile(inspect.currentframe()))
+            ),
+            self.__class__.cachedFoldername,
+            hashlib.sha1(url.encode("utf-8")).hexdigest(),
+        )
+
+    def loadCachedDocument(self, url):
+        """Load a document and its index from disk cache (None if absent
+        or outdated)"""
+        try:
+            file = open(self.cachedDocumentPath(url), "rb")
+            cached = pickle.load(file)
+            file.close()
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        if cached.get("version") != self.__class__.cacheVersion:
+            return None
+        return cached
+
+    def saveCachedDocument(self, url, cached):
+        """Save a downloaded document and its index to disk cache"""
+        path = self.cachedDocumentPath(url)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            pass
+        try:
+            file = open(path + ".part", "wb")
+            pickle.dump(cached, file, -1)
+            file.close()
+            os.replace(path + ".part", path)
+        except IOError:
+            pass
 
     # Function computing results then sending them to the widget output
     def sendData(self):
@@ -396,48 +499,100 @@ class SwissLaw(OWTextableBaseWidget):
         annotations = list()
         segmentation_levels = list()
 
-        # Get the xml law text...
-        for item in self.myBasket:
-
-            # ...from the self.cached dict if already downloaded
-            if self.database["Urls"][self.database["law_text"].index(item[0])][self.languages.index(item[2])]\
-                    in self.cached:
-                content = self.cached[self.database["Urls"][self.database["law_text"].index(item[0])][self.languages.index(item[2])]]
-            # ...with the get_xml_function if not already downloaded
-            else:
-                content = self.get_xml_contents(
-                    self.database["Urls"][self.database["law_text"].index(item[0])][self.languages.index(item[2])]
-                )
-                self.cached[self.database["Urls"][self.database["law_text"].index(item[0])][self.languages.index(item[2])]] = content
+        # Get the xml law texts that are not in the self.cached dict yet,
+        # concurrently with the get_xml_contents function (documents that
+        # can't be downloaded are skipped)...
+        urls = [self.urlIndex[(item[0], item[2])] for item in self.myBasket]
+        counts = Counter(urls)
+        toFetch = [url for url in counts if url not in self.cached]
+        progressBar.advance(len(urls) - sum(counts[url] for url in toFetch))
+        failed = set()
+        executor = ThreadPoolExecutor(max_workers=self.__class__.maxWorkers)
+        futures = {
+            executor.submit(self.get_document, url): url
+            for url in toFetch
+        }
+        for future in as_completed(futures):
+            try:
+                self.cached[futures[future]] = future.result()
+            except (
+                requests.exceptions.RequestException,
+                UnicodeDecodeError,
+                expat.ExpatError,
+            ):
+                failed.add(futures[future])
+            progressBar.advance(counts[futures[future]])
+        executor.shutdown()
+
+        # If no document could be downloaded...
+        if len(failed) == len(counts):
+            progressBar.finish()
+            self.controlArea.setDisabled(False)
+            self.infoBox.setText(
+                "Couldn't download data from Fedlex website.",
+                "error"
+            )
+            self.send("Law Documents importation", None)
+            return
 
-            documents.append(content)
+        for item, url in zip(self.myBasket, urls):
+            if url in failed:
+                continue
+            documents.append(url)
 
             # Get the desired segmentation
             segmentation_levels.append(item[1].replace("Into ", ""))
 
             # Add segment annotations
             annotations.append({"Document": item[0], "Language": item[2]})
-            progressBar.advance()
 
-        # Segment the text with the desired segmentation (using import_xml)
+        # Segment the text with the desired segmentation (using the
+        # structural index of each document)...
         segmentations = []
+        inputs = dict()
 
-        for doc_idx, document in enumerate(documents):
-            newInput = Input(document, self.captionTitle)
-            self.createdInputs.append(newInput)
+        for doc_idx, url in enumerate(documents):
+            # Create a single Input per document...
+            if url not in inputs:
+                inputs[url] = Input(self.cached[url]["content"], self.captionTitle)
+                self.createdInputs.append(inputs[url])
+            newInput = inputs[url]
 
             if segmentation_levels[doc_idx] == "No Segmentation":
-                current_segmentation = newInput
+                current_segmentation = Segmentation(
+                    [
+                        Segment(
+                            str_index=newInput[0].str_index,
+                            start=newInput[0].start,
+                            end=newInput[0].end,
+                            annotations=dict(),
+                        )
+                    ],
+                    label=self.captionTitle,
+                )
             else:
-                current_segmentation = Segmenter.import_xml(newInput, segmentation_levels[doc_idx])
+                current_segmentation = Segmentation(
+                    [
+                        Segment(
+                            str_index=newInput[0].str_index,
+                            start=start,
+                            end=end,
+                            annotations=dict(attributes),
+                        )
+                        for tag, start, end, attributes
+                        in self.cached[url]["index"]
+                        if tag == segmentation_levels[doc_idx]
+                    ],
+                    label=self.captionTitle,
+                )
             # Annotate segments...
             for idx, segment in enumerate(current_segmentation):
                 segment.annotations.update(annotations[doc_idx])
                 current_segmentation[idx] = segment
             segmentations.append(current_segmentation)
 
-        # If there's only one document, the widget's output is the created Input.
-        if len(self.createdInputs) == 1:
+        # If there's only one document, the widget's output is its segmentation.
+        if len(segmentations) == 1:
             self.segmentation = segmentations[0]
 
         # Otherwise the widget's output is a concatenation...
@@ -462,7 +617,17 @@ class SwissLaw(OWTextableBaseWidget):
             numChars += segmentLength
         message += "(%i character@p)." % numChars
         message = pluralize(message, numChars)
-        self.infoBox.setText(message)
+        if failed:
+            message += " Couldn't download: %s." % ", ".join(
+                dict.fromkeys(
+                    "%s (%s)" % (item[0], item[2])
+                    for item, url in zip(self.myBasket, urls)
+                    if url in failed
+                )
+            )
+            self.infoBox.setText(message, "warning")
+        else:
+            self.infoBox.setText(message)
 
         # Final send
         self.send("Law Documents importation", self.segmentation)
@@ -486,5 +651,62 @@ class SwissLaw(OWTextableBaseWidget):
             super().setCaption(title)
 
 
+# Elements recorded in the structural index of law documents...
+STRUCTURE_TAGS = {"title", "chapter", "article"}
+
+# Start tag, whose attribute values may contain '>'...
+START_TAG_REGEX = re.compile(
+    rb"""<[^\s/>]+(?:\s+[^\s=/>]+\s*=\s*(?:"[^"]*"|'[^']*'))*\s*/?>"""
+)
+
+
+def index_structure(xml_bytes):
+    """Parse an xml law document once with a streaming parser and return
+    the list of its titles, chapters and articles in document order, as
+    (tag, start, end, attributes) tuples where start and end are the
+    character offsets of the element's content in the decoded document.
+    Empty elements are skipped, as in Segmenter.import_xml.
+    """
+    parser = expat.ParserCreate()
+    elements = list()
+    stack = list()
+
+    def start_element(name, attributes):
+        name = name.rsplit(":", 1)[-1]
+        if name in STRUCTURE_TAGS:
+            # Content starts after the '>' closing the start tag...
+            start = START_TAG_REGEX.match(
+                xml_bytes, parser.CurrentByteIndex
+            ).end()
+            elements.append([name, start, start, attributes])
+            stack.append(elements[-1])
+        else:
+            stack.append(None)
+
+    def end_element(name):
+        element = stack.pop()
+        if element is not None and xml_bytes[element[1] - 2:element[1]] != b"/>":
+            element[2] = parser.CurrentByteIndex
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.Parse(xml_bytes, True)
+
+    # Convert byte offsets to character offsets in a single pass...
+    char_offsets = dict()
+    byte_offset = char_offset = 0
+    for offset in sorted(
+        set(offset for element in elements for offset in element[1:3])
+    ):
+        char_offset += len(xml_bytes[byte_offset:offset].decode("utf-8"))
+        char_offsets[offset] = char_offset
+        byte_offset = offset
+    return [
+        (name, char_offsets[start], char_offsets[end], attributes)
+        for name, start, end, attributes in elements
+        if start != end
+    ]
+
+
 if __name__ == "__main__":
     WidgetPreview(SwissLaw).run()
@@ -31,7 +31,6 @@ from Orange.widgets.utils.widgetpreview import WidgetPreview
 from LTTL.Segmentation import Segmentation
 from LTTL.Input import Input
 import LTTL.Segmenter as Segmenter
-import LTTL.Processor as Processor
 
 from _textable.widgets.TextableUtils import (
     OWTextableBaseWidget, VersionedSettingsHandler, pluralize,
@@ -40,11 +39,17 @@ from _textable.widgets.TextableUtils import (
 
 from PyQt5.QtWidgets import QMessageBox
 
-import urllib
-import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from bisect import bisect_left
+from html.parser import HTMLParser
+
+import codecs
 import inspect
 import os
 import pickle
+import hashlib
+import requests
+import unicodedata
 
 
 class TheatreClassique(OWTextableBaseWidget):
@@ -83,6 +88,20 @@ class TheatreClassique(OWTextableBaseWidget):
 
     want_main_area = False
 
+    # Folder of the XML-TEI disk cache (in this module's directory) and
+    # version of its entries...
+    cachedFoldername = "cached_theatre_classique_plays"
+    cacheVersion = 1
+
+    # Number of plays downloaded simultaneously.
+    maxWorkers = 8
+
+    # Title catalogue file (in this module's directory), its format version
+    # and its columns...
+    catalogueFilename = "cached_title_list"
+    catalogueVersion = 1
+    catalogueColumns = ("title", "author", "year", "genre", "url")
+
     def __init__(self):
         """Widget creator."""
 
@@ -91,14 +110,24 @@ class TheatreClassique(OWTextableBaseWidget):
         # Other attributes...
         self.segmentation = None
         self.createdInputs = list()
-        self.titleSeg = None
-        self.filteredTitleSeg = None
-        self.filterValues = dict()
+        self.catalogue = None
+        self.filteredRows = list()
         self.base_url =     \
           u"http://www.theatre-classique.fr/pages/programmes/PageEdition.php"
         self.document_base_url =     \
           u"http://www.theatre-classique.fr/pages/"
 
+        # Plays validated during this session (url => XML-TEI content)...
+        self.cached = dict()
+        # Session reusing connections to theatre-classique.fr...
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.__class__.maxWorkers,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
         # Next two instructions are helpers from TextableUtils. Corresponding
         # interface elements are declared here and actually drawn below (at
         # their position in the UI)...
@@ -107,6 +136,7 @@ class TheatreClassique(OWTextableBaseWidget):
             widget=self.controlArea,
             master=self,
             callback=self.sendData,
+            cancelCallback=self.cancel_manually,
             infoBoxAttribute="infoBox",
             sendIfPreCallback=self.updateGUI,
         )
@@ -197,6 +227,10 @@ class TheatreClassique(OWTextableBaseWidget):
         
         gui.separator(widget=titleBox, height=3)
 
+        # These elements are frozen while the title list is being fetched
+        # (see manageGuiVisibility)...
+        self.guiElements.extend([self.advancedSettings, filterBox, titleBox])
+
         gui.separator(widget=self.controlArea, height=3)
 
         gui.rubber(self.controlArea)
@@ -254,23 +288,30 @@ class TheatreClassique(OWTextableBaseWidget):
             iterations=len(self.selectedTitles)
         )
 
-        # Attempt to connect to Theatre-classique and retrieve plays...
-        xml_contents = list()
-        annotations = list()
-        try:
-            for title in self.selectedTitles:
-                response = urllib.request.urlopen(
-                    self.document_base_url +
-                    self.filteredTitleSeg[title].annotations["url"]
-                )
-                xml_contents.append(response.read().decode('utf-8'))
-                annotations.append(
-                    self.filteredTitleSeg[title].annotations.copy()
-                )
-                progressBar.advance()   # 1 tick on the progress bar...
-
-        # If an error occurs (e.g. http error, or memory error)...
-        except:
+        # Get the plays that haven't been validated during this session yet,
+        # concurrently (from the disk cache if they are still up to date)...
+        plays = [
+            self.rowAnnotations(self.filteredRows[title])
+            for title in self.selectedTitles
+        ]
+        urls = [play["url"] for play in plays]
+        toFetch = [url for url in set(urls) if url not in self.cached]
+        progressBar.advance(len(urls) - len(toFetch))
+        failed = set()
+        executor = ThreadPoolExecutor(max_workers=self.__class__.maxWorkers)
+        futures = {
+            executor.submit(self.getPlay, url): url for url in toFetch
+        }
+        for future in as_completed(futures):
+            try:
+                self.cached[futures[future]] = future.result()
+            except (requests.exceptions.RequestException, UnicodeDecodeError):
+                failed.add(futures[future])
+            progressBar.advance()   # 1 tick on the progress bar...
+        executor.shutdown()
+
+        # If no play could be downloaded...
+        if len(failed) == len(set(urls)):
 
             # Set Info box and widget to "error" state.
             self.infoBox.setText(
@@ -279,14 +320,19 @@ class TheatreClassique(OWTextableBaseWidget):
             )
 
             # Reset output channel.
+            progressBar.finish()
             self.send("XML-TEI data", None)
             self.controlArea.setDisabled(False)
             return
 
         # Store downloaded XML in input objects...
-        for xml_content_idx in range(len(xml_contents)):
-            newInput = Input(xml_contents[xml_content_idx], self.captionTitle)
+        annotations = list()
+        for play in plays:
+            if play["url"] in failed:
+                continue
+            newInput = Input(self.cached[play["url"]], self.captionTitle)
             self.createdInputs.append(newInput)
+            annotations.append(play)
 
         # If there's only one play, the widget's output is the created Input.
         if len(self.createdInputs) == 1:
@@ -307,7 +353,7 @@ class TheatreClassique(OWTextableBaseWidget):
 
         # Store imported URLs as setting.
         self.importedURLs = [
-            self.filteredTitleSeg[self.selectedTitles[0]].annotations["url"]
+            self.catalogue["url"][self.filteredRows[self.selectedTitles[0]]]
         ]
 
         # Set status to OK and report data size...
@@ -319,8 +365,13 @@ class TheatreClassique(OWTextableBaseWidget):
             numChars += segmentLength
         message += "(%i character@p)." % numChars
         message = pluralize(message, numChars)
-        self.infoBox.setText(message)
-        progressBar.finish()
+        if failed:
+            message += " Couldn't download: %s." % ", ".join(
+                play["title"] for play in plays if play["url"] in failed
+            )
+            self.infoBox.setText(message, "warning")
+        else:
+            self.infoBox.setText(message)
 
         # Clear progress bar.
         progressBar.finish()
@@ -330,157 +381,269 @@ class TheatreClassique(OWTextableBaseWidget):
         self.send("XML-TEI data", self.segmentation)
         self.sendButton.resetSettingsChangedFlag()
 
-    def getTitleSeg(self):
-        """Get title segmentation, either saved locally or online"""
+    def getPlay(self, url):
+        """Get the XML-TEI content of a play, from the disk cache if it is
+        still up to date (checked with a conditional request), otherwise by
+        downloading it"""
+        cached = self.loadCachedPlay(url)
+        headers = dict()
+        if cached is not None:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["lastModified"]:
+                headers["If-Modified-Since"] = cached["lastModified"]
+        try:
+            response = self.session.get(
+                self.document_base_url + url,
+                headers=headers,
+                timeout=30,
+            )
+        except requests.exceptions.RequestException:
+            # Offline: fall back on cached copy if any...
+            if cached is not None:
+                return cached["content"]
+            raise
+        if response.status_code == 304 and cached is not None:
+            return cached["content"]
+        response.raise_for_status()
+        xml_content = response.content.decode('utf-8')
+        self.saveCachedPlay(
+            url,
+            {
+                "version": self.__class__.cacheVersion,
+                "etag": response.headers.get("ETag"),
+                "lastModified": response.headers.get("Last-Modified"),
+                "content": xml_content,
+            },
+        )
+        return xml_content
 
-        # Try to open saved file in this module's directory...
-        path = os.path.dirname(
-            os.path.abspath(inspect.getfile(inspect.currentframe()))
+    def cachedPlayPath(self, url):
+        """Return the path of the disk cache file for a play url"""
+        return os.path.join(
+            os.path.dirname(
+                os.path.abspath(inspect.getfile(inspect.currentframe()))
+            ),
+            self.__class__.cachedFoldername,
+            hashlib.sha1(url.encode("utf-8")).hexdigest(),
         )
+
+    def loadCachedPlay(self, url):
+        """Load a play from disk cache (None if absent or outdated)"""
+        try:
+            file = open(self.cachedPlayPath(url), "rb")
+            cached = pickle.load(file)
+            file.close()
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        if cached.get("version") != self.__class__.cacheVersion:
+            return None
+        return cached
+
+    def saveCachedPlay(self, url, cached):
+        """Save a downloaded play to disk cache"""
+        path = self.cachedPlayPath(url)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            pass
         try:
-            file = open(os.path.join(path, "cached_title_list"),"rb")
-            self.titleSeg = pickle.load(file)
+            file = open(path + ".part", "wb")
+            pickle.dump(cached, file, -1)
             file.close()
-        # Else try to load list from Theatre-classique and build new seg...
+            os.replace(path + ".part", path)
         except IOError:
-            self.titleSeg = self.getTitleListFromTheatreClassique()
-
-        # Build author, year and genre lists...
-        if self.titleSeg is not None:
-            self.filterValues["author"] = Processor.count_in_context(
-                units={
-                    "segmentation": self.titleSeg,
-                    "annotation_key": "author"
-                }
-            ).col_ids
-            self.filterValues["author"].sort()
-            self.filterValues["year"] = Processor.count_in_context(
-                units={
-                    "segmentation": self.titleSeg,
-                    "annotation_key": "year"
-                }
-            ).col_ids
-            self.filterValues["year"].sort(key=lambda v: int(v))
-            self.filterValues["genre"] = Processor.count_in_context(
-                units={
-                    "segmentation": self.titleSeg,
-                    "annotation_key": "genre"
-                }
-            ).col_ids
-            self.filterValues["genre"].sort()
-
-        # Sort the segmentation alphabetically based on titles (nasty hack!)...
-        self.titleSeg.buffer.sort(key=lambda s: s.annotations["title"])
+            pass
 
-        # Update title and filter value lists (only at init and on manual
-        # refresh, therefore separate from self.updateGUI).
-        self.updateFilterValueList()
+    def getTitleSeg(self):
+        """Get title catalogue, either saved locally or online"""
+
+        # Try to open saved file in this module's directory...
+        self.catalogue = self.loadCatalogue()
+
+        # Else try to load list from Theatre-classique and build new
+        # catalogue (in the background)...
+        if self.catalogue is None:
+            self.refreshTitleSeg()
 
-    def refreshTitleSeg(self):
-        """Refresh title segmentation from website"""
-        self.titleSeg = self.getTitleListFromTheatreClassique()
         # Update title and filter value lists (only at init and on manual
         # refresh, therefore separate from self.updateGUI).
         self.updateFilterValueList()
 
-    def getTitleListFromTheatreClassique(self):
-        """Fetch titles from the Theatre-classique website"""
-
-        self.infoBox.customMessage(
-            "Fetching data from Theatre-classique website, please wait"
+    def refreshTitleSeg(self):
+        """Refresh title catalogue from website (in a worker thread)"""
+        self.infoBox.setText(
+            "Fetching data from Theatre-classique website, please wait...",
+            "warning",
         )
+        self.progressBarInit()
+        self.threading(self.getTitleListFromTheatreClassique)
 
-        # Attempt to connect to Theatre-classique...
-        try:
-            response = urllib.request.urlopen(self.base_url)
-            base_html = response.read().decode('iso-8859-1')
-            self.infoBox.customMessage(
-                "Done fetching data from Theatre-classique website."
-            )
+    @OWTextableBaseWidget.task_decorator
+    def task_finished(self, f):
+        """All operations following the termination of a worker thread"""
+        catalogue = f.result()
 
-        # If unable to connect (somehow)...
-        except:
+        # If operation cancelled or unable to connect (somehow)...
+        if catalogue is None:
 
             # Set Info box and widget to "warning" state.
-            self.infoBox.noDataSent(
-                warning="Couldn't access theatre-classique website."
-            )
-
-            # Empty title list box.
-            self.titleLabels = list()
-
-            # Reset output channel.
-            self.send("XML-TEI data", None)
-            return None
+            if self.cancel_operation:
+                self.infoBox.noDataSent(warning="Operation cancelled.")
+            else:
+                self.infoBox.noDataSent(
+                    warning="Couldn't access theatre-classique website."
+                )
 
-        # Otherwise store HTML content in LTTL Input object.
-        base_html_seg = Input(base_html)
+            # Without any title list, empty title list box and reset output
+            # channel.
+            if self.catalogue is None:
+                self.titleLabels = list()
+                self.send("XML-TEI data", None)
+            return
 
-        # Remove accents from the data...
-        recoded_seg, _ = Segmenter.recode(base_html_seg, remove_accents=True)
+        self.catalogue = catalogue
 
-        # Extract table containing titles from HTML.
-        table_seg = Segmenter.import_xml(
-            segmentation=recoded_seg,
-            element="table",
-            conditions={"id": re.compile(r"^table_AA$")},
-        )
+        # Remove warning (if any)...
+        self.error(0)
+        self.warning(0)
 
-        # Extract table lines.
-        line_seg = Segmenter.import_xml(
-            segmentation=table_seg,
-            element="tr",
-        )
+        # Update title and filter value lists (only at init and on manual
+        # refresh, therefore separate from self.updateGUI).
+        self.updateFilterValueList()
 
-        # Compile the regex that will be used to parse each line.
-        field_regex = re.compile(
-            r"^\s*<td>\s*<a.+?>(.+?)</a>\s*</td>\s*"
-            r"<td>(.+?)</td>\s*"
-            r"<td.+?>\s*<a.+?>\s*(\d+?)\s*</a>\s*</td>\s*"
-            r"<td.+?>\s*(.+?)\s*</td>\s*"
-            r"<td.+?>\s*<a\s+.+?t=\.{2}/(.+?)'>\s*HTML"
+    def buildCatalogue(self, records):
+        """Build the title catalogue from a list of title records (dicts):
+        one list per column with rows sorted by title, and for each filter
+        criterion the sorted list of its values and the rows of each
+        value"""
+        records = sorted(
+            records,
+            key=lambda r: (r["title"], r["author"], r["url"]),
         )
-
-        # Parse each line and store the resulting segmentation in an attribute.
-        titleSeg = Segmenter.tokenize(
-            segmentation=line_seg,
-            regexes=[
-                (field_regex, "tokenize", {"author": "&1"}),
-                (field_regex, "tokenize", {"title": "&2"}),
-                (field_regex, "tokenize", {"year": "&3"}),
-                (field_regex, "tokenize", {"genre": "&4"}),
-                (field_regex, "tokenize", {"url": "&5"}),
-            ],
-            import_annotations=False,
-            merge_duplicates=True,
+        catalogue = {"version": self.__class__.catalogueVersion}
+        for column in self.__class__.catalogueColumns:
+            catalogue[column] = [record[column] for record in records]
+        catalogue["index"] = dict()
+        catalogue["values"] = dict()
+        for criterion in ("author", "year", "genre"):
+            index = dict()
+            for row, value in enumerate(catalogue[criterion]):
+                index.setdefault(value, list()).append(row)
+            catalogue["index"][criterion] = index
+            catalogue["values"][criterion] = sorted(index)
+        catalogue["values"]["year"].sort(key=lambda v: int(v))
+        catalogue["urlIndex"] = {
+            url: row for row, url in enumerate(catalogue["url"])
+        }
+        return catalogue
+
+    def catalogueRecords(self, catalogue):
+        """Return the title records of a catalogue (of any version) or of a
+        title segmentation (as saved by earlier versions)"""
+        if isinstance(catalogue, dict):
+            return [
+                dict(zip(self.__class__.catalogueColumns, values))
+                for values in zip(*(
+                    catalogue[column]
+                    for column in self.__class__.catalogueColumns
+                ))
+            ]
+        return [segment.annotations for segment in catalogue]
+
+    def cataloguePath(self):
+        """Return the path of the title catalogue file"""
+        return os.path.join(
+            os.path.dirname(
+                os.path.abspath(inspect.getfile(inspect.currentframe()))
+            ),
+            self.__class__.catalogueFilename,
         )
 
-        # Try to save list in this module's directory for future reference...
-        path = os.path.dirname(
-            os.path.abspath(inspect.getfile(inspect.currentframe()))
-        )
+    def loadCatalogue(self):
+        """Load the saved title catalogue (None if there is none). A
+        catalogue saved in another format is converted and saved again."""
         try:
-            file = open(os.path.join(path, "cached_title_list"), "wb")
-            pickle.dump(titleSeg, file, -1)
+            file = open(self.cataloguePath(), "rb")
+            catalogue = pickle.load(file)
             file.close()
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        if (
+            isinstance(catalogue, dict) and
+            catalogue.get("version") == self.__class__.catalogueVersion
+        ):
+            return catalogue
+        catalogue = self.buildCatalogue(self.catalogueRecords(catalogue))
+        self.saveCatalogue(catalogue)
+        return catalogue
+
+    def saveCatalogue(self, catalogue):
+        """Save the title catalogue in this module's directory"""
+        path = self.cataloguePath()
+        try:
+            file = open(path + ".part", "wb")
+            pickle.dump(catalogue, file, -1)
+            file.close()
+            os.replace(path + ".part", path)
         except IOError:
             pass
 
-        # Remove warning (if any)...
-        self.error(0)
-        self.warning(0)
+    def rowAnnotations(self, row):
+        """Return the annotations (title, author, etc.) of a catalogue row"""
+        return {
+            column: self.catalogue[column][row]
+            for column in self.__class__.catalogueColumns
+        }
+
+    def getTitleListFromTheatreClassique(self):
+        """Fetch titles from the Theatre-classique website and build the
+        title catalogue (run in a worker thread)"""
+        self.signal_prog.emit(1, False)
+
+        # Attempt to connect to Theatre-classique and parse the title table
+        # while it is being downloaded...
+        try:
+            response = self.session.get(self.base_url, stream=True, timeout=30)
+            try:
+                response.raise_for_status()
+                records = parse_title_table(self.readChunks(response))
+            finally:
+                response.close()
+        except requests.exceptions.RequestException:
+            return None
+        if self.cancel_operation or not records:
+            return None
 
-        return titleSeg
+        # Build the catalogue and try to save it in this module's directory
+        # for future reference...
+        catalogue = self.buildCatalogue(records)
+        self.saveCatalogue(catalogue)
+        return catalogue
+
+    def readChunks(self, response):
+        """Iterate over the chunks of a streamed response, reporting
+        progress and stopping if the operation is cancelled"""
+        total = int(response.headers.get("Content-Length") or 0)
+        done = 0
+        for chunk in response.iter_content(16384):
+            if self.cancel_operation:
+                return
+            done += len(chunk)
+            if total:
+                self.signal_prog.emit(int(100*min(done, total)/total), False)
+            yield chunk
 
     def updateFilterValueList(self):
         """Update the list of filter values"""
 
         # In Advanced settings mode, populate filter value list...
-        if self.titleSeg is not None and self.displayAdvancedSettings:
+        if self.catalogue is not None and self.displayAdvancedSettings:
             self.filterValueCombo.clear()
             self.filterValueCombo.addItem("(all)")
-            for filterValue in self.filterValues[self.filterCriterion]:
-                self.filterValueCombo.addItem(filterValue)
+            self.filterValueCombo.addItems(
+                self.catalogue["values"][self.filterCriterion]
+            )
 
         # Reset filterValue if needed...
         if self.filterValue not in [
@@ -496,59 +659,40 @@ class TheatreClassique(OWTextableBaseWidget):
     def updateTitleList(self):
         """Update the list of titles"""
 
-        # If titleSeg has not been loaded for some reason, skip.
-        if self.titleSeg is None:
+        # If catalogue has not been loaded for some reason, skip.
+        if self.catalogue is None:
             return
 
-        # In Advanced settings mode, get list of selected titles...
+        # In Advanced settings mode, get the rows of the selected titles
+        # (rows are sorted by title)...
         if self.displayAdvancedSettings and self.filterValue != "(all)":
-            self.filteredTitleSeg, _ = Segmenter.select(
-                segmentation=self.titleSeg,
-                regex=re.compile(r"^%s$" % self.filterValue),
-                annotation_key=self.filterCriterion,
-            )
+            self.filteredRows = self.catalogue["index"][
+                self.filterCriterion
+            ].get(self.filterValue, list())
         else:
-            self.filteredTitleSeg = self.titleSeg
+            self.filteredRows = range(len(self.catalogue["title"]))
 
-        # Populate titleLabels list with the titles...
-        self.titleLabels = sorted(
-            [s.annotations["title"] for s in self.filteredTitleSeg]
-        )
-
-        # Add specification (author, year and genre, depending on criterion)...
-        titleLabels = self.titleLabels[:]
-        for idx, titleLabel in enumerate(titleLabels):
-            specs = list()
+        # Populate titleLabels list with the titles and their specification
+        # (author, year and genre, depending on criterion)...
+        columns = [
+            column for column in ("author", "year", "genre")
             if (
                 self.displayAdvancedSettings == False or
-                self.filterCriterion != "author" or
+                self.filterCriterion != column or
                 self.filterValue == "(all)"
-            ):
-                specs.append(
-                    self.filteredTitleSeg[idx].annotations["author"]
-                )
-            if (
-                self.displayAdvancedSettings == False or
-                self.filterCriterion != "year" or
-                self.filterValue == "(all)"
-            ):
-                specs.append(
-                    self.filteredTitleSeg[idx].annotations["year"]
-                )
-            if (
-                self.displayAdvancedSettings == False or
-                self.filterCriterion != "genre" or
-                self.filterValue == "(all)"
-            ):
-                specs.append(
-                    self.filteredTitleSeg[idx].annotations["genre"]
-                )
-            titleLabels[idx] = titleLabel + " (%s)" % "; ".join(specs)
-        self.titleLabels = titleLabels
+            )
+        ]
+        self.titleLabels = [
+            self.catalogue["title"][row] + " (%s)" % "; ".join(
+                self.catalogue[column][row] for column in columns
+            )
+            for row in self.filteredRows
+        ]
 
         # Reset selectedTitles if needed...
-        if not set(self.importedURLs).issubset(
-            set(u.annotations["url"] for u in self.filteredTitleSeg)
+        if not all(
+            self.isFilteredRow(self.catalogue["urlIndex"].get(url))
+            for url in self.importedURLs
         ):
             self.selectedTitles = list()
         else:
@@ -556,6 +700,13 @@ class TheatreClassique(OWTextableBaseWidget):
 
         self.sendButton.settingsChanged()
 
+    def isFilteredRow(self, row):
+        """Tell whether a catalogue row is in the filtered title list"""
+        if row is None:
+            return False
+        idx = bisect_left(self.filteredRows, row)
+        return idx < len(self.filteredRows) and self.filteredRows[idx] == row
+
     def updateGUI(self):
         """Update GUI state"""
         if self.displayAdvancedSettings:
@@ -584,11 +735,132 @@ class TheatreClassique(OWTextableBaseWidget):
             changed = title != self.captionTitle
             super().setCaption(title)
             if changed:
+                self.cancel() # Cancel current operation
                 self.sendButton.settingsChanged()
         else:
             super().setCaption(title)
 
 
+class TitleTableParser(HTMLParser):
+    """Streaming parser of the title table (table_AA) of the
+    Theatre-classique edition page: each line of the table gives a title
+    record (author, title, year, genre and url of the XML-TEI file)"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.records = list()
+        self.inTable = False
+        self.done = False
+        self.cells = None
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if not self.inTable:
+            self.inTable = tag == "table" and dict(attrs).get("id") == "table_AA"
+        elif tag == "tr":
+            self.cells = list()
+        elif tag == "td" and self.cells is not None:
+            self.cell = {
+                "attributes": bool(attrs),
+                "links": list(),
+                "content": list(),
+            }
+            self.cells.append(self.cell)
+        elif self.cell is not None:
+            self.handle_data(self.get_starttag_text())
+            if tag == "a":
+                self.cell["links"].append(
+                    {"href": dict(attrs).get("href") or "", "text": list()}
+                )
+
+    def handle_endtag(self, tag):
+        if self.done or not self.inTable:
+            return
+        if tag == "table":
+            self.done = True
+        elif tag == "tr":
+            if self.cells is not None:
+                record = self.makeRecord(self.cells)
+                if record is not None:
+                    self.records.append(record)
+            self.cells = None
+            self.cell = None
+        elif tag == "td":
+            self.cell = None
+        elif self.cell is not None:
+            if tag == "a" and self.cell["links"]:
+                self.cell["links"][-1]["closed"] = True
+            self.handle_data("</%s>" % tag)
+
+    def handle_data(self, data):
+        if self.cell is None:
+            return
+        self.cell["content"].append(data)
+        for link in self.cell["links"]:
+            if not link.get("closed"):
+                link["text"].append(data)
+
+    # Keep entities as they are in the page...
+    def handle_entityref(self, name):
+        self.handle_data("&%s;" % name)
+
+    def handle_charref(self, name):
+        self.handle_data("&#%s;" % name)
+
+    @staticmethod
+    def makeRecord(cells):
+        """Build a title record from the cells of a table line (None if the
+        line isn't a title)"""
+        if len(cells) < 5:
+            return None
+        author, title, year, genre, document = cells[:5]
+        if (
+            not author["links"] or title["attributes"] or
+            not year["links"] or not document["links"]
+        ):
+            return None
+        author_text = "".join(author["links"][0]["text"])
+        year_text = "".join(year["links"][0]["text"]).strip()
+        url = document["links"][0]["href"].partition("t=../")[2]
+        if (
+            not author_text or not year_text.isdigit() or not url or
+            not "".join(document["links"][0]["text"]).lstrip()
+            .startswith("HTML")
+        ):
+            return None
+        return {
+            "author": remove_accents(author_text),
+            "title": remove_accents("".join(title["content"])),
+            "year": year_text,
+            "genre": remove_accents("".join(genre["content"]).strip()),
+            "url": remove_accents(url),
+        }
+
+
+def parse_title_table(chunks):
+    """Return the title records of the Theatre-classique edition page,
+    parsing it from an iterable of (iso-8859-1 encoded) chunks and stopping
+    at the end of the title table"""
+    parser = TitleTableParser()
+    decoder = codecs.getincrementaldecoder("iso-8859-1")()
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        if parser.done:
+            break
+    parser.close()
+    return parser.records
+
+
+def remove_accents(text):
+    """Remove accents from a string (as Segmenter.recode does)"""
+    return "".join(
+        c for c in unicodedata.normalize("NFD", text)
+        if unicodedata.category(c) != "Mn"
+    )
+
+
 if __name__ == "__main__":
     #import sys
     #from PyQt5.QtWidgets import QApplication
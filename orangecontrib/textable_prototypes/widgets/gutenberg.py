@@ -26,7 +26,15 @@ __email__ = "aris.xanthos@unil.ch"
 
 from ntpath import join
 import os
+import inspect
+import sqlite3
+import tarfile
+import tempfile
+import time
+from xml.etree import ElementTree
 from pathlib import Path
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Orange
 from Orange.widgets import widget, gui, settings
@@ -34,12 +42,17 @@ from Orange.widgets.utils.widgetpreview import WidgetPreview
 
 # LTTL
 from LTTL.Segmentation import Segmentation
-import LTTL.Segmenter as Segmenter
+import LTTL.SegmenterThread as Segmenter
 from LTTL.Input import Input
 
 # gutenbergpy
 import gutenbergpy.textget
 from gutenbergpy.gutenbergcache import GutenbergCache
+from gutenbergpy.gutenbergcachesettings import GutenbergCacheSettings
+import gutenbergpy.caches.sqlitecache
+
+# requests
+import requests
 
 # regex
 import re
@@ -47,9 +60,11 @@ import re
 # Textable
 from _textable.widgets.TextableUtils import (
     OWTextableBaseWidget, VersionedSettingsHandler, pluralize,
-    InfoBox, SendButton, ProgressBar,
+    InfoBox, SendButton,
 )
 
+from PyQt5.QtWidgets import QFileDialog
+
 class Gutenberg(OWTextableBaseWidget):
     """Textable widget for importing clean texts from Gutenberg
     (https://www.gutenberg.org/)
@@ -84,6 +99,14 @@ class Gutenberg(OWTextableBaseWidget):
     # Saved settings
     autoSend = settings.Setting(False)
     myBasket = settings.Setting([])
+    archiveFolder = settings.Setting(u'')
+    rdfArchive = settings.Setting(u'')
+
+    # Local mirror of stripped book texts (in this module's directory)...
+    cachedFoldername = "cached_gutenberg_texts"
+
+    # Number of books retrieved concurrently...
+    maxWorkers = 8
 
     def __init__(self):
         """Widget creator."""
@@ -116,18 +139,65 @@ class Gutenberg(OWTextableBaseWidget):
             widget=self.controlArea,
             master=self,
             callback=self.sendData,
+            cancelCallback=self.cancel_manually,
             infoBoxAttribute="infoBox",
         )
         #----------------------------------------------------------------------
         # User interface...
         # Create the working area
-        self.cacheGenerationButton = gui.button(
+        self.cacheBox = gui.widgetBox(
             widget=self.controlArea,
+            box="Catalogue cache",
+            orientation="vertical",
+        )
+        rdfArchiveBox = gui.widgetBox(
+            widget=self.cacheBox,
+            box=False,
+            orientation="horizontal",
+        )
+        gui.lineEdit(
+            widget=rdfArchiveBox,
+            master=self,
+            value='rdfArchive',
+            orientation='horizontal',
+            label=u"RDF archive: ",
+            labelWidth=120,
+            tooltip=(
+                "Local copy of the Gutenberg catalogue (rdf-files.tar.bz2)\n"
+                "to build the cache from. Leave empty to download it."
+            ),
+        )
+        gui.button(
+            widget=rdfArchiveBox,
+            master=self,
+            label=u'Browse',
+            callback=self.browseRdfArchive,
+            tooltip=(
+                u"Select a local copy of the Gutenberg catalogue."
+            ),
+        )
+        cacheButtonBox = gui.widgetBox(
+            widget=self.cacheBox,
+            box=False,
+            orientation="horizontal",
+        )
+        self.cacheGenerationButton = gui.button(
+            widget=cacheButtonBox,
             master=self,
             label="Generate cache",
             callback=self.generate_cache,
             tooltip="Generate the gutenberg cache, this might take a while...",
         )
+        self.cacheUpdateButton = gui.button(
+            widget=cacheButtonBox,
+            master=self,
+            label="Update cache",
+            callback=self.update_cache,
+            tooltip=(
+                "Add the books that have been published or modified\n"
+                "since the cache was built."
+            ),
+        )
 
         self.queryBox = gui.widgetBox(
             widget=self.controlArea,
@@ -135,6 +205,9 @@ class Gutenberg(OWTextableBaseWidget):
             orientation="vertical",
         )
 
+        # Both boxes are frozen while a task runs (see manageGuiVisibility)...
+        self.guiElements.extend([self.cacheBox, self.queryBox])
+
 
         # Allows to enter specific text to the research
         #  Uses "newQuery" attribut
@@ -347,6 +420,35 @@ class Gutenberg(OWTextableBaseWidget):
         self.clearmyBasketButton.setDisabled(True)
 
         gui.separator(widget=mytitleBox, height=3)
+
+        # Optional local copy of the Gutenberg archive
+        archiveBox = gui.widgetBox(
+            widget=self.controlArea,
+            box="Local Gutenberg archive (optional)",
+            orientation="horizontal",
+        )
+        gui.lineEdit(
+            widget=archiveBox,
+            master=self,
+            value='archiveFolder',
+            orientation='horizontal',
+            callback=self.sendButton.settingsChanged,
+            tooltip=(
+                "Folder containing a synchronized copy of the Gutenberg\n"
+                "archive, where books are looked up before being\n"
+                "downloaded."
+            ),
+        )
+        gui.button(
+            widget=archiveBox,
+            master=self,
+            label=u'Browse',
+            callback=self.browseArchive,
+            tooltip=(
+                u"Select the folder of a local Gutenberg archive."
+            ),
+        )
+
         gui.rubber(self.controlArea)
         #----------------------------------------------------------------------
 
@@ -372,46 +474,180 @@ class Gutenberg(OWTextableBaseWidget):
         if not GutenbergCache.exists():
             # disables the search button if not
             self.queryBox.setDisabled(True)
+            self.cacheUpdateButton.setDisabled(True)
             self.infoBox.setText(
                 "Cache must be generated before first launch, it can take up to 10min",
                 "warning"
             )
         # disables the the cache generation button if it does exists
         else:
+            self.queryBox.setEnabled(True)
             self.cacheGenerationButton.setDisabled(True)
+            self.cacheUpdateButton.setEnabled(True)
+
+    def updateGUI(self):
+        """Update GUI state once a task is done or cancelled"""
+        self.check_cache()
 
     def generate_cache(self):
         """generates the cache
         """
         if not GutenbergCache.exists():
-            try:
-                self.infoBox.setText(
-                    "The cache is being generated. This can take up to 10min.",
-                    "warning"
-                )
-                GutenbergCache.create(
-                    refresh=True,
-                    download=True,
-                    unpack=True,
-                    parse=True,
-                    deleteTemp=True
-                )
-                self.infoBox.setText(
-                    "Cache generated!"
-                )
-                self.cacheGenerationButton.setDisabled(True)
-                self.queryBox.setEnabled(True)
-            except Exception as exc:
-                print(exc)
-                self.infoBox.setText(
-                    "An error occurred while building the cache",
-                    "error"
-                )
+            self.start_cache_task(incremental=False)
         else:
             self.infoBox.setText(
                 "The cache already exists."
             )
 
+    def update_cache(self):
+        """adds the books published or modified since the last build
+        """
+        if GutenbergCache.exists():
+            self.start_cache_task(incremental=True)
+
+    def start_cache_task(self, incremental):
+        """builds or updates the cache in a worker thread
+        """
+        self.infoBox.setText(
+            "The cache is being %s." % (
+                "updated" if incremental else "generated"
+            ),
+            "warning"
+        )
+        self.progressBarInit()
+        self.threading(partial(self.buildCache, incremental))
+
+    def buildCache(self, incremental):
+        """Build (or update) the gutenbergpy cache from the RDF catalogue
+        in three steps: download, parse and insert (run in a worker thread)
+        """
+        cache_filename = GutenbergCacheSettings.CACHE_FILENAME
+        downloaded = None
+        connection = None
+        try:
+            # Step 1: download the catalogue (unless a local copy is used)...
+            archive = self.rdfArchive
+            if not archive:
+                self.signal_text.emit(
+                    "Step 1/3: Downloading catalogue...", "warning"
+                )
+                self.signal_prog.emit(1, True)
+                archive = downloaded = self.downloadCatalogue()
+                if self.cancel_operation:
+                    return None
+
+            # Step 2: parse the RDF files that are not in the cache yet...
+            self.signal_text.emit("Step 2/3: Parsing catalogue...", "warning")
+            self.signal_prog.emit(1, True)
+            if incremental:
+                connection = sqlite3.connect(cache_filename)
+                known = dict(connection.execute(
+                    "SELECT gutenbergbookid, id FROM books"
+                ))
+                last_build = catalogue_build_time(connection)
+            else:
+                known = dict()
+                last_build = 0
+            archive_size = os.path.getsize(archive)
+            books = list()
+            for gutenberg_id, mtime, rdf, position in iter_rdf_archive(archive):
+                if gutenberg_id not in known or mtime > last_build:
+                    # Skip malformed descriptions...
+                    try:
+                        books.append(parse_rdf(gutenberg_id, rdf))
+                    except ElementTree.ParseError:
+                        pass
+                self.signal_prog.emit(int(100*position/archive_size), False)
+                if self.cancel_operation:
+                    return None
+
+            # Step 3: insert them in the cache (a new file if not updating)...
+            self.signal_text.emit(
+                "Step 3/3: Inserting books in cache...", "warning"
+            )
+            self.signal_prog.emit(1, True)
+            if not incremental:
+                if os.path.exists(cache_filename + ".part"):
+                    os.remove(cache_filename + ".part")
+                connection = sqlite3.connect(cache_filename + ".part")
+                with open(SQL_SCHEMA_FILENAME, "r") as file:
+                    connection.executescript(file.read())
+            lookups = load_lookups(connection)
+            cur_itr = 1
+            for book in books:
+                store_book(
+                    connection,
+                    lookups,
+                    book,
+                    known.get(book["gutenbergbookid"]),
+                )
+                self.signal_prog.emit(int(100*cur_itr/len(books)), False)
+                cur_itr += 1
+                if self.cancel_operation:
+                    connection.rollback()
+                    return None
+            if not incremental:
+                with open(SQL_INDICES_FILENAME, "r") as file:
+                    connection.executescript(file.read())
+            set_catalogue_build_time(connection, time.time())
+            build_search_index(connection, rebuild=True)
+            connection.close()
+            connection = None
+            if not incremental:
+                os.replace(cache_filename + ".part", cache_filename)
+
+        # If an error occurs (e.g. http error, corrupted archive)...
+        except Exception as exc:
+            return {"cacheError": "An error occurred while building the "
+                                  "cache (%s)." % exc}
+        finally:
+            if connection is not None:
+                connection.close()
+            if downloaded is not None:
+                try:
+                    os.remove(downloaded)
+                except OSError:
+                    pass
+
+        if incremental:
+            message = "Cache updated (%i book@p added or modified)." \
+                % len(books)
+            return {"cacheMessage": pluralize(message, len(books))}
+        return {"cacheMessage": "Cache generated!"}
+
+    def downloadCatalogue(self):
+        """Download the RDF catalogue to a temporary file and return its
+        path (run in a worker thread)"""
+        response = requests.get(
+            GutenbergCacheSettings.CACHE_RDF_DOWNLOAD_LINK,
+            stream=True,
+            timeout=60,
+        )
+        response.raise_for_status()
+        total = int(response.headers.get("Content-Length", 0))
+        file = tempfile.NamedTemporaryFile(suffix=".tar.bz2", delete=False)
+        with file:
+            done = 0
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                file.write(chunk)
+                done += len(chunk)
+                if total:
+                    self.signal_prog.emit(int(100*done/total), False)
+                if self.cancel_operation:
+                    break
+        return file.name
+
+    def browseRdfArchive(self):
+        """Select a local copy of the RDF catalogue"""
+        filePath, _ = QFileDialog.getOpenFileName(
+            self,
+            u'Select Gutenberg catalogue',
+            self.rdfArchive,
+            u'Gutenberg catalogue (*.tar.bz2 *.tar *.tar.gz *.zip)',
+        )
+        if filePath:
+            self.rdfArchive = filePath
+
     def search(self):
         """
             Parse a query string and do a search in the Gutenberg cache
@@ -427,45 +663,26 @@ class Gutenberg(OWTextableBaseWidget):
 
         else:    
             # Recode author to name, first_name
-            if len(query_author.split()) == 2:
-                if "," not in query_author:
-                    query_author = "%, ".join(query_author.split()[::-1])
+            query_author = [query_author]
+            if len(self.authorQuery.split()) == 2:
+                if "," not in self.authorQuery:
+                    first_name, name = self.authorQuery.split()
+                    query_author = [name, ", " + first_name]
 
-            # parse query and lookup in gutenbergcache
-            cache = GutenbergCache.get_cache()
-
-            # searches the database
+            # searches the database (building its search index if needed)
             try:
-                query_results = cache.native_query(
-                    sql_query="""
-                    /* Creates a new table with one author per book
-                    by selecting the greatest author id */
-
-                    WITH unique_book_author AS
-                    (SELECT * FROM book_authors  
-                    WHERE authorid IN (SELECT MAX(authorid) FROM book_authors GROUP BY bookid))
-
-                    /* Selects title, author, gutenberg id and language */
-
-                    SELECT titles.name, authors.name, books.gutenbergbookid, languages.name
-                    FROM titles
-
-                    /* Merges every needed table into one on shared attributes */
-
-                    INNER JOIN books ON books.id = titles.bookid
-                    INNER JOIN unique_book_author ON  books.id = unique_book_author.bookid 
-                    INNER JOIN authors ON authors.id = unique_book_author.authorid
-                    INNER JOIN languages ON books.languageid = languages.id
-
-                    /* Matches users query using % wildcard for more permissive query */
-
-                    WHERE upper(titles.name) LIKE "%{title}%"
-                    AND upper(authors.name) LIKE "%{author}%"
-                    AND languages.name LIKE "%{lang}%"
-                    LIMIT {limit}
-                    """.format(
-                        title=query_string, author=query_author,lang=language, limit=self.nbr_results)
+                connection = sqlite3.connect(
+                    GutenbergCacheSettings.CACHE_FILENAME
+                )
+                build_search_index(connection)
+                query_results = search_index(
+                    connection,
+                    title=query_string,
+                    author=query_author,
+                    language=language,
+                    limit=int(self.nbr_results),
                 )
+                connection.close()
             except Exception as exc:
                 print(exc)
                 self.infoBox.setText(
@@ -585,74 +802,105 @@ class Gutenberg(OWTextableBaseWidget):
         # Clear created Inputs.
         self.clearCreatedInputs()
 
-        self.controlArea.setDisabled(True)
-
-        # Initialize progress bar.
-        progressBar = ProgressBar(
-            self,
-            iterations=len(self.myBasket),
-        )
-
-        text_content = list()
-        annotations = list()
-
-        try:
-            # Retrieve selected texts from gutenberg
-            for text in self.myBasket:
-
-                gutenberg_id = text[2]
-
-                # Get the text with Gutenbergpy
-                gutenberg_text = gutenbergpy.textget.strip_headers(
-                    gutenbergpy.textget.get_text_by_id(gutenberg_id)
-                ).decode("utf-8")
-
-                text_content.append(gutenberg_text)
-                # populate the annotation list
-                annotations.append([text[0], text[1], text[3]])
-                progressBar.advance()
+        self.infoBox.setText("Step 1/2: Retrieving books...", "warning")
+        self.progressBarInit()
+
+        # Retrieve books in a worker thread...
+        self.threading(partial(self.processData, list(self.myBasket)))
+
+    def processData(self, basket):
+        """Retrieve the texts of the books in basket concurrently and
+        build the output segmentation (run in a worker thread)"""
+        self.signal_prog.emit(1, False)
+
+        texts = dict()
+        errors = dict()
+        gutenberg_ids = list(dict.fromkeys(text[2] for text in basket))
+        executor = ThreadPoolExecutor(max_workers=self.__class__.maxWorkers)
+        futures = {
+            executor.submit(self.fetchText, gutenberg_id): gutenberg_id
+            for gutenberg_id in gutenberg_ids
+        }
+        cur_itr = 1
+        for future in as_completed(futures):
+            gutenberg_id = futures[future]
+            # If an error occurs (e.g. http error), report it for this book...
+            try:
+                texts[gutenberg_id] = future.result()
+            except Exception as exc:
+                errors[gutenberg_id] = exc
+            self.signal_prog.emit(int(100*cur_itr/len(futures)), False)
+            cur_itr += 1
+            if self.cancel_operation:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self.signal_prog.emit(100, False)
+                return
+        executor.shutdown()
 
-        # If an error occurs (e.g. http error, or memory error)...
-        except Exception as exc:
-            # Set Info box and widget to "error" state.
-            self.infoBox.setText(
-                "Couldn't download data from Gutenberg",
-                "error"
-            )
-            self.controlArea.setDisabled(False)
-            print(exc)
-            return
+        failed = [text[0] for text in basket if text[2] in errors]
+        if not texts:
+            return {
+                "error": "Couldn't download data from Gutenberg",
+                "failed": failed,
+            }
 
-        # Store downloaded text strings in input objects...
-        for text in text_content:
-            newInput = Input(text, self.captionTitle)
+        self.signal_text.emit("Step 2/2: Post-processing...", "warning")
+        self.signal_prog.emit(1, True)
+
+        # Store retrieved text strings in input objects annotated with
+        # book metadata...
+        for text in basket:
+            if text[2] not in texts:
+                continue
+            newInput = Input(texts[text[2]], self.captionTitle)
+            segment = newInput[0]
+            segment.annotations.update({"title": text[0]})
+            segment.annotations.update({"author": text[1]})
+            segment.annotations.update({"language": text[3]})
+            newInput[0] = segment
             self.createdInputs.append(newInput)
 
         # If there's only one text, the widget's output is the created Input.
         if len(self.createdInputs) == 1:
-            self.segmentation = self.createdInputs[0]
+            segmentation = self.createdInputs[0]
 
         # Otherwise the widget"s output is a concatenation.
         else:
-            self.segmentation = Segmenter.concatenate(
-                self.createdInputs,
-                self.captionTitle,
+            segmentation = Segmenter.concatenate(
+                caller=self,
+                segmentations=self.createdInputs,
+                label=self.captionTitle,
                 import_labels_as=None,
             )
 
-        # Annotate segments with book metadata
-        for idx, segment in enumerate(self.segmentation):
-            segment.annotations.update({"title": annotations[idx][0]})
-            segment.annotations.update({"author": annotations[idx][1]})
-            segment.annotations.update({"language": annotations[idx][2]})
-            self.segmentation[idx] = segment
+        return {"segmentation": segmentation, "failed": failed}
+
+    @OWTextableBaseWidget.task_decorator
+    def task_finished(self, f):
+        """Send the segmentation built by self.processData"""
+        processed_data = f.result()
+
+        # Operation cancelled by user...
+        if processed_data is None:
+            return
+
+        # Cache generation or update...
+        if "cacheMessage" in processed_data or "cacheError" in processed_data:
+            if "cacheError" in processed_data:
+                self.infoBox.setText(processed_data["cacheError"], "error")
+            else:
+                self.infoBox.setText(processed_data["cacheMessage"])
+            return
 
-        # Clear progress bar.
-        progressBar.finish()
+        failed = processed_data["failed"]
+        if "error" in processed_data:
+            self.infoBox.setText(processed_data["error"], "error")
+            self.send("Gutenberg importation", None)
+            return
 
-        self.controlArea.setDisabled(False)
+        self.segmentation = processed_data["segmentation"]
 
-        # Set status to OK and report data size...
+        # Set status to OK (or warn about missing books) and report data size...
         message = "%i segment@p sent to output " % len(self.segmentation)
         message = pluralize(message, len(self.segmentation))
         numChars = 0
@@ -661,11 +909,100 @@ class Gutenberg(OWTextableBaseWidget):
             numChars += segmentLength
         message += "(%i character@p)." % numChars
         message = pluralize(message, numChars)
-        self.infoBox.setText(message)
+        if failed:
+            message += " Couldn't retrieve: %s." % ", ".join(failed)
+            self.infoBox.setText(message, "warning")
+        else:
+            self.infoBox.setText(message)
 
         self.send("Gutenberg importation", self.segmentation)
         self.sendButton.resetSettingsChangedFlag()
 
+    def fetchText(self, gutenberg_id):
+        """Get the stripped text of a book from the local text mirror, or
+        else from the local Gutenberg archive or by downloading it (and then
+        save it in the local text mirror)"""
+        path = self.mirroredTextPath(gutenberg_id)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                return file.read()
+        except IOError:
+            pass
+
+        raw_text = None
+        if self.archiveFolder:
+            raw_text = self.readArchivedText(gutenberg_id)
+        if raw_text is None:
+            # Get the text with Gutenbergpy
+            raw_text = gutenbergpy.textget.get_text_by_id(gutenberg_id)
+        gutenberg_text = gutenbergpy.textget.strip_headers(
+            raw_text
+        ).decode("utf-8")
+
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            pass
+        try:
+            with open(path + ".part", "w", encoding="utf-8") as file:
+                file.write(gutenberg_text)
+            os.replace(path + ".part", path)
+        except IOError:
+            pass
+        return gutenberg_text
+
+    def mirroredTextPath(self, gutenberg_id):
+        """Return the path of a book's text in the local text mirror"""
+        return os.path.join(
+            os.path.dirname(
+                os.path.abspath(inspect.getfile(inspect.currentframe()))
+            ),
+            self.__class__.cachedFoldername,
+            "%i.txt" % int(gutenberg_id),
+        )
+
+    def readArchivedText(self, gutenberg_id):
+        """Read a book's text from the local Gutenberg archive (either
+        with the layout of the main archive or of the generated epub
+        cache) and return it encoded in utf-8, or None if it isn't there"""
+        gutenberg_id = int(gutenberg_id)
+        book_dir = gutenbergpy.textget.get_text_dir_from_index(gutenberg_id)
+        candidates = [
+            os.path.join(
+                self.archiveFolder, book_dir, "%i%s" % (gutenberg_id, ext)
+            )
+            for ext in ("-0.txt", "-8.txt", ".txt")
+        ]
+        candidates += [
+            os.path.join(
+                self.archiveFolder, folder, str(gutenberg_id),
+                "pg%i.txt" % gutenberg_id,
+            )
+            for folder in (os.path.join("cache", "epub"), "epub", "")
+        ]
+        for candidate in candidates:
+            try:
+                with open(candidate, "rb") as file:
+                    text_bytes = file.read()
+            except IOError:
+                continue
+            try:
+                text = text_bytes.decode("utf-8")
+            except UnicodeDecodeError:
+                text = text_bytes.decode("latin-1")
+            return text.encode("utf-8")
+        return None
+
+    def browseArchive(self):
+        """Select the folder of a local Gutenberg archive"""
+        folder = QFileDialog.getExistingDirectory(
+            self,
+            u'Select local Gutenberg archive',
+            self.archiveFolder,
+        )
+        if folder:
+            self.archiveFolder = folder
+            self.sendButton.settingsChanged()
 
     def clearCreatedInputs(self):
         """Delete all Input objects that have been created."""
@@ -674,6 +1011,10 @@ class Gutenberg(OWTextableBaseWidget):
         del self.createdInputs[:]
 
 
+    def onDeleteWidget(self):
+        """Clear created inputs on widget deletion"""
+        self.clearCreatedInputs()
+
     # The following method needs to be copied verbatim in
     # every Textable widget that sends a segmentation...
     def setCaption(self, title):
@@ -681,11 +1022,342 @@ class Gutenberg(OWTextableBaseWidget):
             changed = title != self.captionTitle
             super().setCaption(title)
             if changed:
+                self.cancel() # Cancel current operation
                 self.sendButton.settingsChanged()
         else:
             super().setCaption(title)
 
 
+# Version of the search tables added to the gutenbergpy cache (increment it
+# whenever their structure changes so that they get rebuilt)...
+SEARCH_INDEX_VERSION = 1
+
+
+def build_search_index(connection, rebuild=False):
+    """Add search tables to the gutenbergpy cache, unless already up to date:
+    a table with one author per book (the one with the greatest id) and a
+    full-text index (trigram tokenizer, so that substring queries can use
+    it) of every title with its author, gutenberg id and language.
+    """
+    try:
+        version = connection.execute(
+            "SELECT version FROM textable_search_version"
+        ).fetchone()
+    except sqlite3.OperationalError:
+        version = None
+    if version is not None and version[0] == SEARCH_INDEX_VERSION \
+            and not rebuild:
+        return
+
+    # Make sure the build time of the catalogue is recorded before writing
+    # to the cache...
+    catalogue_build_time(connection)
+
+    connection.executescript("""
+        DROP TABLE IF EXISTS textable_search;
+        DROP TABLE IF EXISTS textable_book_author;
+        DROP TABLE IF EXISTS textable_search_version;
+
+        CREATE TABLE textable_book_author (
+            bookid INTEGER PRIMARY KEY,
+            authorid INTEGER
+        );
+        INSERT INTO textable_book_author
+        SELECT bookid, MAX(authorid) FROM book_authors GROUP BY bookid;
+    """)
+    try:
+        connection.execute("""
+            CREATE VIRTUAL TABLE textable_search USING fts5(
+                title,
+                author,
+                gutenbergbookid UNINDEXED,
+                language UNINDEXED,
+                tokenize = 'trigram'
+            )
+        """)
+    # SQLite builds without FTS5 (or older than 3.34) get a plain table...
+    except sqlite3.OperationalError:
+        connection.execute("""
+            CREATE TABLE textable_search (
+                title TEXT,
+                author TEXT,
+                gutenbergbookid INTEGER,
+                language TEXT
+            )
+        """)
+    connection.execute("""
+        INSERT INTO textable_search
+        SELECT titles.name, authors.name, books.gutenbergbookid,
+            languages.name
+        FROM titles
+        INNER JOIN books ON books.id = titles.bookid
+        INNER JOIN textable_book_author
+            ON books.id = textable_book_author.bookid
+        INNER JOIN authors ON authors.id = textable_book_author.authorid
+        INNER JOIN languages ON books.languageid = languages.id
+        ORDER BY titles.id
+    """)
+    connection.execute("CREATE TABLE textable_search_version (version INTEGER)")
+    connection.execute(
+        "INSERT INTO textable_search_version VALUES (?)",
+        (SEARCH_INDEX_VERSION,),
+    )
+    connection.commit()
+
+
+def search_index(connection, title="", author=(), language="", limit=200):
+    """Search the index built by build_search_index and return a list of
+    (title, author, gutenberg id, language code) tuples. Title is matched as
+    a case-insensitive substring, author as a sequence of case-insensitive
+    substrings occurring in this order, language as an exact code; empty
+    criteria are ignored.
+    """
+    conditions = list()
+    parameters = list()
+    if title:
+        condition, pattern = like_condition("title", title)
+        conditions.append(condition)
+        parameters.append(pattern)
+    if any(author):
+        condition, pattern = like_condition("author", *author)
+        conditions.append(condition)
+        parameters.append(pattern)
+    if language:
+        conditions.append("language = ?")
+        parameters.append(language)
+    query = "SELECT title, author, gutenbergbookid, language " \
+        "FROM textable_search"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " LIMIT ?"
+    parameters.append(limit)
+    return connection.execute(query, parameters).fetchall()
+
+
+def like_condition(column, *parts):
+    """Return a LIKE condition on a column and the pattern matching values
+    that contain the given parts in this order. Wildcards in the parts are
+    escaped; the ESCAPE clause is only added when needed, as it keeps FTS5
+    from using its trigram index.
+    """
+    escaped = [re.sub(r"([\\%_])", r"\\\1", part) for part in parts]
+    condition = column + " LIKE ?"
+    if escaped != list(parts):
+        condition += " ESCAPE '\\'"
+    return condition, "%" + "%".join(escaped) + "%"
+
+
+# SQL scripts shipped with gutenbergpy to create the cache and its indices...
+SQL_SCHEMA_FILENAME = os.path.join(
+    os.path.dirname(gutenbergpy.caches.sqlitecache.__file__),
+    "gutenbergindex.db.sql",
+)
+SQL_INDICES_FILENAME = os.path.join(
+    os.path.dirname(gutenbergpy.caches.sqlitecache.__file__),
+    "gutenbergindex_indices.db.sql",
+)
+
+# Tables of the cache holding the distinct values of a book field...
+LOOKUP_TABLES = {
+    "authors": "authors",
+    "subjects": "subjects",
+    "type": "types",
+    "language": "languages",
+    "bookshelf": "bookshelves",
+    "publisher": "publishers",
+    "rights": "rights",
+    "filetype": "downloadlinkstype",
+}
+
+
+def iter_rdf_archive(archive_path):
+    """Iterate over the RDF files of the Gutenberg catalogue archive
+    (rdf-files.tar.bz2) without unpacking it, yielding (gutenberg id,
+    modification time, RDF content, archive bytes read so far) tuples.
+    """
+    with open(archive_path, "rb") as file:
+        with tarfile.open(fileobj=file, mode="r|*") as tar:
+            for member in tar:
+                match = re.search(r"(?:^|/)(\d+)/pg\1\.rdf$", member.name)
+                if not member.isfile() or not match:
+                    continue
+                content = tar.extractfile(member).read()
+                yield int(match.group(1)), member.mtime, content, file.tell()
+
+
+def parse_rdf(gutenberg_id, rdf):
+    """Extract the metadata of a book from its RDF description, as
+    gutenbergpy does"""
+    namespaces = GutenbergCacheSettings.NS
+    root = ElementTree.fromstring(rdf)
+
+    def values(*paths):
+        found = list()
+        for path in paths:
+            for element in root.iterfind(path, namespaces):
+                if element.text:
+                    found.append(element.text.replace("\"", "'"))
+        return list(dict.fromkeys(found))
+
+    def value(*paths):
+        found = values(*paths)
+        return found[0] if found else None
+
+    files = list()
+    for fileFormat in root.iterfind(".//dcterms:hasFormat", namespaces):
+        link = fileFormat.find(".//pgterms:file", namespaces)
+        fileType = fileFormat.find(
+            ".//dcterms:format/rdf:Description/rdf:value", namespaces
+        )
+        if link is None or fileType is None or not fileType.text:
+            continue
+        about = link.get("{%s}about" % namespaces["rdf"])
+        if about:
+            files.append(
+                (about.replace("\"", "'"), fileType.text.replace("\"", "'"))
+            )
+
+    issued = value(".//dcterms:issued")
+    downloads = value(".//pgterms:downloads")
+    return {
+        "gutenbergbookid": gutenberg_id,
+        "titles": values(".//dcterms:title", ".//dcterms:alternative"),
+        "authors": values(
+            ".//dcterms:creator/pgterms:agent/pgterms:alias",
+            ".//dcterms:creator/pgterms:agent/pgterms:name",
+        ),
+        "subjects": values(".//dcterms:subject/rdf:Description/rdf:value"),
+        "type": value(".//dcterms:type/rdf:Description/rdf:value"),
+        "language": value(".//dcterms:language/rdf:Description/rdf:value"),
+        "bookshelf": value(".//pgterms:bookshelf/rdf:Description/rdf:value"),
+        "publisher": value(".//dcterms:publisher"),
+        "rights": value(".//dcterms:rights"),
+        "files": files,
+        "dateissued": issued if issued and issued != "None" else "1000-10-10",
+        "numdownloads": int(downloads) if downloads else -1,
+    }
+
+
+def load_lookups(connection):
+    """Return a dict mapping each lookup table of the cache to a dict
+    mapping its values to their ids"""
+    return {
+        table: {
+            name: rowid for rowid, name
+            in connection.execute("SELECT id, name FROM %s" % table)
+        }
+        for table in set(LOOKUP_TABLES.values())
+    }
+
+
+def lookup_id(connection, lookups, field, name):
+    """Return the id of a value in a lookup table of the cache, inserting
+    it if needed (-1 for a missing value, as gutenbergpy does)"""
+    if name is None:
+        return -1
+    table = LOOKUP_TABLES[field]
+    if name not in lookups[table]:
+        lookups[table][name] = connection.execute(
+            "INSERT INTO %s(name) VALUES (?)" % table, (name,)
+        ).lastrowid
+    return lookups[table][name]
+
+
+def store_book(connection, lookups, book, book_id=None):
+    """Insert a book parsed by parse_rdf in the cache, or replace the
+    book with id book_id"""
+    row = (
+        lookup_id(connection, lookups, "publisher", book["publisher"]),
+        book["dateissued"],
+        lookup_id(connection, lookups, "rights", book["rights"]),
+        book["numdownloads"],
+        lookup_id(connection, lookups, "language", book["language"]),
+        lookup_id(connection, lookups, "bookshelf", book["bookshelf"]),
+        book["gutenbergbookid"],
+        lookup_id(connection, lookups, "type", book["type"]),
+    )
+    if book_id is None:
+        book_id = connection.execute(
+            "INSERT INTO books(publisherid, dateissued, rightsid, "
+            "numdownloads, languageid, bookshelveid, gutenbergbookid, typeid) "
+            "VALUES (?,?,?,?,?,?,?,?)",
+            row,
+        ).lastrowid
+    else:
+        connection.execute(
+            "UPDATE books SET publisherid = ?, dateissued = ?, rightsid = ?, "
+            "numdownloads = ?, languageid = ?, bookshelveid = ?, "
+            "gutenbergbookid = ?, typeid = ? WHERE id = ?",
+            row + (book_id,),
+        )
+        for table in ("titles", "book_authors", "book_subjects",
+                      "downloadlinks"):
+            connection.execute(
+                "DELETE FROM %s WHERE bookid = ?" % table, (book_id,)
+            )
+    connection.executemany(
+        "INSERT INTO titles(name, bookid) VALUES (?,?)",
+        [(title, book_id) for title in book["titles"]],
+    )
+    connection.executemany(
+        "INSERT INTO book_authors(authorid, bookid) VALUES (?,?)",
+        [
+            (lookup_id(connection, lookups, "authors", author), book_id)
+            for author in book["authors"]
+        ],
+    )
+    connection.executemany(
+        "INSERT INTO book_subjects(subjectid, bookid) VALUES (?,?)",
+        [
+            (lookup_id(connection, lookups, "subjects", subject), book_id)
+            for subject in book["subjects"]
+        ],
+    )
+    connection.executemany(
+        "INSERT INTO downloadlinks(name, bookid, downloadtypeid) "
+        "VALUES (?,?,?)",
+        [
+            (
+                link,
+                book_id,
+                lookup_id(connection, lookups, "filetype", fileType),
+            )
+            for link, fileType in book["files"]
+        ],
+    )
+
+
+def catalogue_build_time(connection):
+    """Return the time of the last build of the cache. For caches built by
+    gutenbergpy, it is recorded when the cache is first opened here (before
+    anything else is written to it): the modification time of the cache
+    file at that point."""
+    try:
+        row = connection.execute(
+            "SELECT built FROM textable_catalogue_build"
+        ).fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    if row is not None:
+        return row[0]
+    path = connection.execute("PRAGMA database_list").fetchone()[2]
+    built = os.path.getmtime(path) if path else 0
+    set_catalogue_build_time(connection, built)
+    return built
+
+
+def set_catalogue_build_time(connection, built):
+    """Record the time of the last build of the cache"""
+    connection.executescript("""
+        DROP TABLE IF EXISTS textable_catalogue_build;
+        CREATE TABLE textable_catalogue_build (built REAL);
+    """)
+    connection.execute(
+        "INSERT INTO textable_catalogue_build VALUES (?)", (built,)
+    )
+    connection.commit()
+
+
 if __name__ == "__main__":
     #import sys
     #from PyQt5.QtWidgets import QApplication
@@ -30,21 +30,27 @@ from Orange.widgets.utils.widgetpreview import WidgetPreview
 
 from _textable.widgets.TextableUtils import (
     OWTextableBaseWidget, VersionedSettingsHandler, pluralize,
-    InfoBox, SendButton, ProgressBar,
+    InfoBox, SendButton,
 )
 
 from LTTL.Segmentation import Segmentation
-import LTTL.Segmenter as Segmenter
+import LTTL.SegmenterThread as Segmenter
 from LTTL.Input import Input
 
 from PyQt5.QtWidgets import QMessageBox
 
-from urllib.request import urlopen
+from orangecontrib.textable_prototypes.widgets.poetica_donnees import (
+    crawl_catalogue, ensure_index, fetch_poem, load_database, make_session,
+    save_database, search_index,
+)
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 
+import hashlib
 import inspect
-import re
-import pickle
 import os
+import requests
 
 class Poetica(OWTextableBaseWidget):
     """Textable widget for importing XML data from the website Poetica
@@ -81,6 +87,11 @@ class Poetica(OWTextableBaseWidget):
     autoSend = settings.Setting(True)
     corpus = settings.Setting([])
 
+    # Number of simultaneous connections to Poetica.
+    maxWorkers = 4
+    # Folder of the poem store (in the widget's folder).
+    poemsFoldername = "cached_poetica_poems"
+
     def __init__(self):
         """
         Widget creator
@@ -104,8 +115,6 @@ class Poetica(OWTextableBaseWidget):
         self.corpusLabels = list()
         # Stocks all the inputs (poems) in a list.
         self.createdInputs = list()
-        # Cache dictionary.
-        self.cache = dict()
 
         # Next two instructions are helpers from TextableUtils. Corresponding
         # interface elements are declared here and actually drawn below (at
@@ -115,6 +124,7 @@ class Poetica(OWTextableBaseWidget):
             widget=self.controlArea,
             master=self,
             callback=self.sendData,
+            cancelCallback=self.cancel_manually,
             infoBoxAttribute="infoBox",
         )
         #----------------------------------------------------------------------
@@ -129,23 +139,16 @@ class Poetica(OWTextableBaseWidget):
         # Import the poem's database.
         self.db = self.openDatabase()
 
-        # Store the list of authors...
-        self.authors_list = list()
-        self.authors_list.append("Select an author")
-        for author in sorted(set(self.db["author"].values())):
-            self.authors_list.append(author)
-
-        # Store the list of topics...
-        self.topics_list = list()
-        self.sorted_topics_list = list()
-        self.final_topics_list = list()
-        self.final_topics_list.append("Select a topic")
-        for topic in sorted(set(self.db["topic"].values())):
-            self.final_topics_list.append(topic)
+        # Store the lists of authors and topics (precomputed in the
+        # database's index)...
+        self.authors_list = ["Select an author"]
+        self.authors_list.extend(self.db["index"]["authorList"])
+        self.final_topics_list = ["Select a topic"]
+        self.final_topics_list.extend(self.db["index"]["topicList"])
 
         # Allows to select an author in a list...
         # Uses "authorQuery" attribut...
-        gui.comboBox(
+        self.authorComboBox = gui.comboBox(
             widget=queryBox,
             master=self,
             value='authorQuery',
@@ -161,7 +164,7 @@ class Poetica(OWTextableBaseWidget):
 
         # Allows to select a topic in a list...
         # Uses "topicQuery" attribut...
-        gui.comboBox(
+        self.topicComboBox = gui.comboBox(
             widget=queryBox,
             master=self,
             value='topicQuery',
@@ -287,6 +290,10 @@ class Poetica(OWTextableBaseWidget):
         self.clearCorpusButton.setDisabled(True)
 
         gui.separator(widget=mytitleBox, height=3)
+
+        # Both boxes are frozen while a task runs (see manageGuiVisibility)...
+        self.guiElements.extend([queryBox, mytitleBox])
+
         gui.rubber(self.controlArea)
 
         #----------------------------------------------------------------------
@@ -307,7 +314,7 @@ class Poetica(OWTextableBaseWidget):
         result = QMessageBox.information(
             None,
             'Poetica',
-            'Are you sure you want to refresh the database ? This may take some time. Once the database is updated, it may be necessary to restart the Orange software to be able to use the widget correctly.',
+            'Are you sure you want to refresh the database ? This may take some time.',
             QMessageBox.Ok | QMessageBox.Cancel
         )
         if result == QMessageBox.Ok:
@@ -315,191 +322,164 @@ class Poetica(OWTextableBaseWidget):
 
     def dataExtraction(self):
         """
-        Function to extract data
+        Refresh the database in a worker thread
         """
 
-        database = {
-            "title": {},
-            "author": {},
-            "topic": {},
-        }
+        self.infoBox.setText(
+            "Refreshing the database, please wait...",
+            "warning",
+        )
+        self.progressBarInit()
+        self.threading(partial(self.crawlDatabase, self.db))
+
+    def crawlDatabase(self, database):
+        """
+        Crawl Poetica (only the author and topic pages that changed since
+        the last refresh) and save the new database (run in a worker thread)
+        """
 
-        # Go to Poetica's homepage...
+        self.signal_prog.emit(1, False)
         try:
-            poetica_url = 'https://www.poetica.fr/'
-            url_accueil = urlopen(poetica_url)
-            page_accueil = url_accueil.read()
-            print("Valid poetica's URL")
-            page_accueil = page_accueil.decode("utf-8")
-
-            # Extract the list of authors...
-            base_seg = Input(page_accueil)
-            condition = dict()
-            condition["id"] = re.compile(r"^menu-poemes-par-auteur$")
-            xml_auteurs = Segmenter.import_xml(
-                segmentation=base_seg,
-                element="<ul>",
-                conditions=condition,
+            result = crawl_catalogue(
+                database,
+                self.__class__.maxWorkers,
+                progress=lambda done, total: self.signal_prog.emit(
+                    int(100*done/total), False
+                ),
+                cancelled=lambda: self.cancel_operation,
             )
+        except requests.exceptions.RequestException:
+            return {
+                "database": None,
+                "error": "Couldn't connect to Poetica, please try again.",
+            }
+        if result is None:
+            return None
+        try:
+            save_database(result["database"])
+        except IOError:
+            result["error"] = "Couldn't save the database to disk."
+        return result
 
-            # Extract the list of topics...
-            seg_themes = Input(page_accueil)
-            condition_themes = dict()
-            condition_themes["id"] = re.compile(r"^menu-poemes-par-theme$")
-            xml_themes = Segmenter.import_xml(
-                segmentation=seg_themes,
-                element="<ul>",
-                conditions=condition_themes,
-            )
+    @OWTextableBaseWidget.task_decorator
+    def task_finished(self, f):
+        """
+        All operations following the termination of a worker thread
+        """
 
-            # Recover the url link to each author's page...
-            xml_par_auteur = Segmenter.import_xml(
-                segmentation=xml_auteurs,
-                element="<a>",
-            )
+        processed_data = f.result()
+
+        # Operation cancelled by user...
+        if processed_data is None:
+            self.infoBox.setText("Operation cancelled.", "warning")
+            return
+
+        # Database refresh...
+        if "database" in processed_data:
+            self.databaseRefreshed(processed_data)
+            return
+
+        if "error" in processed_data:
+            self.infoBox.setText(processed_data["error"], "error")
+            self.send("Poems importation", None)
+            return
+
+        self.segmentation = processed_data["segmentation"]
 
-            # Recover the url link to each topic's page...
-            xml_par_theme = Segmenter.import_xml(
-                segmentation=xml_themes,
-                element="<a>",
+        # Set status to OK (or warn about missing poems) and report data
+        # size...
+        message = "%i segment@p sent to output " % len(self.segmentation)
+        message = pluralize(message, len(self.segmentation))
+        numChars = 0
+        for segment in self.segmentation:
+            segmentLength = len(Segmentation.get_data(segment.str_index))
+            numChars += segmentLength
+        message += "(%i character@p)." % numChars
+        message = pluralize(message, numChars)
+        if processed_data["failed"]:
+            message += " Couldn't download: %s." % ", ".join(
+                self.db["index"]["labels"].get(url, url)
+                for url in processed_data["failed"]
             )
+            self.infoBox.setText(message, "warning")
+        else:
+            self.infoBox.setText(message)
 
-            # Go to each author's page...
-            for auteur in xml_par_auteur:
-                try:
-                    url_page_auteur = auteur.annotations["href"]
-                    url_auteur = urlopen(url_page_auteur)
-                    page_auteur = url_auteur.read()
-                    print("Valid author's URL")
-                    page_auteur = page_auteur.decode("utf-8")
-
-                    # Recover the author's name.
-                    nom_auteur = auteur.get_content()
-                    nom_auteur_ok = nom_auteur.replace("&rsquo;", "'")
-
-                    # Extract the list poems...
-                    seg_auteurs = Input(page_auteur)
-                    condition_auteur = dict()
-                    condition_auteur["class"] = re.compile(r"^entry-header$")
-                    xml_poemes = Segmenter.import_xml(
-                        segmentation=seg_auteurs,
-                        element="<header>",
-                        conditions=condition_auteur,
-                    )
-
-                    # Recover the url link to each poem's page...
-                    xml_par_poeme = Segmenter.import_xml(
-                        segmentation=xml_poemes,
-                        element="<a>",
-                    )
-
-                    # Go to each poem's page...
-                    for poeme in xml_par_poeme:
-                        try:
-                            url_page_poeme = poeme.annotations["href"]
-                            url_poeme = urlopen(url_page_poeme)
-                            page_poeme = url_poeme.read()
-                            print("Valid poem's URL")
-                            page_poeme = page_poeme.decode("utf-8")
-
-                            # Get poem's title.
-                            nom_poeme = poeme.get_content()
-                            nom_poeme_ok = nom_poeme.replace("&rsquo;", "'")
-
-                            database["title"][url_page_poeme] = nom_poeme_ok
-                            database["author"][url_page_poeme] = nom_auteur_ok
-
-                        # Warn if the url doesn't work...
-                        except IOError:
-                            print("Invalid poem's URL")
-
-                # Warn if the url doesn't work...
-                except IOError:
-                    print("Invalid author's URL")
-
-            # Go to each topic's page...
-            for theme in xml_par_theme:
-                try:
-                    url_page_theme = theme.annotations["href"]
-                    url_theme = urlopen(url_page_theme)
-                    page_theme = url_theme.read()
-                    print("Valid topic's URL")
-                    page_theme = page_theme.decode("utf-8")
-
-                    # Recover the topic's name.
-                    nom_theme = theme.get_content()
-                    nom_theme_ok = nom_theme.replace("&rsquo;", "'")
-
-                    # Extract the list of poems...
-                    seg_themes = Input(page_theme)
-                    condition_themes = dict()
-                    condition_themes["class"] = re.compile(r"^entry-header$")
-                    xml_poemes_themes = Segmenter.import_xml(
-                        segmentation=seg_themes,
-                        element="<header>",
-                        conditions=condition_themes,
-                    )
-
-                    # Recover the url link to each poem's page...
-                    xml_par_theme = Segmenter.import_xml(
-                        segmentation=xml_poemes_themes,
-                        element="<a>",
-                    )
-
-                    # Go to each poem's page...
-                    for poeme_theme in xml_par_theme:
-                        try:
-                            url_page_poeme_theme = poeme_theme.annotations["href"]
-
-                            database["topic"][url_page_poeme_theme] = nom_theme_ok
-
-                        # Warn if the url doesn't work...
-                        except IOError:
-                            print("Invalid poem's URL")
-
-                # Warn if the url doesn't work...
-                except IOError:
-                    print("Invalid topic's URL")
-
-        # Warn if the url doesn't work...
-        except IOError:
-            print("Invalid poetica's URL")
+        self.send("Poems importation", self.segmentation)
+        self.sendButton.resetSettingsChangedFlag()
 
-        # Define a path to later locate the access path for the backup...
-        path = os.path.dirname(
-            os.path.abspath(inspect.getfile(inspect.currentframe()))
-        )
+    def databaseRefreshed(self, processed_data):
+        """
+        Use the refreshed database and update the dropdown lists
+        """
 
-        # Back up dictionaries with pickle...
-        try:
-            file = open(os.path.join(path, "poetica_cache_ok.p"), "wb")
-            pickle.dump(database, file)
-            print('The dictionary has successfully been saved to the file')
-            file.close()
-        except IOError:
-            print("Can't save the dictionary")
+        if processed_data["database"] is not None:
+            self.useDatabase(processed_data["database"])
 
-    def openDatabase(self):
+        if "error" in processed_data:
+            self.infoBox.setText(processed_data["error"], "error")
+        elif processed_data["failed"]:
+            message = (
+                "Database updated, but %i author or topic page@p couldn't "
+                "be downloaded, please refresh again."
+                % len(processed_data["failed"])
+            )
+            message = pluralize(message, len(processed_data["failed"]))
+            self.infoBox.setText(message, "warning")
+        else:
+            message = (
+                "Database updated (%i page@p changed)."
+                % processed_data["changed"]
+            )
+            message = pluralize(message, processed_data["changed"])
+            self.infoBox.setText(message)
+
+    def useDatabase(self, database):
         """
-        Function to open the database
+        Replace the database and update the dropdown lists and baskets
         """
 
-        # Define a path to later locate the access path for the backup...
-        path = os.path.dirname(
-            os.path.abspath(inspect.getfile(inspect.currentframe()))
-        )
+        self.db = database
+        self.authors_list = ["Select an author"]
+        self.authors_list.extend(self.db["index"]["authorList"])
+        self.final_topics_list = ["Select a topic"]
+        self.final_topics_list.extend(self.db["index"]["topicList"])
+        for comboBox, items, value in (
+            (self.authorComboBox, self.authors_list, "authorQuery"),
+            (self.topicComboBox, self.final_topics_list, "topicQuery"),
+        ):
+            selected = getattr(self, value)
+            if selected not in items:
+                selected = items[0]
+            comboBox.clear()
+            comboBox.addItems(items)
+            comboBox.setCurrentIndex(items.index(selected))
+            setattr(self, value, selected)
+        self.searchButtonFunction()
+
+        # Drop poems that are no longer in the catalogue...
+        self.results = [
+            url for url in self.results if url in self.db["title"]
+        ]
+        self.updateResultLabels()
+        corpus = [url for url in self.corpus if url in self.db["title"]]
+        if corpus != self.corpus:
+            self.corpus = corpus
+            self.updateCorpusLabels()
 
-        # Open dictionaries with pickle...
-        try:
-            file = open(os.path.join(path, "poetica_cache_ok.p"), "rb")
-            new_database = pickle.load(file)
-            print("Dictionary correctly loaded")
-            file.close()
-        except IOError:
-            print("Can't load the dictionary")
+    def openDatabase(self):
+        """
+        Function to open the database
+        """
 
-        # Return the stored dictionary.
-        return new_database
+        # Older caches have no search index: build it once and save it...
+        database = load_database()
+        if ensure_index(database):
+            try:
+                save_database(database)
+            except IOError:
+                pass
+        return database
 
     def searchButtonFunction(self):
         """
@@ -524,29 +504,21 @@ class Poetica(OWTextableBaseWidget):
             self.infoBox.setText(f"You didn't select anything!", "warning")
             return
 
-        all_urls = self.db["author"].keys()
-
-        selected_urls = list()
-
-        # If an author has been selected...
-        if self.authorQuery != "Select an author":
-            for url in all_urls:
-                if self.db["author"][url] == self.authorQuery:
-                    selected_urls.append(url)
-            all_urls = selected_urls
-
-        # If a topic has been selected...
-        if self.topicQuery != "Select a topic":
-            selected_urls = list()
-            for url in all_urls:
-                try:
-                    if self.topicQuery in self.db["topic"][url]:
-                        selected_urls.append(url)
-                except KeyError:
-                    pass
+        # Look the selected author and/or topic up in the index...
+        selected_urls = search_index(
+            self.db["index"],
+            author=(
+                self.authorQuery
+                if self.authorQuery != "Select an author" else None
+            ),
+            topic=(
+                self.topicQuery
+                if self.topicQuery != "Select a topic" else None
+            ),
+        )
 
         # Show results found in the first basket...
-        self.results = selected_urls[:]
+        self.results = selected_urls
         self.updateResultLabels()
 
     def updateResultLabels(self):
@@ -554,10 +526,8 @@ class Poetica(OWTextableBaseWidget):
         Update the resultlabels list
         """
 
-        self.resultLabels = list()
-        for url in self.results :
-            self.resultLabels.append(f"{self.db['title'][url]} ({self.db['author'][url]})")
-        self.resultLabels = self.resultLabels
+        labels = self.db["index"]["labels"]
+        self.resultLabels = [labels[url] for url in self.results]
         self.clearResultsButton.setDisabled(len(self.resultLabels) == 0)
         self.addButton.setDisabled(self.resultLabels == list())
 
@@ -586,10 +556,8 @@ class Poetica(OWTextableBaseWidget):
         Update the corpusLabels list
         """
 
-        self.corpusLabels = list()
-        for url in self.corpus :
-            self.corpusLabels.append(f"{self.db['title'][url]} ({self.db['author'][url]})")
-        self.corpusLabels = self.corpusLabels
+        labels = self.db["index"]["labels"]
+        self.corpusLabels = [labels[url] for url in self.corpus]
         self.clearCorpusButton.setDisabled(len(self.corpusLabels) == 0)
         self.sendButton.settingsChanged()
 
@@ -640,127 +608,113 @@ class Poetica(OWTextableBaseWidget):
         # Clear created Inputs.
         self.clearCreatedInputs()
 
-        self.controlArea.setDisabled(True)
+        self.infoBox.setText("Step 1/2: Retrieving poems...", "warning")
+        self.progressBarInit()
 
-        # Initialize progress bar...
-        progressBar = ProgressBar(
-            self,
-            iterations=len(self.corpus)
-        )
-
-        # Attempt to connect to Poetica and retrieve poems...
-        poem_content = list()
-
-        annotations_list_authors = list()
-        annotations_list_tiles = list()
-        annotations_list_urls = list()
-        annotations_list_topics = list()
-
-        annotations_author = dict()
-        annotations_title = dict()
-        annotations_url = dict()
-        annotations_topic = dict()
-
-        #try:
-        for url in self.corpus:
-            # If the poem is already in the cache...
-            if url in self.cache:
-                poem_content.append(self.cache[url])
-
-            # If the poem isn't already in the cache...
-            else:
-                try:
-                    url_poeme = urlopen(url)
-                    page_poeme = url_poeme.read()
-                    print("Valid poem's URL")
-                    page_poeme = page_poeme.decode("utf-8")
-
-                    # Extract the poems and its data...
-                    seg_poemes = Input(page_poeme)
-                    condition_poeme = dict()
-                    condition_poeme["class"] = re.compile(r"^entry-content$")
-                    xml_contenu_poeme = Segmenter.import_xml(
-                        segmentation=seg_poemes,
-                        element="<div>",
-                        conditions=condition_poeme,
-                    )
-
-                    # Get the poem with his own tags.
-                    poeme_balises = xml_contenu_poeme[0].get_content()
-
-                    # Show only the poem's content...
-                    poeme = re.sub(r"((</?p.*?>)|(<br />))|(<em>.*</em>)|(</p>)", "", poeme_balises)
-                    poeme = re.sub(r".+$", "", poeme)
-                    poeme = poeme.replace("&rsquo;", "'")
-
-                    poem_content.append(poeme)
-                    self.cache[url] = poeme
-
-                # If the url doesn't work...
-                except IOError:
-                    print("Invalid poem's URL")
-
-            # Annotate the poem...
-            annotations_author["Author"] = self.db["author"][url]
-            annotations_title["Title"] = self.db["title"][url]
-            annotations_url["URL"] = url
-            try:
-                annotations_topic["Topic"] = self.db["topic"][url]
-            except KeyError:
-                pass
-
-            annotations_list_authors.append(annotations_author.copy())
-            annotations_list_tiles.append(annotations_title.copy())
-            annotations_list_urls.append(annotations_url.copy())
-            annotations_list_topics.append(annotations_topic.copy())
+        # Retrieve poems in a worker thread...
+        self.threading(partial(self.processData, list(self.corpus)))
 
-            # 1 tick on the progress bar of the widget
-            progressBar.advance()
+    def processData(self, corpus):
+        """
+        Get the poems of the corpus, from the poem store or else by
+        downloading them concurrently, and build the output segmentation
+        (run in a worker thread)
+        """
 
-        # Store downloaded poems strings in input objects...
-        for poem in poem_content:
-            newInput = Input(poem, self.captionTitle)
+        self.signal_prog.emit(1, False)
+        poems = dict()
+        failed = list()
+        session = make_session(self.__class__.maxWorkers)
+        executor = ThreadPoolExecutor(max_workers=self.__class__.maxWorkers)
+        futures = {
+            executor.submit(self.getPoem, session, url): url
+            for url in corpus
+        }
+        cur_itr = 1
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                poems[url] = future.result()
+            except (requests.exceptions.RequestException, ValueError):
+                failed.append(url)
+            self.signal_prog.emit(int(100*cur_itr/len(futures)), False)
+            cur_itr += 1
+            if self.cancel_operation:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self.signal_prog.emit(100, False)
+                return None
+        executor.shutdown()
+
+        if not poems:
+            return {"error": "Couldn't download poems from Poetica."}
+
+        self.signal_text.emit("Step 2/2: Post-processing...", "warning")
+        self.signal_prog.emit(1, True)
+
+        # Store poems in input objects annotated with author, title, url
+        # and topic...
+        for url in corpus:
+            if url not in poems:
+                continue
+            newInput = Input(poems[url], self.captionTitle)
+            segment = newInput[0]
+            segment.annotations["Author"] = self.db["author"][url]
+            segment.annotations["Title"] = self.db["title"][url]
+            segment.annotations["URL"] = url
+            if url in self.db["topic"]:
+                segment.annotations["Topic"] = self.db["topic"][url]
+            newInput[0] = segment
             self.createdInputs.append(newInput)
 
-        # If there's only one play, the widget's output is the created Input...
+        # If there's only one poem, the widget's output is the created Input...
         if len(self.createdInputs) == 1:
-            self.segmentation = self.createdInputs[0]
+            segmentation = self.createdInputs[0]
 
         # Otherwise the widget's output is a concatenation...
         else:
-            self.segmentation = Segmenter.concatenate(
-                self.createdInputs,
-                self.captionTitle,
+            segmentation = Segmenter.concatenate(
+                caller=self,
+                segmentations=self.createdInputs,
+                label=self.captionTitle,
                 import_labels_as=None,
             )
 
-        # Annotate segments...
-        for idx, segment in enumerate(self.segmentation):
-            segment.annotations.update(annotations_list_authors[idx])
-            segment.annotations.update(annotations_list_tiles[idx])
-            segment.annotations.update(annotations_list_urls[idx])
-            segment.annotations.update(annotations_list_topics[idx])
-            self.segmentation[idx] = segment
+        return {"segmentation": segmentation, "failed": failed}
 
-        # Clear progress bar.
-        progressBar.finish()
-
-        self.controlArea.setDisabled(False)
+    def getPoem(self, session, url):
+        """
+        Get a poem from the poem store, or else download it and save it in
+        the store (run in a worker thread)
+        """
 
-        # Set status to OK and report data size...
-        message = "%i segment@p sent to output " % len(self.segmentation)
-        message = pluralize(message, len(self.segmentation))
-        numChars = 0
-        for segment in self.segmentation:
-            segmentLength = len(Segmentation.get_data(segment.str_index))
-            numChars += segmentLength
-        message += "(%i character@p)." % numChars
-        message = pluralize(message, numChars)
-        self.infoBox.setText(message)
+        path = os.path.join(
+            os.path.dirname(
+                os.path.abspath(inspect.getfile(inspect.currentframe()))
+            ),
+            self.__class__.poemsFoldername,
+            hashlib.sha1(url.encode("utf-8")).hexdigest() + ".txt",
+        )
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                return file.read()
+        except IOError:
+            pass
 
-        self.send("Poems importation", self.segmentation)
-        self.sendButton.resetSettingsChangedFlag()
+        poem = fetch_poem(session, url)
+        if poem is None:
+            raise ValueError("No poem found")
 
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            pass
+        try:
+            with open(path + ".part", "w", encoding="utf-8") as file:
+                file.write(poem)
+            os.replace(path + ".part", path)
+        except IOError:
+            pass
+        return poem
 
     def clearCreatedInputs(self):
         """
@@ -780,6 +734,7 @@ class Poetica(OWTextableBaseWidget):
             changed = title != self.captionTitle
             super().setCaption(title)
             if changed:
+                self.cancel() # Cancel current operation
                 self.sendButton.settingsChanged()
         else:
             super().setCaption(title)
@@ -1,246 +1,454 @@
-"""Extraction des données de Poetica"""
+"""Extraction des données de Poetica
+
+Ce module parcourt le catalogue de poetica.fr (pages d'auteurs et de
+themes) et l'enregistre dans poetica_cache_ok.p, le fichier utilise par le
+widget Poetica. Il peut etre lance sans interface graphique, par exemple
+depuis une tache cron :
+
+    python -m orangecontrib.textable_prototypes.widgets.poetica_donnees
+
+Par defaut, seules les pages d'auteurs et de themes modifiees depuis la
+derniere visite sont relues (option --full pour tout reparcourir).
+"""
 
 
 # Importer les packages necessaires...
+import argparse
+import codecs
+import hashlib
 import inspect
 import os
 import pickle
 import re
-import LTTL.Segmenter as Segmenter
-from LTTL.Input import Input
-from urllib.request import urlopen
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html.parser import HTMLParser
+
+import requests
+
+POETICA_URL = "https://www.poetica.fr/"
+CACHE_FILENAME = "poetica_cache_ok.p"
+MAX_WORKERS = 4
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 1.0
+INDEX_VERSION = 1
+
+
+class LinkExtractor(HTMLParser):
+    """Recupere les liens (url, texte) contenus dans les elements d'une
+    page qui ont une balise et une valeur d'attribut donnees"""
+
+    def __init__(self, tag, attribute, value):
+        super().__init__(convert_charrefs=False)
+        self.tag = tag
+        self.attribute = attribute
+        self.value = value
+        self.depth = 0
+        self.href = None
+        self.text = list()
+        self.links = list()
+
+    def handle_starttag(self, tag, attrs):
+        if self.depth:
+            if tag == self.tag:
+                self.depth += 1
+            elif tag == "a":
+                self.href = dict(attrs).get("href")
+                self.text = list()
+        elif tag == self.tag and dict(attrs).get(self.attribute) == self.value:
+            self.depth = 1
+
+    def handle_endtag(self, tag):
+        if not self.depth:
+            return
+        if tag == "a" and self.href is not None:
+            name = "".join(self.text).replace("&rsquo;", "'")
+            self.links.append((self.href, name))
+            self.href = None
+        elif tag == self.tag:
+            self.depth -= 1
+
+    def handle_data(self, data):
+        if self.href is not None:
+            self.text.append(data)
+
+    # Garder les entites telles quelles (comme Segmenter.import_xml)...
+    def handle_entityref(self, name):
+        self.handle_data("&%s;" % name)
+
+    def handle_charref(self, name):
+        self.handle_data("&#%s;" % name)
+
+
+class PoemExtractor(HTMLParser):
+    """Recupere le contenu du <div class="entry-content"> d'une page de
+    poeme, sans les balises <p> et <br> ni les passages en <em>, et
+    s'arrete des que ce div est ferme"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.depth = 0
+        self.emphasis = 0
+        self.content = list()
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if not self.depth:
+            if tag == "div" and dict(attrs).get("class") == "entry-content":
+                self.depth = 1
+            return
+        if tag == "div":
+            self.depth += 1
+        elif tag == "em":
+            self.emphasis += 1
+            return
+        elif tag in ("p", "br"):
+            return
+        self.handle_data(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if self.done or not self.depth:
+            return
+        if tag == "div":
+            self.depth -= 1
+            if not self.depth:
+                self.done = True
+                return
+        elif tag == "em":
+            self.emphasis = max(0, self.emphasis - 1)
+            return
+        elif tag in ("p", "br"):
+            return
+        self.handle_data("</%s>" % tag)
+
+    def handle_data(self, data):
+        if self.depth and not self.emphasis and not self.done:
+            self.content.append(data)
+
+    def handle_entityref(self, name):
+        self.handle_data("&%s;" % name)
+
+    def handle_charref(self, name):
+        self.handle_data("&#%s;" % name)
+
+
+def extract_poem(chunks):
+    """Renvoie le texte d'un poeme a partir des morceaux (bytes) de sa
+    page, en arretant la lecture apres le contenu du poeme. Renvoie None
+    si la page ne contient pas de poeme."""
+    extractor = PoemExtractor()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in chunks:
+        extractor.feed(decoder.decode(chunk))
+        if extractor.done:
+            break
+    if not extractor.depth and not extractor.done:
+        return None
+    poeme = "".join(extractor.content)
+
+    # Retirer la derniere ligne (comme l'ancienne extraction)...
+    poeme = re.sub(r".+$", "", poeme)
+    return poeme.replace("&rsquo;", "'")
+
+
+def fetch_poem(session, url):
+    """Telecharge le texte d'un poeme (seul le debut de la page, jusqu'a
+    la fin du poeme, est lu)"""
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            response = session.get(url, timeout=30, stream=True)
+            try:
+                response.raise_for_status()
+                return extract_poem(response.iter_content(16384))
+            finally:
+                response.close()
+        except requests.exceptions.RequestException:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+
+
+def extract_links(page, tag, attribute, value):
+    """Renvoie la liste des liens (url, texte) d'une page contenus dans
+    les elements <tag attribute="value">"""
+    extractor = LinkExtractor(tag, attribute, value)
+    extractor.feed(page)
+    extractor.close()
+    return extractor.links
+
+
+def make_session(max_workers=MAX_WORKERS):
+    """Renvoie une session requests dont le pool de connexions est
+    dimensionne pour les threads de telechargement"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=max_workers,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def fetch(session, url, headers=None):
+    """Telecharge une page en reessayant avec un delai croissant"""
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            response = session.get(url, headers=headers, timeout=30)
+            if response.status_code != 304:
+                response.raise_for_status()
+            return response
+        except requests.exceptions.RequestException:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+
+
+def fetch_listing(session, url, previous=None):
+    """Telecharge la liste des poemes d'une page d'auteur ou de theme.
+    Si la page n'a pas change depuis la visite precedente, renvoie
+    None."""
+    headers = dict()
+    if previous is not None:
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("lastModified"):
+            headers["If-Modified-Since"] = previous["lastModified"]
+    response = fetch(session, url, headers)
+    if response.status_code == 304:
+        return None
+    poems = extract_links(response.text, "header", "class", "entry-header")
+    digest = hashlib.sha1(repr(poems).encode("utf-8")).hexdigest()
+    if previous is not None and previous.get("digest") == digest:
+        return None
+    return {
+        "etag": response.headers.get("ETag"),
+        "lastModified": response.headers.get("Last-Modified"),
+        "digest": digest,
+        "poems": poems,
+    }
 
 
-def main():
-    """Programme principal"""
+def crawl_catalogue(
+    database=None,
+    max_workers=MAX_WORKERS,
+    progress=None,
+    cancelled=None,
+):
+    """Parcourt le catalogue de Poetica.
+
+    Les pages d'auteurs et de themes sont telechargees en parallele (au
+    plus max_workers connexions). Si une base precedente est fournie,
+    seules les pages modifiees depuis sont relues et les autres sont
+    reprises telles quelles. progress(done, total) est appele apres chaque
+    page; si cancelled() devient vrai, le parcours s'arrete et la fonction
+    renvoie None.
+
+    Renvoie un dictionnaire contenant la nouvelle base ("database"), les
+    pages en echec ("failed") et le nombre de pages modifiees
+    ("changed"). Leve requests.exceptions.RequestException si la page
+    d'accueil est inaccessible.
+    """
+    listings = dict()
+    if database is not None:
+        listings.update(database.get("listings", dict()))
+
+    # Extraire les listes d'auteurs et de themes de la page d'accueil...
+    session = make_session(max_workers)
+    homepage = fetch(session, POETICA_URL).text
+    authors = extract_links(homepage, "ul", "id", "menu-poemes-par-auteur")
+    topics = extract_links(homepage, "ul", "id", "menu-poemes-par-theme")
+    urls = list(dict.fromkeys(url for url, _ in authors + topics))
+
+    # Acceder aux pages d'auteurs et de themes en parallele...
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {
+        executor.submit(fetch_listing, session, url, listings.get(url)): url
+        for url in urls
+    }
+    failed = list()
+    changed = 0
+    for done, future in enumerate(as_completed(futures), 1):
+        url = futures[future]
+        try:
+            listing = future.result()
+        except requests.exceptions.RequestException:
+            failed.append(url)
+        else:
+            if listing is not None:
+                listings[url] = listing
+                changed += 1
+        if progress is not None:
+            progress(done, len(futures))
+        if cancelled is not None and cancelled():
+            executor.shutdown(wait=False, cancel_futures=True)
+            return None
+    executor.shutdown()
+
+    return {
+        "database": build_database(authors, topics, listings),
+        "failed": failed,
+        "changed": changed,
+    }
+
 
+def build_database(authors, topics, listings):
+    """Construit la base (titre, auteur et theme de chaque poeme) a partir
+    des listes de poemes des pages d'auteurs et de themes"""
     database = {
         "title": {},
         "author": {},
-        #"date": {},
         "topic": {},
-        #"poem": {},
+        "listings": {},
+    }
+    for url_page_auteur, nom_auteur in authors:
+        if url_page_auteur not in listings:
+            continue
+        database["listings"][url_page_auteur] = listings[url_page_auteur]
+        for url_page_poeme, nom_poeme in listings[url_page_auteur]["poems"]:
+            database["title"][url_page_poeme] = nom_poeme
+            database["author"][url_page_poeme] = nom_auteur
+    for url_page_theme, nom_theme in topics:
+        if url_page_theme not in listings:
+            continue
+        database["listings"][url_page_theme] = listings[url_page_theme]
+        for url_page_poeme, _ in listings[url_page_theme]["poems"]:
+            database["topic"][url_page_poeme] = nom_theme
+    database["index"] = build_index(database)
+    return database
+
+
+def build_index(database):
+    """Construit l'index de recherche de la base : chaque poeme recoit un
+    identifiant (son rang dans le catalogue) et chaque auteur et theme la
+    liste des identifiants de ses poemes. Les listes deroulantes et les
+    libelles des poemes sont aussi calcules une fois pour toutes."""
+    urls = list(database["author"])
+    authors = dict()
+    topics = dict()
+    for poem_id, url in enumerate(urls):
+        authors.setdefault(database["author"][url], set()).add(poem_id)
+        if url in database["topic"]:
+            topics.setdefault(database["topic"][url], set()).add(poem_id)
+    return {
+        "version": INDEX_VERSION,
+        "urls": urls,
+        "authors": authors,
+        "topics": topics,
+        "authorList": sorted(authors),
+        "topicList": sorted(set(database["topic"].values())),
+        "labels": {
+            url: "%s (%s)" % (database["title"][url], database["author"][url])
+            for url in urls
+        },
     }
 
-    # Acceder a la page d'accueil de poetica...
-    try:
-        poetica_url = 'https://www.poetica.fr/'
-        url_accueil = urlopen(poetica_url)
-        page_accueil = url_accueil.read()
-        #print(page_accueil)
-        print("Valid poetica's URL")
-        page_accueil = page_accueil.decode("utf-8")
-        #url_accueil.close()
-
-        # Extraire la liste d'auteurs...
-        base_seg = Input(page_accueil)
-        condition = dict()
-        condition["id"]=re.compile(r"^menu-poemes-par-auteur$")
-        xml_auteurs = Segmenter.import_xml(
-            segmentation=base_seg,
-            element="<ul>",
-            conditions=condition,
-        )
 
-        # Extraire la liste des themes...
-        seg_themes = Input(page_accueil)
-        condition_themes = dict()
-        condition_themes["id"] = re.compile(r"^menu-poemes-par-theme$")
-        xml_themes = Segmenter.import_xml(
-            segmentation=seg_themes,
-            element="<ul>",
-            conditions=condition_themes,
-        )
+def ensure_index(database):
+    """Ajoute l'index a une base qui n'en a pas (ou dont l'index est
+    obsolete). Renvoie True si l'index a du etre reconstruit."""
+    index = database.get("index")
+    if index is not None and index.get("version") == INDEX_VERSION:
+        return False
+    database["index"] = build_index(database)
+    return True
+
+
+def search_index(index, author=None, topic=None):
+    """Renvoie les url des poemes d'un auteur et/ou d'un theme donnes,
+    dans l'ordre du catalogue"""
+    selections = list()
+    if author is not None:
+        selections.append(index["authors"].get(author, set()))
+    if topic is not None:
+        selections.append(index["topics"].get(topic, set()))
+    if not selections:
+        return list()
+    poem_ids = set.intersection(*selections)
+    return [index["urls"][poem_id] for poem_id in sorted(poem_ids)]
+
+
+def cache_path():
+    """Renvoie le chemin du fichier de la base"""
+    path = os.path.dirname(
+        os.path.abspath(inspect.getfile(inspect.currentframe()))
+    )
+    return os.path.join(path, CACHE_FILENAME)
 
-        # Recuperer le lien url vers la page de chaque auteur...
-        xml_par_auteur = Segmenter.import_xml(
-            segmentation=xml_auteurs,
-            element="<a>",
-        )
 
-        # Recuperer le lien url vers la page de chaque theme...
-        xml_par_theme = Segmenter.import_xml(
-            segmentation=xml_themes,
-            element="<a>",
-        )
+def load_database(path=None):
+    """Charge la base enregistree (ou une base vide)"""
+    try:
+        file = open(path or cache_path(), "rb")
+        database = pickle.load(file)
+        file.close()
+    except (IOError, EOFError, pickle.UnpicklingError):
+        database = {"title": {}, "author": {}, "topic": {}}
+    return database
 
-        # Acceder a la page de chaque auteur...
-        for auteur in xml_par_auteur:
-            try:
-                url_page_auteur = auteur.annotations["href"]
-                url_auteur = urlopen(url_page_auteur)
-                page_auteur = url_auteur.read()
-                print("Valid author's URL")
-                page_auteur = page_auteur.decode("utf-8")
-
-                # Recuperer le nom de l'auteur.
-                nom_auteur = auteur.get_content()
-                nom_auteur_ok = nom_auteur.replace("&rsquo;", "'")
-                #print(nom_auteur)
-
-        #print(xml_par_auteur.to_string())
-        #nom_auteur = auteur.get_content()
-            
-
-                # Extraire la liste de poemes...
-                seg_auteurs = Input(page_auteur)
-                condition_auteur = dict()
-                condition_auteur["class"]=re.compile(r"^entry-header$")
-                xml_poemes = Segmenter.import_xml(
-                    segmentation=seg_auteurs,
-                    element="<header>",
-                    conditions=condition_auteur,
-                )
-
-                # Recuperer le lien url vers la page de chaque poeme...
-                xml_par_poeme = Segmenter.import_xml(
-                    segmentation=xml_poemes,
-                    element="<a>",
-                )
-
-                # Acceder a la page de chaque poeme...
-                for poeme in xml_par_poeme:
-                    try:
-                        url_page_poeme = poeme.annotations["href"]
-                        url_poeme = urlopen(url_page_poeme)
-                        page_poeme = url_poeme.read()
-                        print("Valid poem's URL")
-                        page_poeme = page_poeme.decode("utf-8")
-
-                        # Recuperer le nom du poeme.
-                        nom_poeme = poeme.get_content()
-                        nom_poeme_ok = nom_poeme.replace("&rsquo;", "'")
-                        #print(nom_poeme)
-                
-                        # Extraire les poeme et ses donnees...
-                        #seg_poemes = Input(page_poeme)
-                        #condition_poeme = dict()
-                        #condition_poeme["class"]=re.compile(r"^entry-content$")
-                        #xml_contenu_poeme = Segmenter.import_xml(
-                        #    segmentation=seg_poemes,
-                        #    element="<div>",
-                        #    conditions=condition_poeme,
-                        #)
-
-                        # Recuperer le poeme avec ses propres balises.
-                        #poeme_balises = xml_contenu_poeme[0].get_content()
-
-                        # Recuperer et associer la date de parution du poeme si elle est connue...
-                        #regex_date = re.compile(r"(1|2)\d{3}")
-                        #date_poeme_intermediaire = regex_date.search(poeme_balises)
-                        #if date_poeme_intermediaire == None:
-                        #    date_poeme = str(date_poeme_intermediaire)
-                        #else:
-                        #    date_poeme = str(date_poeme_intermediaire.group())
-                        #print(date_poeme)
-
-                        # N'afficher que le contenu du poeme...
-                        #poeme = re.sub(r"((</?p.*?>)|(<br />))|(<em>.*</em>)|(</p>)", "", poeme_balises)
-                        #poeme = re.sub(r".+$", "", poeme)
-                        #print(poeme)
-                        database["title"][url_page_poeme] = nom_poeme_ok
-                        database["author"][url_page_poeme] = nom_auteur_ok
-                        #database["date"][url_page_poeme] = date_poeme
-                        #database["poem"][url_page_poeme] = poeme
-
-                    # Avertir si l'url ne fonctionne pas...
-                    except IOError:
-                        print("Invalid poem's URL")
-
-            # Avertir si l'url ne fonctionne pas...
-            except IOError:
-                print("Invalid author's URL")
-
-        # Acceder a la page de chaque theme...
-        for theme in xml_par_theme:
-            try:
-                url_page_theme = theme.annotations["href"]
-                url_theme = urlopen(url_page_theme)
-                page_theme = url_theme.read()
-                print("Valid topic's URL")
-                page_theme = page_theme.decode("utf-8")
-
-                # Recuperer le nom de l'auteur.
-                nom_theme = theme.get_content()
-                nom_theme_ok = nom_theme.replace("&rsquo;", "'")
-                # print(nom_auteur)
-
-                # print(xml_par_auteur.to_string())
-                # nom_auteur = auteur.get_content()
-
-                # Extraire la liste de poemes...
-                seg_themes = Input(page_theme)
-                condition_themes = dict()
-                condition_themes["class"] = re.compile(r"^entry-header$")
-                xml_poemes_themes = Segmenter.import_xml(
-                    segmentation=seg_themes,
-                    element="<header>",
-                    conditions=condition_themes,
-                )
-
-                # Recuperer le lien url vers la page de chaque poeme...
-                xml_par_theme = Segmenter.import_xml(
-                    segmentation=xml_poemes_themes,
-                    element="<a>",
-                )
-
-                # Acceder a la page de chaque poeme...
-                for poeme_theme in xml_par_theme:
-                    try:
-                        url_page_poeme_theme = poeme_theme.annotations["href"]
-                        #url_poeme_theme = urlopen(url_page_poeme_theme)
-                        #page_poeme_theme = url_poeme_theme.read()
-                        #print("Valid poem's URL")
-                        #page_poeme_theme = page_poeme_theme.decode("utf-8")
-
-                        database["topic"][url_page_poeme_theme] = nom_theme_ok
-                        # database["poem"][url_page_poeme] = poeme
-                        #print(nom_theme)
-                        #print(database["topic"])
-
-                    # Avertir si l'url ne fonctionne pas...
-                    except IOError:
-                        print("Invalid poem's URL")
-
-            # Avertir si l'url ne fonctionne pas...
-            except IOError:
-                print("Invalid topic's URL")
-
-    # Avertir si l'url ne fonctionne pas...
-    except IOError:
-        print("Invalid poetica's URL")
 
-    #print(database)
+def save_database(database, path=None):
+    """Enregistre la base (en remplacant le fichier d'un seul coup, pour
+    qu'un widget ouvert en meme temps ne lise jamais un fichier partiel)"""
+    path = path or cache_path()
+    file = open(path + ".part", "wb")
+    pickle.dump(database, file, -1)
+    file.close()
+    os.replace(path + ".part", path)
 
-    path = os.path.dirname(
-        os.path.abspath(inspect.getfile(inspect.currentframe()))
+
+def main(argv=None):
+    """Programme principal"""
+
+    parser = argparse.ArgumentParser(
+        description="Refresh the Poetica catalogue used by the Poetica "
+                    "widget.",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="visit every author and topic page, even unchanged ones",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=MAX_WORKERS,
+        help="number of simultaneous connections (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache",
+        default=cache_path(),
+        help="catalogue file (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    database = None if args.full else load_database(args.cache)
     try:
-        file = open(os.path.join(path, "poetica_cache_ok.p"), "wb")
-        pickle.dump(database, file)
-        print('The dictionary has successfully been saved to the file')
-        file.close()
-    except IOError:
-        print("Can't save the dictionary")
+        result = crawl_catalogue(database, max(1, args.workers))
+    except requests.exceptions.RequestException as err:
+        print("Invalid poetica's URL: %s" % err, file=sys.stderr)
+        return 1
 
+    for url in result["failed"]:
+        print("Invalid author's or topic's URL: %s" % url, file=sys.stderr)
     try:
-        file = open(os.path.join(path, "poetica_cache_ok.p"), "rb")
-        new_database = pickle.load(file)
-        #print(new_database)
-        print("Dictionary correctly loaded")
-        print(new_database)
-        file.close()
+        save_database(result["database"], args.cache)
     except IOError:
-        print("Can't load the dictionary")
-
-    #print(new_database)
-    #print(new_database["author"])
-    #for key_author, value_author in new_database["author"].items():
-    #    print(f"Key : {key_author} and Value : {value_author}")
-    #    for key_title, value_title in new_database["title"].items():
-    #        for key_poem, value_poem in new_database["poem"].items():
-    #            if key_title == key_author and key_title == key_poem:
-    #                print(f"The poem '{value_title}' has been written by {value_author} : {value_poem}")
-
-if __name__=="__main__":
-    main()
+        print("Can't save the dictionary", file=sys.stderr)
+        return 1
+    print(
+        "%i poems, %i pages changed, %i failed"
+        % (
+            len(result["database"]["title"]),
+            result["changed"],
+            len(result["failed"]),
+        )
+    )
+    return 1 if result["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -21,18 +21,27 @@ along with Orange3-Textable. If not, see <http://www.gnu.org/licenses/>.
 __version__ = '0.0.6'
 
 
-import LTTL.Segmenter as Segmenter
+import LTTL.SegmenterThread as Segmenter
 from LTTL.Segmentation import Segmentation
+from LTTL.Segment import Segment
 from LTTL.Input import Input
 from Orange.widgets.utils.widgetpreview import WidgetPreview
 from _textable.widgets.TextableUtils import (
-    OWTextableBaseWidget, VersionedSettingsHandler, ProgressBar,
+    OWTextableBaseWidget, VersionedSettingsHandler,
     InfoBox, SendButton, pluralize
 )
 #from PyQt5.QtWidgets import QPlainTextEdit
 from Orange.widgets import gui, settings
 from langdetect import detect
 import deep_translator as dt
+from deep_translator import exceptions as dt_exceptions
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+import threading
+import hashlib
+import sqlite3
+import time
 import json
 import os
 import inspect
@@ -64,9 +73,20 @@ class Transletto(OWTextableBaseWidget):
     autoSend = settings.Setting(False)
     translator = settings.Setting('GoogleTranslator')
     labelKey = settings.Setting('')
+    preserveSegments = settings.Setting(True)
 
     want_main_area = False
 
+    # Translation memory (SQLite database in this module's directory)...
+    memoryFilename = "transletto_memory.sqlite"
+
+    # Concurrent translation parameters...
+    maxWorkers = 4
+    batchSize = 20
+    maxAttempts = 3
+    retryDelay = 1.0
+    threadData = threading.local()
+
     def __init__(self, *args, **kwargs):
         """Initialize a widget"""
         
@@ -82,6 +102,7 @@ class Transletto(OWTextableBaseWidget):
             widget=self.controlArea,
             master=self,
             callback=self.sendData,
+            cancelCallback=self.cancel_manually,
             infoBoxAttribute='infoBox',
         )
 
@@ -111,7 +132,8 @@ class Transletto(OWTextableBaseWidget):
             orientation='horizontal',
         )
 
-        #Générer les listes des Traducteurs et Languages à être affichés au départ
+        #Indexer les Traducteurs et Languages et générer les listes à être affichés au départ
+        self.indexLanguages()
         self.GenerateTranslatorLanguageList()
         
         self.inputLanguage = gui.comboBox(
@@ -202,12 +224,10 @@ class Transletto(OWTextableBaseWidget):
         gui.rubber(self.controlArea)
 
         # API key input field
-        self.translator_need_API = list()
-        for translator in self.available_languages_dict.keys():
-            if self.available_languages_dict[translator]["api"]:
-                self.translator_need_API.append(translator)
-        print("self.translator_need_api:")
-        print(self.translator_need_API)
+        self.translator_need_API = [
+            translator for translator in self.available_languages_dict
+            if self.available_languages_dict[translator]["api"]
+        ]
 
         """ optionsBoxAPI = gui.widgetBox(
             widget=self.controlArea,
@@ -232,6 +252,23 @@ class Transletto(OWTextableBaseWidget):
         )
         self.apiKeyEdit.setDisabled(True)
 
+        # GUI elements for output format
+        gui.separator(widget=optionsBoxTranslator, height=3)
+        gui.checkBox(
+            widget=optionsBoxTranslator,
+            master=self,
+            value='preserveSegments',
+            label=u'Preserve segments and annotations',
+            callback=self.sendButton.settingsChanged,
+            tooltip=(
+                u"Output a single string containing each distinct\n"
+                u"translation once, with one segment per input\n"
+                u"segment carrying its original annotations.\n\n"
+                u"Otherwise, each translated segment is output\n"
+                u"as a separate string without annotations."
+            ),
+        )
+
         # Space and send button
         gui.rubber(self.controlArea)
         self.sendButton.draw()
@@ -256,7 +293,6 @@ class Transletto(OWTextableBaseWidget):
 
     def translatorChanged(self):
         """Method for change in translator"""
-        print(self.translator)
         self.update(boxUpdated="translator")
         self.sendButton.settingsChanged()
         if self.translator in self.translator_need_API:
@@ -270,13 +306,10 @@ class Transletto(OWTextableBaseWidget):
         self.inputSegmentation = newInput
         self.infoBox.inputChanged()
         self.sendButton.sendIf()
-        print("input data ok")
        
 
     def sendData(self):
         """Compute result of widget processing and send to output"""
-        print("this is input segmentation :")
-        print(self.inputSegmentation)
         if not self.inputSegmentation:
             self.infoBox.setText(
                 "Widget needs input.",
@@ -288,58 +321,265 @@ class Transletto(OWTextableBaseWidget):
         # Clear created Inputs.
         self.clearCreatedInputs()
 
-        # Initialize progress bar.
-        self.controlArea.setDisabled(True)
-        progressBar = ProgressBar(
-            self,
-            iterations=len(self.inputSegmentation)
-        )
+        self.infoBox.setText("Step 1/2: Translating...", "warning")
+        self.progressBarInit()
+
+        # Translate in a worker thread...
+        self.threading(partial(self.processData))
+
+    def processData(self):
+        """Translate input segments (run in a worker thread)"""
+        self.signal_prog.emit(1, False)
 
-        # Make translation, print error if translation not available
+        texts = [segment.get_content() for segment in self.inputSegmentation]
         try:
-            for segment in self.inputSegmentation:
-                self.createdInputs.append(Input(self.translate(segment.get_content()), self.captionTitle))
-                progressBar.advance()   # 1 tick on the progress bar...
-       
-                
-            # If there's only one input, the widget's output is the created Input...
-            if len(self.createdInputs) == 1:
-                self.outputSegmentation = self.createdInputs[0]
+            translations = self.translateAll(texts)
+        except Exception as error:
+            return {"error": "Translation failed (%s). Please try changing "
+                             "the translation service or languages."
+                             % (str(error) or type(error).__name__)}
+
+        # Operation cancelled by user...
+        if translations is None:
+            return None
+
+        missing = len([text for text in texts if text not in translations])
+        if missing:
+            message = "Translation failed for %i segment@p (translated " \
+                "segments have been saved and won't be translated again)."
+            return {"error": pluralize(message % missing, missing)}
+
+        self.signal_text.emit("Step 2/2: Post-processing...", "warning")
+        self.signal_prog.emit(1, True)
+
+        if self.preserveSegments:
+            return self.buildSegmentation(texts, translations)
+
+        for text in texts:
+            self.createdInputs.append(
+                Input(translations[text], self.captionTitle)
+            )
 
-            # Otherwise the widget's output is a concatenation...
-            else:
-                self.outputSegmentation = Segmenter.concatenate(
-                    self.createdInputs,
-                    self.captionTitle,
-                    import_labels_as=None,
-                )
-     
-
-            # Set status to OK and report data size...
-            message = "%i segment@p sent to output " % len(self.outputSegmentation)
-            message = pluralize(message, len(self.outputSegmentation))
-            numChars = 0
-            for segment in self.outputSegmentation:
-                segmentLength = len(Segmentation.get_data(segment.str_index))
-                numChars += segmentLength
-            message += "(%i character@p)." % numChars
-            message = pluralize(message, numChars)
-            self.infoBox.setText(message)
-            progressBar.finish()
-
-            self.controlArea.setDisabled(False)
-
-            # Send token...
-            self.send("Translated data", self.outputSegmentation)
-            self.sendButton.resetSettingsChangedFlag()
-
-        except:
+        # If there's only one input, the widget's output is the created Input...
+        if len(self.createdInputs) == 1:
+            return self.createdInputs[0]
+
+        # Otherwise the widget's output is a concatenation...
+        return Segmenter.concatenate(
+            caller=self,
+            segmentations=self.createdInputs,
+            label=self.captionTitle,
+            import_labels_as=None,
+        )
+
+    @OWTextableBaseWidget.task_decorator
+    def task_finished(self, f):
+        """Send the translated segmentation built by self.processData"""
+        processed_data = f.result()
+
+        if processed_data is None:
+            return
+
+        if isinstance(processed_data, dict):
             #Print error if widget fails to translate
-            self.infoBox.setText(
-                'Translation failed. Please try changing the translation service or languages.',
-                'error'
+            self.infoBox.setText(processed_data["error"], 'error')
+            self.send("Translated data", None)
+            return
+
+        self.outputSegmentation = processed_data
+
+        # Set status to OK and report data size...
+        message = "%i segment@p sent to output " % len(self.outputSegmentation)
+        message = pluralize(message, len(self.outputSegmentation))
+        numChars = 0
+        for segment in self.outputSegmentation:
+            numChars += len(segment.get_content())
+        message += "(%i character@p)." % numChars
+        message = pluralize(message, numChars)
+        self.infoBox.setText(message)
+
+        # Send token...
+        self.send("Translated data", self.outputSegmentation)
+        self.sendButton.resetSettingsChangedFlag()
+
+    def buildSegmentation(self, texts, translations):
+        """Build a segmentation of a single Input where the translation of
+        each input segment is stored in turn (so that segments are sorted and
+        don't overlap, even if texts are repeated) with its original
+        annotations"""
+        contents = [translations[text] for text in texts]
+        myInput = Input("".join(contents), self.captionTitle)
+        self.createdInputs.append(myInput)
+        str_index = myInput[0].str_index
+        segments = list()
+        start = 0
+        for content, segment in zip(contents, self.inputSegmentation):
+            segments.append(
+                Segment(
+                    str_index=str_index,
+                    start=start,
+                    end=start + len(content),
+                    annotations=segment.annotations.copy(),
+                )
             )
-            self.controlArea.setDisabled(False)
+            start += len(content)
+        return Segmentation(segments, label=self.captionTitle)
+
+    def translateAll(self, texts):
+        """Translate a list of texts and return a dict mapping each text
+        to its translation (texts that couldn't be translated are missing).
+
+        Translations are first looked up in the translation memory, so that
+        each distinct text is sent to the translation service only once,
+        ever. The remaining texts are split into batches that are translated
+        concurrently by a bounded pool of worker threads. Returns None if
+        the operation was cancelled.
+        """
+        languages = self.available_languages_dict[self.translator]["lang"]
+        source = languages[self.inputLanguageKey]
+        target = languages[self.outputLanguageKey]
+
+        # Look up distinct texts in translation memory...
+        memory = self.openMemory()
+        translations = dict()
+        missing = list()
+        for text in dict.fromkeys(texts):
+            if not text.strip():
+                translations[text] = text
+                continue
+            row = memory.execute(
+                "SELECT translation FROM memory WHERE translator = ? "
+                "AND source = ? AND target = ? AND hash = ?",
+                (self.translator, source, target, self.hashText(text)),
+            ).fetchone()
+            if row:
+                translations[text] = row[0]
+            else:
+                missing.append(text)
+
+        # Translate the others concurrently and save them in memory...
+        batches = [
+            missing[first:first + self.batchSize]
+            for first in range(0, len(missing), self.batchSize)
+        ]
+        executor = ThreadPoolExecutor(max_workers=self.maxWorkers)
+        try:
+            futures = {
+                executor.submit(self.translateBatch, batch, source, target):
+                    batch
+                for batch in batches
+            }
+            cur_itr = 1
+            for future in as_completed(futures):
+                for text, translation in zip(futures[future], future.result()):
+                    if translation is None:
+                        continue
+                    translations[text] = translation
+                    memory.execute(
+                        "INSERT OR REPLACE INTO memory VALUES (?,?,?,?,?)",
+                        (
+                            self.translator,
+                            source,
+                            target,
+                            self.hashText(text),
+                            translation,
+                        ),
+                    )
+                memory.commit()
+                self.signal_prog.emit(int(100*cur_itr/len(batches)), False)
+                cur_itr += 1
+                if self.cancel_operation:
+                    return None
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            memory.close()
+        return translations
+
+    def translateBatch(self, batch, source, target):
+        """Translate a batch of texts with this worker thread's translator
+        and return the list of their translations (None for texts that
+        couldn't be translated).
+
+        Transient errors (see self.isTransient) are retried with
+        exponential backoff; any other error is raised at once, which
+        makes the whole operation fail with that error's message.
+        """
+        translator = self.threadTranslator(source, target)
+        translations = list()
+        for text in batch:
+            translation = None
+            for attempt in range(self.maxAttempts):
+                if self.cancel_operation:
+                    break
+                try:
+                    translation = translator.translate(text)
+                    break
+                except Exception as error:
+                    if not self.isTransient(error):
+                        raise
+                    if attempt < self.maxAttempts - 1:
+                        time.sleep(self.retryDelay * 2 ** attempt)
+            translations.append(translation)
+        return translations
+
+    @staticmethod
+    def isTransient(error):
+        """Tell whether a translation error is worth retrying, i.e. a
+        network failure, a timeout, rate limiting or a server error"""
+        if isinstance(
+            error,
+            (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+                dt_exceptions.TooManyRequests,
+                # Raised by scraping translators for any failed request...
+                dt_exceptions.RequestError,
+            ),
+        ):
+            return True
+        if isinstance(error, dt_exceptions.ServerException):
+            return str(error) in (
+                dt_exceptions.ServerException.errors[code]
+                for code in (429, 500, 503)
+            )
+        if isinstance(error, requests.exceptions.HTTPError):
+            status = getattr(error.response, "status_code", None)
+            return status == 429 or (status or 0) >= 500
+        return False
+
+    def threadTranslator(self, source, target):
+        """Return the translator client of the current worker thread for the
+        current settings, created only once"""
+        key = (self.translator, source, target, self.labelKey)
+        clients = self.threadData.__dict__.setdefault("clients", dict())
+        if key not in clients:
+            clients[key] = self.makeTranslator(source, target)
+        return clients[key]
+
+    def openMemory(self):
+        """Open (and create if needed) the translation memory"""
+        path = os.path.dirname(
+            os.path.abspath(inspect.getfile(inspect.currentframe()))
+        )
+        memory = sqlite3.connect(
+            os.path.join(path, self.__class__.memoryFilename)
+        )
+        memory.execute(
+            """CREATE TABLE IF NOT EXISTS memory (
+                translator TEXT,
+                source TEXT,
+                target TEXT,
+                hash TEXT,
+                translation TEXT,
+                PRIMARY KEY (translator, source, target, hash)
+            )"""
+        )
+        return memory
+
+    @staticmethod
+    def hashText(text):
+        """Return the key of a source text in translation memory"""
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
 
     def clearCreatedInputs(self):
         """Delete all Input objects that have been created"""
@@ -353,6 +593,7 @@ class Transletto(OWTextableBaseWidget):
             changed = title != self.captionTitle
             super().setCaption(title)
             if changed:
+                self.cancel() # Cancel current operation
                 self.sendButton.settingsChanged()
         else:
             super().setCaption(title)
@@ -360,98 +601,96 @@ class Transletto(OWTextableBaseWidget):
     def onDeleteWidget(self):
         self.clearCreatedInputs()
 
+    def indexLanguages(self):
+        """Build the language/translator indices used by the interface"""
+        self.translatorLanguages = dict()
+        self.languageTranslators = dict()
+        self.codeLanguages = dict()
+        # Google Translate codes take precedence for language detection...
+        translators = sorted(
+            self.available_languages_dict,
+            key=lambda translator: translator != "GoogleTranslator",
+        )
+        for translator in translators:
+            languages = self.available_languages_dict[translator]["lang"]
+            self.translatorLanguages[translator] = sorted(languages)
+            for lang, code in languages.items():
+                self.languageTranslators.setdefault(lang, list()).append(
+                    translator
+                )
+                self.codeLanguages.setdefault(code.lower(), lang)
+        self.allLanguages = sorted(self.languageTranslators)
+        self.allTranslators = list(self.available_languages_dict)
+
     def GenerateTranslatorLanguageList(self):
         """Generate lists of available translators and languages"""
-        self.available_languages = list()
-        self.available_translators = list()
-        for translator in self.available_languages_dict.keys():
-            self.available_translators.append(translator)
-            for lang in self.available_languages_dict[translator]["lang"].keys():
-                self.available_languages.append(lang)
-        self.available_languages = list(set(self.available_languages))
-        self.available_languages.sort()
-
+        self.available_languages = list(self.allLanguages)
+        self.available_translators = list(self.allTranslators)
+
+    def refillComboBox(self, comboBox, items, value, previous):
+        """Replace the items of a combo box (only if they have changed)
+        and restore its previous value if still available"""
+        currentItems = [comboBox.itemText(i) for i in range(comboBox.count())]
+        if currentItems != items:
+            comboBox.clear()
+            comboBox.addItems(items)
+        if previous in items:
+            setattr(self, value, previous)
 
     def resetAll(self):
         """Reset widget settings"""
-        self.inputLanguage.clear()
-        self.chooseTranslator.clear()
-        self.outputLanguageBox.clear()
-
         #Get all translators and available languages:
-        self.available_languages = list()
-        self.available_translators = list()
-        for translator in self.available_languages_dict.keys():
-            self.available_translators.append(translator)
-            for lang in self.available_languages_dict[translator]["lang"].keys():
-                self.available_languages.append(lang)
-        self.available_languages = list(set(self.available_languages))
-        self.available_languages.sort()
-
-        for translator in self.available_translators:
-            self.chooseTranslator.addItem(translator)
-        
-        for lang in self.available_languages:
-            self.inputLanguage.addItem(lang)
-            self.outputLanguageBox.addItem(lang)  
+        self.GenerateTranslatorLanguageList()
+
+        self.refillComboBox(
+            self.chooseTranslator, self.available_translators,
+            "translator", self.translator,
+        )
+        self.refillComboBox(
+            self.inputLanguage, self.available_languages,
+            "inputLanguageKey", None,
+        )
+        self.refillComboBox(
+            self.outputLanguageBox, self.available_languages,
+            "outputLanguageKey", None,
+        )
 
         self.inputLanguageKey = self.defaultLanguage
         self.outputLanguageKey = self.defaultLanguage   
 
     def update(self, boxUpdated):
         """Update values when a box is changed"""
-        if boxUpdated != "input":
-            previousInput = self.inputLanguageKey
-            self.inputLanguage.clear()
-        if boxUpdated != "translator":
-            previousTranslator = self.translator
-            self.chooseTranslator.clear()
-        if boxUpdated != "output":
-            previousOutput = self.outputLanguageKey
-            self.outputLanguageBox.clear()
-
-
         #Get all translators:
-        if boxUpdated != "translator":
-            self.available_translators = list()
-            for translator in self.available_languages_dict.keys():
-                for lang in self.available_languages_dict[translator]["lang"].keys():
-                    if boxUpdated == "input":
-                        if self.inputLanguageKey == lang:
-                            self.available_translators.append(translator)
-                    elif boxUpdated == "output":
-                        if self.outputLanguageKey == lang:
-                            self.available_translators.append(translator)
-            self.available_translators = list(set(self.available_translators))
+        if boxUpdated == "input":
+            self.available_translators = self.languageTranslators.get(
+                self.inputLanguageKey, list()
+            )
+        elif boxUpdated == "output":
+            self.available_translators = self.languageTranslators.get(
+                self.outputLanguageKey, list()
+            )
 
         #Get all input languages
-        #if boxUpdated != "input":
-        self.available_languages = list()
-        for translator in self.available_languages_dict.keys():
-            if translator == self.translator:
-                for lang in self.available_languages_dict[translator]["lang"].keys():
-                    self.available_languages.append(lang)
-        self.available_languages = list(set(self.available_languages))
-        self.available_languages.sort()
-        
-        
+        self.available_languages = self.translatorLanguages.get(
+            self.translator, list()
+        )
+
         if boxUpdated != "input":
-            for lang in self.available_languages:
-                self.inputLanguage.addItem(lang)
-            if previousInput in self.available_languages:
-                self.inputLanguageKey = previousInput
+            self.refillComboBox(
+                self.inputLanguage, self.available_languages,
+                "inputLanguageKey", self.inputLanguageKey,
+            )
         if boxUpdated != "translator":
-            for translator in self.available_translators:
-                self.chooseTranslator.addItem(translator)
-            if previousTranslator in self.available_translators:
-                self.translator = previousTranslator
+            self.refillComboBox(
+                self.chooseTranslator, self.available_translators,
+                "translator", self.translator,
+            )
         if boxUpdated != "output":
-            for lang in self.available_languages:
-                self.outputLanguageBox.addItem(lang)
-            if previousOutput in self.available_languages:
-                self.outputLanguageKey = previousOutput
-        
-        
+            self.refillComboBox(
+                self.outputLanguageBox, self.available_languages,
+                "outputLanguageKey", self.outputLanguageKey,
+            )
+
         self.sendButton.settingsChanged()
 
 
@@ -460,14 +699,13 @@ class Transletto(OWTextableBaseWidget):
         #detect the language
         text = self.inputSegmentation[0].get_content()
         lang_detect_language = detect(text)
-        for key, value in self.available_languages_dict["GoogleTranslator"]["lang"].items():
-            if lang_detect_language == value:
-                self.detectedInputLanguage = key
-                print(f"lang_detect: {lang_detect_language}")
-                self.inputLanguageKey = self.detectedInputLanguage
-                self.inputLanguageChanged()
-                self.sendButton.settingsChanged()
-                return
+        language = self.codeLanguages.get(lang_detect_language.lower())
+        if language is not None:
+            self.detectedInputLanguage = language
+            self.inputLanguageKey = self.detectedInputLanguage
+            self.inputLanguageChanged()
+            self.sendButton.settingsChanged()
+            return
         self.infoBox.setText(
                 "Language not recognized",
                 "warning"
@@ -478,27 +716,29 @@ class Transletto(OWTextableBaseWidget):
         """Translate a text from one language to another"""
 
         dict = self.available_languages_dict[self.translator]["lang"]
-        print(dict[self.inputLanguageKey])
+        return self.makeTranslator(
+            dict[self.inputLanguageKey], dict[self.outputLanguageKey]
+        ).translate(untranslated_text)
 
+    def makeTranslator(self, source, target):
+        """Create a translator client for the selected service"""
         if self.translator == "GoogleTranslator":
-            translated_text = dt.GoogleTranslator(source=dict[self.inputLanguageKey], target=dict[self.outputLanguageKey]).translate(untranslated_text)
+            return dt.GoogleTranslator(source=source, target=target)
         if self.translator == "MyMemory":
-            translated_text = dt.MyMemoryTranslator(source=dict[self.inputLanguageKey], target=dict[self.outputLanguageKey]).translate(untranslated_text)
+            return dt.MyMemoryTranslator(source=source, target=target)
         if self.translator == "DeepL":
-            translated_text = dt.DeeplTranslator(source=dict[self.inputLanguageKey], target=dict[self.outputLanguageKey], api_key=self.labelKey).translate(untranslated_text)
+            return dt.DeeplTranslator(source=source, target=target, api_key=self.labelKey)
         if self.translator == "Qcri":
-            translated_text = dt.QcriTranslator(source=dict[self.inputLanguageKey], target=dict[self.outputLanguageKey], api_key=self.labelKey).translate(untranslated_text)
+            return dt.QcriTranslator(source=source, target=target, api_key=self.labelKey)
         if self.translator == "Linguee":
-            translated_text = dt.LingueeTranslator(source=dict[self.inputLanguageKey], target=dict[self.outputLanguageKey]).translate(untranslated_text)
+            return dt.LingueeTranslator(source=source, target=target)
         if self.translator == "Pons":
-            translated_text = dt.PonsTranslator(source=dict[self.inputLanguageKey], target=dict[self.outputLanguageKey]).translate(untranslated_text)
-        return translated_text
+            return dt.PonsTranslator(source=source, target=target)
 
 
     
 # Widget Preview for testing
 if __name__ == '__main__':
-    from LTTL.Input import Input
     input1 = Input("Mary said hello to John and Mike.")
     input2 = Input("Lucy told Johnny to say hello in return.")
     input = Segmenter.concatenate([input1, input2])
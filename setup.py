@@ -95,8 +95,7 @@ INSTALL_REQUIRES = (
     'gensim',
     'lxa5crab',
     'bs4',
-    'fuzzywuzzy',
-    'python-Levenshtein',
+    'rapidfuzz',
     'requests',
     'praw',
     'spacy >= 3.0',
@@ -133,6 +132,9 @@ ENTRY_POINTS = {
     "orange.canvas.help": (
         'html-index = orangecontrib.textable_prototypes:WIDGET_HELP_PATH',
     ),
+    'console_scripts': (
+        'textable-poetica-refresh = orangecontrib.textable_prototypes.widgets.poetica_donnees:main',
+    ),
 }
 
 NAMESPACE_PACKAGES = ["orangecontrib"]